@@ -1,114 +1,84 @@
 # ================= IMPORTS =================
-from flask import Flask, render_template, redirect, url_for, request, flash, send_file
-from flask_sqlalchemy import SQLAlchemy
-from flask_login import LoginManager, login_user, logout_user, login_required, current_user, UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
-from generar_boletin import generar_boletin_pdf
-from datetime import datetime
+from flask import Flask, render_template, redirect, url_for, request, flash, send_file, current_app
+from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+from models import db, Usuario, Alumno, Nota, Grado, Materia, Asignacion, CicloEscolar, ciclo_activo, ids_de_grados
+from basedatos import configurar_bd
+from generar_boletin import generar_boletin_pdf, nombre_boletin
+from exportacion import copiar_alumno, construir_zip
+from trabajos import ColaTrabajos
+from inicializacion import comando_init_bd
+from ciclos import abrir_ciclo, archivar_ciclo, listar_ciclos, boletines_archivados, comando_ciclo
+from importacion import leer_filas, importar, IMPORTADORES, COLUMNAS
+from sesiones import cache_usuarios, UsuarioSesion
+from estadisticas import estadisticas_grado, grados_con_resumen, APROBACION
+from calculo import cargar_matriz
+from auditoria import registrar_auditoria, escritor_auditoria
+from notas import (
+    asignacion_permitida, notas_de_materia, registrar_notas_lote, guardar_notas, validar_entrada,
+    diferencias, aplicar_cambios, describir_cambios, BLOQUES, NOTAS_CONFLICTO
+)
+from idempotencia import reservar as reservar_solicitud, completar as completar_solicitud
+from versiones import versiones, ambito_alumnos, ambito_asignaciones
+from metricas import metricas, registrar_metricas, fase
+from credenciales import autenticar
+from cache_boletines import cache_boletines, clave_boletin
+from cache_fragmentos import crear_cache, fragmento, estadisticas_fragmentos
+from verificacion import (
+    registrar as registrar_boletines, verificar as verificar_codigo, normalizar as normalizar_codigo,
+    cache_verificaciones, VERIFICACION_MAX_AGE
+)
+from consultas import (
+    registrar_contador_consultas, grados_de, asignaciones_de_docente, alumnos_por_grado,
+    alumnos_con_notas, grados_registrados, grados_con_asignaciones, materias_ordenadas, pagina_alumnos, pagina_asignaciones,
+    pagina_auditoria
+)
 from flask import jsonify
-import zipfile
+from werkzeug.middleware.proxy_fix import ProxyFix
+import hashlib
+import hmac
+import json
+import uuid
+import io
 import os
 
-# ================= APP =================
-app = Flask(__name__)
-
-# 🔐 SECRET KEY DESDE VARIABLE DE ENTORNO
-app.config['SECRET_KEY'] = os.environ.get("SECRET_KEY")
-if not app.config['SECRET_KEY']:
-    raise RuntimeError("SECRET_KEY no definida en variables de entorno")
-
-# 🔧 ASEGURAR CARPETA INSTANCE (RENDER)
-os.makedirs(app.instance_path, exist_ok=True)
-
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(app.instance_path, 'database.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-db = SQLAlchemy(app)
-
-# ================= MODELOS =================
-class Usuario(UserMixin, db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    nombre = db.Column(db.String(100), nullable=False)
-    correo = db.Column(db.String(100), unique=True, nullable=False)
-    password = db.Column(db.String(200), nullable=False)
-    rol = db.Column(db.String(20), nullable=False)
-
-    def set_password(self, password):
-        self.password = generate_password_hash(password)
-
-    def check_password(self, password):
-        return check_password_hash(self.password, password)
-
-class Alumno(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    nombre = db.Column(db.String(100), unique=True, nullable=False)
-    grado = db.Column(db.String(50), nullable=False)
-
-class Nota(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    alumno_id = db.Column(db.Integer, db.ForeignKey('alumno.id'), nullable=False)
-    materia = db.Column(db.String(50), nullable=False)
-    bloque = db.Column(db.Integer, nullable=False)
-    puntaje = db.Column(db.Float, nullable=False)
-
-    alumno = db.relationship('Alumno')
+# ================= PROXY =================
+# Detrás de un proxy (Render) remote_addr es la IP del proxy y los
+# limitadores por IP bloquearían a todos a la vez: allí se configura
+# PROXY_SALTOS con la cantidad de proxies de confianza (1 en Render).
+# Por defecto 0: sin proxy delante, un cliente podría falsificar su IP con
+# X-Forwarded-For y saltarse los limitadores.
+PROXY_SALTOS = int(os.environ.get("PROXY_SALTOS", 0))
 
-    __table_args__ = (
-        db.UniqueConstraint('alumno_id', 'materia', 'bloque', name='uq_nota_unica'),
-    )
-
-class Materia(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    nombre = db.Column(db.String(50), nullable=False)
-    grado = db.Column(db.String(50), nullable=False)
-
-    __table_args__ = (
-        db.UniqueConstraint('nombre', 'grado', name='uq_materia_grado'),
-    )
-
-class Asignacion(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    docente_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
-    materia_id = db.Column(db.Integer, db.ForeignKey('materia.id'), nullable=False)
-    grado = db.Column(db.String(50), nullable=False)
-
-    docente = db.relationship('Usuario')
-    materia = db.relationship('Materia')
-
-    __table_args__ = (
-        db.UniqueConstraint('docente_id', 'materia_id', 'grado', name='uq_asignacion_docente'),
-    )
+def ip_cliente():
+    return request.remote_addr
 
+# ================= RUTAS =================
+# Las vistas se declaran a nivel de módulo y create_app las registra
+RUTAS = []
 
-class Auditoria(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
-    accion = db.Column(db.String(50), nullable=False)
-    descripcion = db.Column(db.String(200), nullable=False)
-    fecha = db.Column(db.DateTime, default=datetime.utcnow)
+def ruta(regla, **opciones):
+    def registrar(vista):
+        RUTAS.append((regla, vista, opciones))
+        return vista
+    return registrar
 
-    usuario = db.relationship('Usuario')
-
-# ================= AUDITORÍA =================
-def registrar_auditoria(accion, descripcion):
-    if current_user.is_authenticated:
-        db.session.add(Auditoria(
-            usuario_id=current_user.id,
-            accion=accion,
-            descripcion=descripcion
-        ))
-        db.session.commit()
+def cola_trabajos():
+    return current_app.extensions["cola_trabajos"]
 
 # ================= LOGIN =================
-login_manager = LoginManager(app)
+login_manager = LoginManager()
 login_manager.login_view = "login"
 
+def cargar_usuario(usuario_id):
+    usuario = db.session.get(Usuario, usuario_id)
+    return UsuarioSesion.desde(usuario) if usuario else None
+
 @login_manager.user_loader
 def load_user(user_id):
-    return Usuario.query.get(int(user_id))
+    return cache_usuarios.obtener(int(user_id), cargar_usuario)
 
 # ================= CAMBIAR CONTRASEÑA ADMIN =================
-@app.route("/admin/cambiar_password", methods=["GET", "POST"])
+@ruta("/admin/cambiar_password", methods=["GET", "POST"])
 @login_required
 def cambiar_password_admin():
     if current_user.rol != "admin":
@@ -119,8 +89,14 @@ def cambiar_password_admin():
         nueva = request.form["nueva"]
         confirmar = request.form["confirmar"]
 
-        if not current_user.check_password(actual):
-            flash("La contraseña actual es incorrecta", "error")
+        # current_user viene del cache de sesión: se carga el registro real
+        usuario = db.session.get(Usuario, current_user.id)
+
+        resultado, error = autenticar(usuario, usuario.correo, actual, ip_cliente())
+        if resultado == "fallo":
+            error = "La contraseña actual es incorrecta"
+        if error:
+            flash(error, "error")
             return redirect(url_for("cambiar_password_admin"))
 
         if len(nueva) < 10:
@@ -131,37 +107,71 @@ def cambiar_password_admin():
             flash("Las contraseñas no coinciden", "error")
             return redirect(url_for("cambiar_password_admin"))
 
-        current_user.set_password(nueva)
+        usuario.set_password(nueva)
+        registrar_auditoria("CAMBIO_PASSWORD", current_user.correo, en_transaccion=True)
         db.session.commit()
 
-        registrar_auditoria("CAMBIO_PASSWORD", current_user.correo)
         flash("Contraseña actualizada correctamente", "success")
         return redirect(url_for("admin"))
 
     return render_template("cambiar_password.html")
 
 # ================= RUTAS =================
-@app.route("/", methods=["GET", "POST"])
+@ruta("/", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
-        user = Usuario.query.filter_by(correo=request.form["correo"]).first()
-        if user and user.check_password(request.form["password"]):
+        correo = request.form["correo"]
+        user = Usuario.query.filter_by(correo=correo).first()
+        with fase("login", "verificar"):
+            resultado, error = autenticar(user, correo, request.form["password"], ip_cliente())
+        metricas.incrementar("login_total", resultado=resultado)
+
+        if resultado == "ok":
+            # Guarda el hash rehecho si cambió PASSWORD_METODO
+            db.session.commit()
             login_user(user)
             registrar_auditoria("LOGIN", user.correo)
             return redirect(url_for("admin" if user.rol == "admin" else "docente"))
-        flash("Credenciales incorrectas", "error")
+
+        flash(error, "error")
+        if resultado == "bloqueado":
+            return render_template("login.html"), 429, {"Retry-After": "60"}
+        if resultado == "ocupado":
+            return render_template("login.html"), 503, {"Retry-After": "5"}
     return render_template("login.html")
 
-@app.route("/admin")
+@ruta("/admin")
 @login_required
 def admin():
     if current_user.rol != "admin":
         return redirect(url_for("login"))
-    alumnos = Alumno.query.order_by(Alumno.grado, Alumno.nombre).all()
-    grados = sorted(set(a.grado for a in alumnos))
-    return render_template("admin.html", alumnos=alumnos, grados=grados)
+    grado = request.args.get("grado", type=int)
+    busqueda = request.args.get("q", "").strip()
+    ciclo = request.args.get("ciclo", type=int) or ciclo_activo()
+    despues = request.args.get("despues")
+    grados = grados_registrados(ciclo)
+    ciclos = CicloEscolar.query.filter(CicloEscolar.estado != "archivado")\
+        .order_by(CicloEscolar.anio.desc()).all()
+
+    def cargar():
+        alumnos, siguiente = pagina_alumnos(grado, busqueda, despues, ciclo)
+        return {"alumnos": alumnos, "siguiente": siguiente}
+
+    tabla_alumnos = fragmento("tabla_alumnos", ["alumno"], {
+        "grado": grado, "busqueda": busqueda, "despues": despues, "ciclo": ciclo, "activo": ciclo_activo()
+    }, cargar)
+    return render_template(
+        "admin.html",
+        tabla_alumnos=tabla_alumnos,
+        grados=grados,
+        grado=grado,
+        busqueda=busqueda,
+        ciclo=ciclo,
+        ciclos=ciclos,
+        activo=ciclo_activo()
+    )
 
-@app.route("/admin/crear_docente", methods=["GET", "POST"])
+@ruta("/admin/crear_docente", methods=["GET", "POST"])
 @login_required
 def crear_docente():
     if current_user.rol != "admin":
@@ -175,191 +185,335 @@ def crear_docente():
             )
             docente.set_password(request.form["password"])
             db.session.add(docente)
+            registrar_auditoria("CREAR_DOCENTE", docente.correo, en_transaccion=True)
             db.session.commit()
-            registrar_auditoria("CREAR_DOCENTE", docente.correo)
             flash("Docente creado", "success")
     return render_template("crear_docente.html")
 
-@app.route("/admin/materias", methods=["GET", "POST"])
+@ruta("/admin/materias", methods=["GET", "POST"])
 @login_required
 def admin_materias():
     if current_user.rol != "admin":
         return redirect(url_for("login"))
 
-    materias = Materia.query.order_by(Materia.grado, Materia.nombre).all()
-
     if request.method == "POST":
         nombre = request.form["nombre"]
         grado = request.form["grado"]
+        grado_id = ids_de_grados(db.session.connection(), [grado])[grado]
 
-        if not Materia.query.filter_by(nombre=nombre, grado=grado).first():
-            db.session.add(Materia(nombre=nombre, grado=grado))
+        if not Materia.query.filter_by(nombre=nombre, grado_id=grado_id).first():
+            db.session.add(Materia(nombre=nombre, grado_id=grado_id))
+            registrar_auditoria("CREAR_MATERIA", f"{nombre} - {grado}", en_transaccion=True)
             db.session.commit()
-            registrar_auditoria("CREAR_MATERIA", f"{nombre} - {grado}")
             flash("Materia creada correctamente", "success")
         else:
             flash("La materia ya existe para ese grado", "error")
 
-    return render_template("admin_materias.html", materias=materias)
+    lista_materias = fragmento("lista_materias", ["materia"], {}, lambda: {"materias": materias_ordenadas()})
+    return render_template("admin_materias.html", lista_materias=lista_materias)
 
-@app.route("/docente", methods=["GET", "POST"])
+@ruta("/docente", methods=["GET", "POST"])
 @login_required
 def docente():
     if current_user.rol != "docente":
         return redirect(url_for("login"))
 
     # ================= ASIGNACIONES =================
-    asignaciones = Asignacion.query.filter_by(
-        docente_id=current_user.id
-    ).all()
-
-    grados = sorted(set(a.grado for a in asignaciones))
-    materias_por_grado = {}
-    alumnos_por_grado = {}
-
-    for a in asignaciones:
-        # Materias por grado
-        materias_por_grado.setdefault(a.grado, []).append(a.materia)
-
-        # Alumnos por grado (AUTOMÁTICO)
-        alumnos = Alumno.query.filter_by(
-            grado=a.grado
-        ).order_by(Alumno.nombre).all()
-
-        alumnos_por_grado[a.grado] = alumnos
+    # Solo los grados van en la página; materias y alumnos llegan por AJAX
+    def formulario():
+        grados_docente = fragmento(
+            "grados_docente", ["asignacion"], {"docente_id": current_user.id, "ciclo": ciclo_activo()},
+            lambda: {"grados": grados_de(asignaciones_de_docente(current_user.id))}
+        )
+        return render_template("docente.html", grados_docente=grados_docente, clave=uuid.uuid4().hex)
 
     # ================= POST =================
     if request.method == "POST":
 
-        grado = request.form.get("grado")
-        materia_id = request.form.get("materia_id")
+        grado = request.form.get("grado", type=int)
+        materia_id = request.form.get("materia_id", type=int)
+        alumno_id = request.form.get("alumno_id")
         nombre = request.form.get("nombre")
         bloque = request.form.get("bloque")
         puntaje = request.form.get("puntaje")
 
         # 🔹 Si solo se seleccionó grado → recargar formulario
-        if not (grado and materia_id and nombre and bloque and puntaje):
-            return render_template(
-                "docente.html",
-                grados=grados,
-                materias_por_grado=materias_por_grado,
-                alumnos_por_grado=alumnos_por_grado
-            )
+        if not (grado and materia_id and (alumno_id or nombre) and bloque and puntaje):
+            return formulario()
 
         # ================= VALIDACIONES =================
-        alumno = Alumno.query.filter_by(
-            nombre=nombre,
-            grado=grado
-        ).first()
+        # Por ID (formulario actual) o por nombre (clientes anteriores)
+        ciclo = ciclo_activo()
+        if alumno_id:
+            alumno = Alumno.query.filter_by(ciclo=ciclo, id=alumno_id, grado_id=grado).first()
+        else:
+            alumno = Alumno.query.filter_by(ciclo=ciclo, nombre=nombre, grado_id=grado).first()
 
         if not alumno:
             flash("Alumno no encontrado en ese grado", "error")
             return redirect(url_for("docente"))
 
         permitido = Asignacion.query.filter_by(
+            ciclo=ciclo,
             docente_id=current_user.id,
             materia_id=materia_id,
-            grado=grado
+            grado_id=grado
         ).first()
 
         if not permitido:
             flash("No autorizado", "error")
             return redirect(url_for("docente"))
 
-        if Nota.query.filter_by(
-            alumno_id=alumno.id,
-            materia=permitido.materia.nombre,
-            bloque=int(bloque)
-        ).first():
-            flash("Nota duplicada", "error")
+        # Mismas reglas que el lote: bloque en BLOQUES y puntaje de 0 a 100
+        datos, error = validar_entrada({"alumno_id": alumno.id, "bloque": bloque, "puntaje": puntaje})
+        if error:
+            flash(error, "error")
             return redirect(url_for("docente"))
+        _, bloque, puntaje = datos
+
+        # ================= IDEMPOTENCIA (DOBLE CLIC / REINTENTO) =================
+        clave = request.form.get("clave")
+        if clave:
+            anterior = reservar_solicitud(clave, current_user.id)
+            if anterior is not None:
+                flash(f"Envío repetido ignorado: {anterior}", "success")
+                return redirect(url_for("docente"))
+
+        # ================= GUARDAR (INSERT ... ON CONFLICT) =================
+        escritas = guardar_notas([{
+            "alumno_id": alumno.id,
+            "materia_id": permitido.materia_id,
+            "bloque": bloque,
+            "puntaje": puntaje
+        }])
+
+        if escritas:
+            mensaje, categoria = "Nota registrada correctamente", "success"
+            registrar_auditoria("CREAR_NOTA", f"{alumno.nombre} ({NOTAS_CONFLICTO})", en_transaccion=True)
+        elif NOTAS_CONFLICTO == "maximo":
+            mensaje, categoria = "Se conservó la nota más alta ya registrada", "success"
+        else:
+            mensaje, categoria = "Nota duplicada", "error"
 
-        # ================= GUARDAR =================
-        db.session.add(Nota(
-            alumno_id=alumno.id,
-            materia=permitido.materia.nombre,
-            bloque=int(bloque),
-            puntaje=float(puntaje)
-        ))
+        if clave:
+            completar_solicitud(clave, mensaje)
         db.session.commit()
 
-        registrar_auditoria("CREAR_NOTA", alumno.nombre)
-        flash("Nota registrada correctamente", "success")
-
+        flash(mensaje, categoria)
         return redirect(url_for("docente"))
 
     # ================= GET =================
-    return render_template(
-        "docente.html",
-        grados=grados,
-        materias_por_grado=materias_por_grado,
-        alumnos_por_grado=alumnos_por_grado
-    )
+    return formulario()
 
-@app.route("/ajax/alumnos_materias")
+@ruta("/ajax/alumnos_materias")
 @login_required
 def ajax_alumnos_materias():
     if current_user.rol != "docente":
         return jsonify({"error": "No autorizado"}), 403
 
-    grado = request.args.get("grado")
+    # Todos los grados del docente en una respuesta; el navegador cambia
+    # de grado sin volver a pedir nada
+    asignaciones = asignaciones_de_docente(current_user.id)
+    grados = sorted(set(a.grado_id for a in asignaciones))
+
+    # ================= VALIDACIÓN CONDICIONAL (ETag / Last-Modified) =================
+    # El ciclo va en la firma: al abrir uno nuevo cambia todo el contenido
+    ambitos = [ambito_asignaciones(current_user.id)] + [ambito_alumnos(g) for g in grados]
+    actuales = versiones(ambitos)
+    firma = f"ciclo={ciclo_activo()}|" + "|".join(f"{a}={actuales.get(a, (0, None))[0]}" for a in ambitos)
+
+    respuesta = current_app.response_class(mimetype="application/json")
+    respuesta.set_etag(hashlib.sha1(f"{current_user.id}|{firma}".encode()).hexdigest())
+    fechas = [actualizado for _, actualizado in actuales.values()]
+    if fechas:
+        respuesta.last_modified = max(fechas)
+    respuesta.cache_control.private = True
+    respuesta.cache_control.no_cache = True
+
+    respuesta.make_conditional(request)
+    if respuesta.status_code == 304:
+        return respuesta
+
+    # ================= DATOS =================
+    # {grado_id: {"materias": [[id, nombre]], "alumnos": [[id, nombre]]}}
+    datos = {g: {"materias": [], "alumnos": []} for g in grados}
+    for a in asignaciones:
+        datos[a.grado_id]["materias"].append([a.materia.id, a.materia.nombre])
+    for grado, alumnos in alumnos_por_grado(grados).items():
+        datos[grado]["alumnos"] = [[a.id, a.nombre] for a in alumnos]
 
-    if not grado:
-        return jsonify({"materias": [], "alumnos": []})
+    respuesta.set_data(json.dumps({"grados": datos}, ensure_ascii=False, separators=(",", ":")))
+    return respuesta
 
-    # Materias asignadas al docente en ese grado
-    asignaciones = Asignacion.query.filter_by(
-        docente_id=current_user.id,
-        grado=grado
-    ).all()
 
-    materias = [
-        {"id": a.materia.id, "nombre": a.materia.nombre}
-        for a in asignaciones
-    ]
+# ================= REGISTRO DE NOTAS EN LOTE =================
+@ruta("/docente/lote", methods=["GET", "POST"])
+@login_required
+def docente_lote():
+    if current_user.rol != "docente":
+        return redirect(url_for("login"))
 
-    # Alumnos del grado
-    alumnos = Alumno.query.filter_by(grado=grado)\
-        .order_by(Alumno.nombre).all()
+    asignaciones = asignaciones_de_docente(current_user.id)
+    materia_id = request.values.get("materia_id", type=int)
+    asignacion = next((a for a in asignaciones if a.materia_id == materia_id), None)
 
-    return jsonify({
-        "materias": materias,
-        "alumnos": [{"nombre": a.nombre} for a in alumnos]
-    })
+    if materia_id and not asignacion:
+        flash("No autorizado", "error")
+        return redirect(url_for("docente_lote"))
+
+    alumnos = []
+    existentes = {}
+    if asignacion:
+        alumnos = Alumno.query.filter_by(ciclo=asignacion.ciclo, grado_id=asignacion.grado_id)\
+            .order_by(Alumno.nombre).all()
+
+    # ================= POST =================
+    if request.method == "POST" and asignacion:
+        clave = request.form.get("clave")
+        if clave:
+            anterior = reservar_solicitud(clave, current_user.id)
+            if anterior is not None:
+                previo = json.loads(anterior) if anterior else {"creadas": 0}
+                flash(f"Envío repetido ignorado: {previo['creadas']} notas registradas", "success")
+                return redirect(url_for("docente_lote", materia_id=materia_id))
+
+        entradas = []
+        for alumno in alumnos:
+            for bloque in BLOQUES:
+                puntaje = request.form.get(f"puntaje_{alumno.id}_{bloque}")
+                if puntaje:
+                    entradas.append({"alumno_id": alumno.id, "bloque": bloque, "puntaje": puntaje})
+
+        nombres = {a.id: a.nombre for a in alumnos}
+        creadas, errores = registrar_notas_lote(asignacion, entradas, current_user.id, clave=clave)
+
+        for e in errores:
+            flash(f"{nombres.get(e['alumno_id'], e['alumno_id'])}: {e['error']}", "error")
+        if creadas:
+            flash(f"{creadas} notas registradas correctamente", "success")
+
+        return redirect(url_for("docente_lote", materia_id=materia_id))
+
+    # ================= GET =================
+    if asignacion:
+        existentes = notas_de_materia(asignacion.grado_id, asignacion.materia_id)
+
+    return render_template(
+        "docente_lote.html",
+        asignaciones=asignaciones,
+        asignacion=asignacion,
+        alumnos=alumnos,
+        existentes=existentes,
+        bloques=BLOQUES,
+        clave=uuid.uuid4().hex
+    )
+
+@ruta("/api/notas/lote", methods=["POST"])
+@login_required
+def api_notas_lote():
+    if current_user.rol != "docente":
+        return jsonify({"error": "No autorizado"}), 403
+
+    datos = request.get_json(silent=True) or {}
+    entradas = datos.get("notas")
+    if not isinstance(entradas, list) or not all(isinstance(e, dict) for e in entradas):
+        return jsonify({"error": "Se esperaba una lista de notas"}), 400
+
+    try:
+        materia_id = int(datos.get("materia_id"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "materia_id inválido"}), 400
+
+    # La materia ya determina el grado; "grado" de clientes anteriores se ignora
+    asignacion = asignacion_permitida(current_user.id, materia_id)
+    if not asignacion:
+        return jsonify({"error": "No autorizado"}), 403
 
+    # Idempotency-Key opcional: un reintento devuelve la respuesta original
+    clave = request.headers.get("Idempotency-Key")
+    if clave:
+        anterior = reservar_solicitud(clave, current_user.id)
+        if anterior is not None:
+            respuesta = current_app.response_class(anterior or "{}", mimetype="application/json")
+            respuesta.headers["Idempotent-Replayed"] = "true"
+            return respuesta
 
+    creadas, errores = registrar_notas_lote(asignacion, entradas, current_user.id, clave=clave)
+    return jsonify({"creadas": creadas, "errores": errores})
 
-@app.route("/admin/alumnos", methods=["GET", "POST"])
+@ruta("/admin/alumnos", methods=["GET", "POST"])
 @login_required
 def admin_alumnos():
     if current_user.rol != "admin":
         return redirect(url_for("login"))
 
-    alumnos = Alumno.query.order_by(Alumno.grado, Alumno.nombre).all()
-
     if request.method == "POST":
         nombre = request.form["nombre"]
         grado = request.form["grado"]
 
-        if not Alumno.query.filter_by(nombre=nombre).first():
-            db.session.add(Alumno(nombre=nombre, grado=grado))
+        if not Alumno.query.filter_by(ciclo=ciclo_activo(), nombre=nombre).first():
+            grado_id = ids_de_grados(db.session.connection(), [grado])[grado]
+            db.session.add(Alumno(nombre=nombre, grado_id=grado_id))
+            registrar_auditoria("CREAR_ALUMNO", nombre, en_transaccion=True)
             db.session.commit()
-            registrar_auditoria("CREAR_ALUMNO", nombre)
             flash("Alumno registrado correctamente", "success")
         else:
             flash("El alumno ya existe", "error")
 
-    return render_template("admin_alumnos.html", alumnos=alumnos)
+    despues = request.args.get("despues")
+
+    def cargar():
+        alumnos, siguiente = pagina_alumnos(cursor=despues)
+        return {"alumnos": alumnos, "siguiente": siguiente}
+
+    lista_alumnos = fragmento("lista_alumnos", ["alumno"], {"despues": despues, "ciclo": ciclo_activo()}, cargar)
+    return render_template("admin_alumnos.html", lista_alumnos=lista_alumnos)
 
-@app.route("/admin/asignaciones", methods=["GET", "POST"])
+# ================= IMPORTACIÓN MASIVA =================
+@ruta("/admin/importar", methods=["GET", "POST"])
 @login_required
-def admin_asignaciones():
+def admin_importar():
     if current_user.rol != "admin":
         return redirect(url_for("login"))
 
-    docentes = Usuario.query.filter_by(rol="docente").all()
-    materias = Materia.query.order_by(Materia.grado, Materia.nombre).all()
-    asignaciones = Asignacion.query.all()
+    resultado = None
+
+    if request.method == "POST":
+        tipo = request.form.get("tipo")
+        archivo = request.files.get("archivo")
+
+        if tipo not in IMPORTADORES or not archivo or not archivo.filename:
+            flash("Seleccione el tipo de datos y un archivo", "error")
+            return redirect(url_for("admin_importar"))
+
+        try:
+            creadas, errores, total_errores = importar(tipo, leer_filas(archivo))
+        except (ValueError, UnicodeDecodeError) as e:
+            db.session.rollback()
+            flash(f"No se pudo leer el archivo: {e}", "error")
+            return redirect(url_for("admin_importar"))
+
+        registrar_auditoria(
+            "IMPORTAR_" + tipo.upper(),
+            f"{archivo.filename}: {creadas} filas, {total_errores} errores",
+            en_transaccion=True
+        )
+        db.session.commit()
+
+        resultado = {
+            "tipo": tipo,
+            "creadas": creadas,
+            "errores": errores,
+            "total_errores": total_errores
+        }
+
+    return render_template("admin_importar.html", columnas=COLUMNAS, resultado=resultado)
+
+@ruta("/admin/asignaciones", methods=["GET", "POST"])
+@login_required
+def admin_asignaciones():
+    if current_user.rol != "admin":
+        return redirect(url_for("login"))
 
     if request.method == "POST":
         docente_id = request.form["docente_id"]
@@ -367,35 +521,139 @@ def admin_asignaciones():
 
         # ✅ TOMAR EL GRADO DESDE LA MATERIA
         materia = Materia.query.get(materia_id)
-        grado = materia.grado
+        grado_id = materia.grado_id
 
         existe = Asignacion.query.filter_by(
+            ciclo=ciclo_activo(),
             docente_id=docente_id,
             materia_id=materia_id,
-            grado=grado
+            grado_id=grado_id
         ).first()
 
         if not existe:
             db.session.add(Asignacion(
                 docente_id=docente_id,
                 materia_id=materia_id,
-                grado=grado
+                grado_id=grado_id
             ))
+            registrar_auditoria("ASIGNAR_MATERIA", f"Docente {docente_id}", en_transaccion=True)
             db.session.commit()
-            registrar_auditoria("ASIGNAR_MATERIA", f"Docente {docente_id}")
             flash("Asignación creada", "success")
         else:
             flash("Asignación duplicada", "error")
 
+    grado = request.args.get("grado", type=int)
+    busqueda = request.args.get("q", "").strip()
+    despues = request.args.get("despues")
+
+    def cargar_opciones():
+        return {
+            "docentes": Usuario.query.filter_by(rol="docente").all(),
+            "materias": materias_ordenadas()
+        }
+
+    def cargar_lista():
+        asignaciones, siguiente = pagina_asignaciones(grado, busqueda, despues)
+        return {"asignaciones": asignaciones, "siguiente": siguiente}
+
+    opciones_asignacion = fragmento("opciones_asignacion", ["usuario", "materia"], {}, cargar_opciones)
+    lista_asignaciones = fragmento(
+        "lista_asignaciones", ["asignacion", "usuario", "materia"],
+        {"grado": grado, "busqueda": busqueda, "despues": despues, "ciclo": ciclo_activo()}, cargar_lista
+    )
     return render_template(
         "admin_asignaciones.html",
-        docentes=docentes,
+        opciones_asignacion=opciones_asignacion,
+        lista_asignaciones=lista_asignaciones,
+        grados=grados_con_asignaciones(),
+        grado=grado,
+        busqueda=busqueda
+    )
+
+# ================= AUDITORÍA =================
+@ruta("/admin/auditoria")
+@login_required
+def admin_auditoria():
+    if current_user.rol != "admin":
+        return redirect(url_for("login"))
+
+    usuario_id = request.args.get("usuario_id", type=int)
+    accion = request.args.get("accion", "").strip()
+    registros, siguiente = pagina_auditoria(usuario_id, accion, request.args.get("despues"))
+    usuarios = Usuario.query.order_by(Usuario.nombre).all()
+
+    return render_template(
+        "admin_auditoria.html",
+        registros=registros,
+        usuarios=usuarios,
+        usuario_id=usuario_id,
+        accion=accion,
+        siguiente=siguiente
+    )
+
+# ================= ESTADÍSTICAS DE CALIFICACIONES =================
+@ruta("/admin/estadisticas")
+@login_required
+def admin_estadisticas():
+    if current_user.rol != "admin":
+        return redirect(url_for("login"))
+
+    ciclo = request.args.get("ciclo", type=int) or ciclo_activo()
+    grados = grados_con_resumen(ciclo)
+    grado_id = request.args.get("grado", type=int)
+    grado = next((g for g in grados if g.id == grado_id), grados[0] if grados else None)
+    materias, ranking = estadisticas_grado(grado.id, ciclo) if grado else ([], [])
+
+    # Percentiles: no se pueden mantener incrementalmente, se calculan
+    # sobre la matriz completa del grado
+    if materias:
+        matriz = cargar_matriz(grado.id, ciclo)
+        columnas = [materia_id for materia_id, _ in matriz.materias]
+        percentiles = dict(zip(columnas, matriz.percentiles().T.tolist()))
+        for m in materias:
+            m["percentiles"] = percentiles.get(m["materia_id"])
+
+    return render_template(
+        "admin_estadisticas.html",
+        ciclo=ciclo,
+        grados=grados,
+        grado=grado,
         materias=materias,
-        asignaciones=asignaciones
+        ranking=ranking,
+        aprobacion=APROBACION
     )
 
+# ================= ESTADÍSTICAS DE CACHE =================
+@ruta("/admin/estadisticas/cache")
+@login_required
+def estadisticas_cache():
+    if current_user.rol != "admin":
+        return jsonify({"error": "No autorizado"}), 403
+
+    return jsonify({
+        "sesiones": cache_usuarios.estadisticas(),
+        "boletines": cache_boletines.estadisticas(),
+        "fragmentos": estadisticas_fragmentos(),
+        "verificaciones": cache_verificaciones.estadisticas()
+    })
 
-@app.route("/logout")
+# ================= MÉTRICAS (PROMETHEUS) =================
+# Sesión de admin o, para el scraper, "Authorization: Bearer $METRICAS_TOKEN"
+@ruta("/admin/metricas")
+def metricas_prometheus():
+    token = os.environ.get("METRICAS_TOKEN")
+    por_token = bool(token) and hmac.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    )
+    if not por_token and not (current_user.is_authenticated and current_user.rol == "admin"):
+        return "No autorizado", 403
+
+    return current_app.response_class(
+        metricas.texto(),
+        content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+@ruta("/logout")
 @login_required
 def logout():
     registrar_auditoria("LOGOUT", current_user.correo)
@@ -403,7 +661,7 @@ def logout():
     return redirect(url_for("login"))
 
 # ================= REPORTES ADMIN =================
-@app.route("/admin/reporte/<int:alumno_id>")
+@ruta("/admin/reporte/<int:alumno_id>")
 @login_required
 def generar_reporte_admin(alumno_id):
     if current_user.rol != "admin":
@@ -416,90 +674,269 @@ def generar_reporte_admin(alumno_id):
         flash("El alumno no tiene notas registradas", "error")
         return redirect(url_for("admin"))
 
-    pdf = generar_boletin_pdf(alumno, notas)
-    return send_file(pdf, as_attachment=True)
+    alumno, notas = copiar_alumno(alumno, notas)
+    # El código impreso queda registrado antes de entregar el PDF
+    registrar_boletines([(alumno, notas)])
+    db.session.commit()
+
+    clave = clave_boletin(alumno, notas)
+    pdf = cache_boletines.obtener(clave)
+    if pdf is None:
+        pdf = generar_boletin_pdf(alumno, notas).getvalue()
+        cache_boletines.guardar(clave, alumno.id, pdf)
+
+    return send_file(
+        io.BytesIO(pdf),
+        mimetype="application/pdf",
+        as_attachment=True,
+        download_name=nombre_boletin(alumno)
+    )
 
 # ================= EDITAR NOTAS ADMIN =================
-@app.route("/admin/editar_notas/<int:alumno_id>", methods=["GET", "POST"])
+@ruta("/admin/editar_notas/<int:alumno_id>", methods=["GET", "POST"])
 @login_required
 def editar_notas(alumno_id):
     if current_user.rol != "admin":
         return redirect(url_for("login"))
 
     alumno = Alumno.query.get_or_404(alumno_id)
-    notas = Nota.query.filter_by(alumno_id=alumno.id).all()
+    notas = Nota.query.filter_by(alumno_id=alumno.id).order_by(Nota.materia_id, Nota.bloque).all()
 
     if request.method == "POST":
-        for nota in notas:
-            nuevo = request.form.get(f"puntaje_{nota.id}")
-            if nuevo:
-                nota.puntaje = float(nuevo)
-
+        # Los ciclos cerrados son de solo lectura
+        if alumno.ciclo != ciclo_activo():
+            flash(f"El ciclo {alumno.ciclo} está cerrado; sus notas no se pueden modificar", "error")
+            return redirect(url_for("admin", ciclo=alumno.ciclo))
+
+        cambios, error = diferencias(notas, request.form)
+        if error:
+            flash(error, "error")
+            return redirect(url_for("editar_notas", alumno_id=alumno.id))
+
+        if not cambios:
+            flash("No hubo cambios", "success")
+            return redirect(url_for("admin"))
+
+        if not aplicar_cambios(cambios):
+            db.session.rollback()
+            flash("Otro usuario modificó estas notas mientras editaba; revise los valores actuales", "error")
+            return redirect(url_for("editar_notas", alumno_id=alumno.id))
+
+        for descripcion in describir_cambios(alumno.nombre, cambios):
+            registrar_auditoria("EDITAR_NOTAS", descripcion, en_transaccion=True)
         db.session.commit()
-        registrar_auditoria("EDITAR_NOTAS", alumno.nombre)
-        flash("Notas actualizadas correctamente", "success")
+        flash(f"{len(cambios)} notas actualizadas correctamente", "success")
         return redirect(url_for("admin"))
 
     return render_template("editar_notas.html", alumno=alumno, notas=notas)
 
 # ================= DESCARGA MASIVA POR GRADO =================
-@app.route("/admin/descargar_grado/<grado>")
+def boletines_de(grado_id=None, ciclo=None):
+    return [copiar_alumno(alumno, notas) for alumno, notas in alumnos_con_notas(grado_id, ciclo)]
+
+def encolar_zip(descripcion, boletines, nombre_zip, carpeta_por_grado=False):
+    registrar_boletines(boletines)
+    db.session.commit()
+    trabajo_id = cola_trabajos().encolar(
+        "ZIP", descripcion, current_user.id,
+        construir_zip, boletines, nombre_zip, carpeta_por_grado
+    )
+    return redirect(url_for("ver_trabajo", trabajo_id=trabajo_id))
+
+@ruta("/admin/descargar_grado/<int:grado_id>")
 @login_required
-def descargar_pdfs_por_grado(grado):
+def descargar_pdfs_por_grado(grado_id):
     if current_user.rol != "admin":
         return redirect(url_for("login"))
 
-    carpeta = "zip_temp"
-    os.makedirs(carpeta, exist_ok=True)
-    ruta_zip = os.path.join(carpeta, f"{grado}.zip")
+    grado = db.get_or_404(Grado, grado_id).nombre
+    ciclo = request.args.get("ciclo", type=int) or ciclo_activo()
+    boletines = boletines_de(grado_id, ciclo)
 
-    with zipfile.ZipFile(ruta_zip, "w") as zipf:
-        alumnos = Alumno.query.filter_by(grado=grado).all()
-        for alumno in alumnos:
-            notas = Nota.query.filter_by(alumno_id=alumno.id).all()
-            if notas:
-                pdf = generar_boletin_pdf(alumno, notas)
-                zipf.write(pdf, os.path.basename(pdf))
-
-    registrar_auditoria("DESCARGA_ZIP", grado)
-    return send_file(ruta_zip, as_attachment=True)
-
-# ================= INICIALIZACIÓN BD =================
-with app.app_context():
-    db.create_all()
-
-    admin_email = os.environ.get("ADMIN_EMAIL")
-    admin_password = os.environ.get("ADMIN_PASSWORD")
-
-    if not admin_email or not admin_password:
-        raise RuntimeError("ADMIN_EMAIL o ADMIN_PASSWORD no definidos")
-
-    if not Usuario.query.filter_by(correo=admin_email).first():
-        admin = Usuario(nombre="Administrador", correo=admin_email, rol="admin")
-        admin.set_password(admin_password)
-        db.session.add(admin)
-
-    materias = [
-        ("Matemática", "Primero Primaria"),
-        ("Lenguaje", "Primero Primaria"),
-        ("Ciencias", "Primero Primaria"),
-        ("Matemática", "Segundo Primaria"),
-        ("Lenguaje", "Segundo Primaria"),
-        ("Sociales", "Segundo Primaria"),
-    ]
-
-    for nombre, grado in materias:
-        if not Materia.query.filter_by(nombre=nombre, grado=grado).first():
-            db.session.add(Materia(nombre=nombre, grado=grado))
+    registrar_auditoria("DESCARGA_ZIP", f"{grado} ({ciclo})")
+    return encolar_zip(f"{grado} ({ciclo})", boletines, f"{grado}_{ciclo}.zip")
 
-    db.session.commit()
+@ruta("/admin/descargar_todos")
+@login_required
+def descargar_pdfs_todos():
+    if current_user.rol != "admin":
+        return redirect(url_for("login"))
+
+    ciclo = request.args.get("ciclo", type=int) or ciclo_activo()
+    boletines = boletines_de(None, ciclo)
+
+    registrar_auditoria("DESCARGA_ZIP", f"Todos los grados ({ciclo})")
+    return encolar_zip(f"Todos los grados ({ciclo})", boletines, f"boletines_{ciclo}.zip", carpeta_por_grado=True)
+
+# ================= CICLOS ESCOLARES =================
+@ruta("/admin/ciclos", methods=["GET", "POST"])
+@login_required
+def admin_ciclos():
+    if current_user.rol != "admin":
+        return redirect(url_for("login"))
+
+    if request.method == "POST":
+        anio = request.form.get("anio", type=int)
+        accion = request.form.get("accion")
+
+        if not anio:
+            flash("Año inválido", "error")
+        elif accion == "abrir":
+            error = abrir_ciclo(anio)
+            if error:
+                flash(error, "error")
+            else:
+                registrar_auditoria("ABRIR_CICLO", str(anio))
+                flash(f"Ciclo {anio} activo; el anterior quedó cerrado", "success")
+        elif accion == "archivar":
+            error = archivar_ciclo(anio)
+            if error:
+                flash(error, "error")
+            else:
+                registrar_auditoria("ARCHIVAR_CICLO", str(anio))
+                flash(f"Ciclo {anio} archivado", "success")
+        return redirect(url_for("admin_ciclos"))
+
+    return render_template("admin_ciclos.html", ciclos=listar_ciclos())
+
+@ruta("/admin/ciclos/<int:anio>/boletines")
+@login_required
+def descargar_ciclo_archivado(anio):
+    if current_user.rol != "admin":
+        return redirect(url_for("login"))
+
+    ciclo = db.get_or_404(CicloEscolar, anio)
+    if ciclo.estado != "archivado":
+        return redirect(url_for("descargar_pdfs_todos", ciclo=anio))
+
+    registrar_auditoria("DESCARGA_ZIP", f"Ciclo archivado {anio}")
+    return encolar_zip(
+        f"Ciclo archivado {anio}", boletines_archivados(anio), f"boletines_{anio}.zip", carpeta_por_grado=True
+    )
+
+# ================= VERIFICACIÓN PÚBLICA DE BOLETINES =================
+# Sin sesión: la respuesta es igual para todos, así que navegadores, proxies
+# o un CDN pueden guardarla. La búsqueda es por clave primaria.
+@ruta("/verificar")
+def verificar_boletin_formulario():
+    codigo = normalizar_codigo(request.args.get("codigo"))
+    if codigo:
+        return redirect(url_for("verificar_boletin", codigo=codigo))
+    return render_template("verificar.html", codigo=None, boletin=None)
+
+@ruta("/verificar/<codigo>")
+def verificar_boletin(codigo):
+    normalizado = normalizar_codigo(codigo)
+    if normalizado and normalizado != codigo:
+        # Una sola URL por código para que el cache HTTP no se fragmente
+        return redirect(url_for("verificar_boletin", codigo=normalizado), 301)
+
+    boletin, error = verificar_codigo(normalizado, ip_cliente())
+    if error == "bloqueado":
+        metricas.incrementar("verificaciones_total", resultado=error)
+        return render_template("verificar.html", codigo=codigo, boletin=None, bloqueado=True), 429, {"Retry-After": "60"}
+    resultado = error or ("reemplazado" if boletin["reemplazado"] else "vigente")
+    metricas.incrementar("verificaciones_total", resultado=resultado)
+
+    respuesta = current_app.make_response((
+        render_template("verificar.html", codigo=codigo, boletin=boletin),
+        404 if error else 200
+    ))
+    respuesta.cache_control.public = True
+    respuesta.cache_control.max_age = 60 if error else VERIFICACION_MAX_AGE
+    respuesta.add_etag()
+    return respuesta.make_conditional(request)
+
+# ================= TRABAJOS =================
+@ruta("/admin/trabajos/<trabajo_id>")
+@login_required
+def ver_trabajo(trabajo_id):
+    if current_user.rol != "admin":
+        return redirect(url_for("login"))
 
+    trabajo = cola_trabajos().estado(trabajo_id)
+    if not trabajo:
+        flash("Trabajo no encontrado", "error")
+        return redirect(url_for("admin"))
+
+    return render_template("admin_trabajo.html", trabajo=trabajo)
+
+@ruta("/admin/trabajos/<trabajo_id>/estado")
+@login_required
+def estado_trabajo(trabajo_id):
+    if current_user.rol != "admin":
+        return jsonify({"error": "No autorizado"}), 403
 
+    trabajo = cola_trabajos().estado(trabajo_id)
+    if not trabajo:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
 
+    return jsonify(trabajo)
 
+@ruta("/admin/trabajos/<trabajo_id>/descargar")
+@login_required
+def descargar_trabajo(trabajo_id):
+    if current_user.rol != "admin":
+        return redirect(url_for("login"))
+
+    resultado = cola_trabajos().artefacto(trabajo_id)
+    if not resultado:
+        flash("El archivo aún no está listo", "error")
+        return redirect(url_for("ver_trabajo", trabajo_id=trabajo_id))
+
+    nombre_archivo, ruta = resultado
+    return send_file(
+        ruta,
+        mimetype="application/zip",
+        as_attachment=True,
+        download_name=nombre_archivo
+    )
 
+# ================= APP =================
+# El esquema y los datos iniciales NO se tocan aquí: se preparan una vez
+# por despliegue con `flask --app app init-bd`.
+def create_app():
+    app = Flask(__name__)
+
+    # 🔐 SECRET KEY DESDE VARIABLE DE ENTORNO
+    app.config['SECRET_KEY'] = os.environ.get("SECRET_KEY")
+    if not app.config['SECRET_KEY']:
+        raise RuntimeError("SECRET_KEY no definida en variables de entorno")
+
+    # 🌐 IP REAL DEL CLIENTE DETRÁS DEL PROXY (RENDER)
+    if PROXY_SALTOS:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_SALTOS, x_proto=PROXY_SALTOS)
+
+    # 🔧 ASEGURAR CARPETA INSTANCE (RENDER)
+    os.makedirs(app.instance_path, exist_ok=True)
+
+    # 🗄️ BASE DE DATOS: DATABASE_URL (PostgreSQL) o SQLite local
+    configurar_bd(app)
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+    db.init_app(app)
+    registrar_contador_consultas(app)
+    registrar_metricas(app)
+    login_manager.init_app(app)
+
+    for regla, vista, opciones in RUTAS:
+        app.add_url_rule(regla, view_func=vista, **opciones)
+
+    app.cli.add_command(comando_init_bd)
+    app.cli.add_command(comando_ciclo)
+
+    # ⚙️ TRABAJOS DE REPORTES EN SEGUNDO PLANO
+    app.extensions["cola_trabajos"] = ColaTrabajos(
+        os.path.join(app.instance_path, "trabajos.db"), os.path.join(app.instance_path, "trabajos")
+    )
 
+    # 🧩 FRAGMENTOS HTML CACHEADOS (memoria del proceso o SQLite compartido)
+    app.extensions["cache_fragmentos"] = crear_cache(app.instance_path)
 
+    with app.app_context():
+        escritor_auditoria.iniciar(db.engine, os.path.join(app.instance_path, "auditoria_pendiente.jsonl"))
 
+    return app
 
 
+app = create_app()
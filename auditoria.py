@@ -0,0 +1,136 @@
+from flask_login import current_user
+from sqlalchemy import insert
+from datetime import datetime
+from models import db, Auditoria
+import threading
+import atexit
+import queue
+import json
+import os
+
+# ================= CONFIGURACIÓN =================
+AUDITORIA_LOTE = int(os.environ.get("AUDITORIA_LOTE", 100))
+AUDITORIA_INTERVALO = float(os.environ.get("AUDITORIA_INTERVALO", 2))
+
+# ================= ESCRITOR EN LOTES =================
+# Las entradas se acumulan en memoria y un hilo las inserta en lotes con
+# su propia conexión. Si la BD falla, o al apagar el proceso, lo pendiente
+# se guarda en un archivo JSONL que el hilo reinserta al arrancar (primera
+# entrada del proceso; importar la app no toca la BD) y después de cada lote
+# que se escribe bien, cuando la BD ya volvió.
+class EscritorAuditoria:
+    def __init__(self):
+        self._cola = queue.Queue()
+        self._hilo = None
+        self._pid = None
+        self._candado = threading.Lock()
+        self.engine = None
+        self.ruta_respaldo = None
+
+    def iniciar(self, engine, ruta_respaldo):
+        self.engine = engine
+        self.ruta_respaldo = ruta_respaldo
+        atexit.register(self.cerrar)
+
+    def encolar(self, entrada):
+        self._asegurar_hilo()
+        self._cola.put(entrada)
+
+    def _asegurar_hilo(self):
+        # Un hilo por proceso: tras un fork de gunicorn el hilo no se hereda
+        if self._pid == os.getpid():
+            return
+        with self._candado:
+            if self._pid != os.getpid():
+                self._hilo = threading.Thread(target=self._trabajar, name="auditoria", daemon=True)
+                self._hilo.start()
+                self._pid = os.getpid()
+
+    def _tomar_lote(self, espera):
+        lote = []
+        try:
+            lote.append(self._cola.get(timeout=espera))
+            while len(lote) < AUDITORIA_LOTE:
+                lote.append(self._cola.get_nowait())
+        except queue.Empty:
+            pass
+        return lote
+
+    def _trabajar(self):
+        self.recuperar()
+        while True:
+            lote = self._tomar_lote(AUDITORIA_INTERVALO)
+            if lote and self._escribir(lote):
+                self.recuperar()
+
+    def _escribir(self, lote):
+        # True si el lote quedó en la BD; si no, va al respaldo
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(Auditoria.__table__), lote)
+        except Exception:
+            self._respaldar(lote)
+            return False
+        return True
+
+    def _respaldar(self, lote):
+        with self._candado:
+            with open(self.ruta_respaldo, "a", encoding="utf-8") as f:
+                for entrada in lote:
+                    f.write(json.dumps({**entrada, "fecha": entrada["fecha"].isoformat()}) + "\n")
+
+    def recuperar(self):
+        if not self.ruta_respaldo or not os.path.exists(self.ruta_respaldo):
+            return
+
+        # Renombrar primero: solo un worker se queda con el archivo
+        reclamado = f"{self.ruta_respaldo}.{os.getpid()}"
+        try:
+            os.rename(self.ruta_respaldo, reclamado)
+        except OSError:
+            return
+
+        with open(reclamado, encoding="utf-8") as f:
+            lote = [json.loads(linea) for linea in f if linea.strip()]
+        for entrada in lote:
+            entrada["fecha"] = datetime.fromisoformat(entrada["fecha"])
+
+        if lote:
+            self._escribir(lote)
+        os.remove(reclamado)
+
+    def vaciar(self):
+        lote = self._tomar_lote(0)
+        while lote:
+            self._escribir(lote)
+            lote = self._tomar_lote(0)
+
+    def cerrar(self):
+        if self.engine is not None:
+            self.vaciar()
+
+
+escritor_auditoria = EscritorAuditoria()
+
+# ================= REGISTRO =================
+def registrar_auditoria(accion, descripcion, en_transaccion=False, usuario_id=None):
+    # en_transaccion=True: se añade a la sesión y se confirma con el commit
+    # del llamador. Si no, va al escritor en lotes.
+    if usuario_id is None:
+        if not current_user.is_authenticated:
+            return
+        usuario_id = current_user.id
+
+    entrada = {
+        "usuario_id": usuario_id,
+        "accion": accion,
+        "descripcion": descripcion[:200],
+        "fecha": datetime.utcnow()
+    }
+
+    if en_transaccion or escritor_auditoria.engine is None:
+        db.session.add(Auditoria(**entrada))
+        if not en_transaccion:
+            db.session.commit()
+    else:
+        escritor_auditoria.encolar(entrada)
@@ -0,0 +1,63 @@
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects import postgresql, sqlite
+import sqlite3
+import os
+
+# ================= CONFIGURACIÓN DE LA BASE DE DATOS =================
+# DATABASE_URL elige el motor (PostgreSQL en producción). Sin ella se usa
+# SQLite en la carpeta instance, afinado para varios workers.
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 15000))
+
+
+def url_base_datos(instance_path):
+    url = os.environ.get("DATABASE_URL")
+    if not url:
+        return "sqlite:///" + os.path.join(instance_path, "database.db")
+
+    # Render y Heroku entregan postgres://, que SQLAlchemy ya no acepta
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+def opciones_motor(url):
+    if url.startswith("sqlite"):
+        return {"connect_args": {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}}
+
+    return {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": int(os.environ.get("DB_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": True,
+    }
+
+
+def configurar_bd(app):
+    url = url_base_datos(app.instance_path)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = opciones_motor(url)
+
+# ================= INSERT ... ON CONFLICT =================
+# PostgreSQL y SQLite comparten la API on_conflict_do_nothing/do_update
+def insert_upsert(conexion, tabla):
+    if conexion.dialect.name == "postgresql":
+        return postgresql.insert(tabla)
+    return sqlite.insert(tabla)
+
+# ================= SQLITE: WAL Y ESPERA DE BLOQUEOS =================
+@event.listens_for(Engine, "connect")
+def _ajustar_sqlite(conexion_dbapi, registro):
+    if not isinstance(conexion_dbapi, sqlite3.Connection):
+        return
+
+    cursor = conexion_dbapi.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+    except sqlite3.OperationalError:
+        # Archivos de solo lectura (ciclos archivados) quedan como están
+        pass
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
@@ -0,0 +1,599 @@
+# ================= BENCHMARKS =================
+# Uso: python benchmark.py boletin --repeticiones 50
+#      python benchmark.py calculo --alumnos 10000
+#      DATABASE_URL=postgresql://... python benchmark.py carga --procesos 4 --notas 200
+#      python benchmark.py concurrencia --procesos 4 --hilos 4 --alumnos 25 --modo maximo
+#      python benchmark.py suite --grados 6 --alumnos 30 --salida base.json
+#      python benchmark.py suite --salida nuevo.json --comparar base.json
+from concurrent.futures import ThreadPoolExecutor
+from collections import namedtuple
+import multiprocessing
+import threading
+import random
+import tempfile
+import argparse
+import time
+import tracemalloc
+import resource
+import platform
+import subprocess
+import datetime
+import json
+import math
+import uuid
+import sys
+import os
+
+# Los casos de docente también leen X-Query-Count; se lee al importar consultas
+os.environ.setdefault("CABECERAS_DIAGNOSTICO", "1")
+
+from inicializacion import inicializar_bd
+from models import ResumenAlumnoMateria, BoletinEmitido, CICLO_INICIAL, ids_de_grados
+from generar_boletin import generar_boletin_pdf, limpiar_plantilla, promedio_final
+
+AlumnoPrueba = namedtuple("AlumnoPrueba", ["id", "nombre", "grado", "ciclo"])
+NotaPrueba = namedtuple("NotaPrueba", ["materia_id", "materia", "bloque", "puntaje"])
+
+
+def alumno_sintetico(i, materias=6):
+    alumno = AlumnoPrueba(i, f"Alumno Prueba {i}", "Benchmark", CICLO_INICIAL)
+    notas = [
+        NotaPrueba(m + 1, f"Materia {m}", bloque, 60 + (i + m + bloque) % 40)
+        for m in range(materias)
+        for bloque in range(1, 5)
+    ]
+    return alumno, notas
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    for i in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion(i)
+        tiempos.append(time.perf_counter() - inicio)
+    tiempos.sort()
+
+    def percentil(q):
+        return tiempos[max(0, math.ceil(len(tiempos) * q / 100) - 1)] * 1000
+
+    return {
+        "repeticiones": len(tiempos),
+        "media_ms": sum(tiempos) / len(tiempos) * 1000,
+        "min_ms": tiempos[0] * 1000,
+        "p50_ms": percentil(50),
+        "p90_ms": percentil(90),
+        "p95_ms": percentil(95),
+        "p99_ms": percentil(99),
+        "max_ms": tiempos[-1] * 1000,
+    }
+
+# ================= BOLETÍN PDF =================
+def bench_boletin(repeticiones):
+    alumnos = [alumno_sintetico(i) for i in range(repeticiones)]
+
+    def sin_cache(i):
+        limpiar_plantilla()
+        generar_boletin_pdf(*alumnos[i])
+
+    def con_cache(i):
+        generar_boletin_pdf(*alumnos[i])
+
+    frio = medir(sin_cache, repeticiones)
+    caliente = medir(con_cache, repeticiones)
+
+    print(f"Sin plantilla cacheada: {frio['media_ms']:.2f} ms/PDF (p95 {frio['p95_ms']:.2f})")
+    print(f"Con plantilla cacheada: {caliente['media_ms']:.2f} ms/PDF (p95 {caliente['p95_ms']:.2f})")
+    print(f"Aceleración: {frio['media_ms'] / caliente['media_ms']:.2f}x")
+
+# ================= CÁLCULO DE PROMEDIOS =================
+def promedios_por_alumno(boletines):
+    # Mismo recorrido que generar_boletin_pdf, alumno por alumno
+    resultado = {}
+    for alumno, notas in boletines:
+        materias = {}
+        for nota in notas:
+            if nota.materia not in materias:
+                materias[nota.materia] = {1: 0, 2: 0, 3: 0, 4: 0}
+            materias[nota.materia][nota.bloque] = nota.puntaje
+        resultado[alumno.id] = {
+            materia: promedio_final(sum(bloques.values()))
+            for materia, bloques in materias.items()
+        }
+    return resultado
+
+
+def bench_calculo(repeticiones, alumnos=10000):
+    from calculo import MatrizGrado
+
+    boletines = [alumno_sintetico(i, materias=8) for i in range(alumnos)]
+
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        bucle = promedios_por_alumno(boletines)
+    t_bucle = (time.perf_counter() - inicio) / repeticiones
+
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        matriz = MatrizGrado.desde_boletines(boletines)
+        promedios = matriz.promedios()
+    t_matriz = (time.perf_counter() - inicio) / repeticiones
+
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        matriz.promedios()
+        matriz.promedio_general()
+        matriz.percentiles()
+    t_calculo = (time.perf_counter() - inicio) / repeticiones
+
+    # Ambos caminos deben dar el mismo resultado
+    for i, (_, materia) in enumerate(matriz.materias):
+        assert bucle[0][materia] == promedios[0, i]
+
+    print(f"{alumnos} alumnos, {sum(len(n) for _, n in boletines)} notas")
+    print(f"Bucle por alumno:           {t_bucle * 1000:.1f} ms")
+    print(f"Matriz (carga + promedios): {t_matriz * 1000:.1f} ms")
+    print(f"Matriz (solo cálculos):     {t_calculo * 1000:.1f} ms (promedios, general y percentiles)")
+
+# ================= CARGA: REGISTRO CONCURRENTE DE NOTAS =================
+# Cada proceso simula un worker de gunicorn registrando notas por /docente.
+# Sin DATABASE_URL se usa un SQLite temporal.
+def _app_de_carga():
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    os.environ.setdefault("ADMIN_EMAIL", "admin@benchmark.local")
+    os.environ.setdefault("ADMIN_PASSWORD", "benchmark")
+    if not os.environ.get("DATABASE_URL"):
+        carpeta = tempfile.mkdtemp(prefix="carga_")
+        os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(carpeta, "carga.db")
+
+    import app as aplicacion
+    return aplicacion
+
+
+def _trabajador_carga(args):
+    correo, clave, grado, materia_id, entradas = args
+    aplicacion = _app_de_carga()
+    with aplicacion.app.app_context():
+        # Conexiones propias: las del proceso padre no se comparten
+        aplicacion.db.engine.dispose(close=False)
+
+    cliente = aplicacion.app.test_client()
+    cliente.post("/", data={"correo": correo, "password": clave})
+
+    estados = {}
+    for nombre, bloque in entradas:
+        r = cliente.post("/docente", data={
+            "grado": grado, "materia_id": materia_id,
+            "nombre": nombre, "bloque": bloque, "puntaje": 75
+        })
+        estados[r.status_code] = estados.get(r.status_code, 0) + 1
+    return estados
+
+
+def _escuela_de_prueba(aplicacion, cantidad_alumnos):
+    # Docente, materia, asignación y alumnos en un grado nuevo
+    db = aplicacion.db
+    sufijo = uuid.uuid4().hex[:8]
+    nombre_grado = f"Carga {sufijo}"
+    correo, clave = f"docente_{sufijo}@benchmark.local", "benchmark"
+
+    with aplicacion.app.app_context():
+        inicializar_bd()
+        grado = ids_de_grados(db.session.connection(), [nombre_grado])[nombre_grado]
+        docente = aplicacion.Usuario(nombre="Docente Carga", correo=correo, rol="docente")
+        docente.set_password(clave)
+        materia = aplicacion.Materia(nombre="Carga", grado_id=grado)
+        db.session.add_all([docente, materia])
+        db.session.flush()
+        db.session.add(aplicacion.Asignacion(docente_id=docente.id, materia_id=materia.id, grado_id=grado))
+
+        alumnos = [aplicacion.Alumno(nombre=f"Alumno Carga {sufijo} {i}", grado_id=grado) for i in range(cantidad_alumnos)]
+        db.session.add_all(alumnos)
+        db.session.commit()
+
+        escuela = {
+            "correo": correo, "clave": clave, "grado": grado, "materia_id": materia.id,
+            "alumnos": [(a.id, a.nombre) for a in alumnos],
+            "motor": db.engine.dialect.name,
+        }
+        db.engine.dispose()
+    return escuela
+
+
+def bench_carga(procesos, notas):
+    aplicacion = _app_de_carga()
+    total = procesos * notas
+    escuela = _escuela_de_prueba(aplicacion, total // 4 + 1)
+
+    entradas = [(escuela["alumnos"][i // 4][1], i % 4 + 1) for i in range(total)]
+    lotes = [
+        (escuela["correo"], escuela["clave"], escuela["grado"], escuela["materia_id"], entradas[p::procesos])
+        for p in range(procesos)
+    ]
+
+    inicio = time.perf_counter()
+    with multiprocessing.get_context("fork").Pool(procesos) as pool:
+        resultados = pool.map(_trabajador_carga, lotes)
+    duracion = time.perf_counter() - inicio
+
+    estados = {}
+    for r in resultados:
+        for codigo, cantidad in r.items():
+            estados[codigo] = estados.get(codigo, 0) + cantidad
+
+    print(f"Motor: {escuela['motor']} | procesos: {procesos} | notas: {total}")
+    print(f"Tiempo: {duracion:.2f} s | rendimiento: {total / duracion:.1f} notas/s")
+    print(f"Respuestas HTTP: {estados}")
+
+# ================= CONCURRENCIA: ENVÍOS EN CONFLICTO =================
+# Todos los procesos envían nota a las mismas casillas (alumno, bloque) y
+# cada envío sale dos veces con la misma clave (doble clic). Verifica que
+# no haya 500, que ninguna escritura se pierda y que la idempotencia y el
+# modo NOTAS_CONFLICTO se respeten.
+def _trabajador_concurrencia(args):
+    escuela, envios, hilos = args
+    aplicacion = _app_de_carga()
+    with aplicacion.app.app_context():
+        aplicacion.db.engine.dispose(close=False)
+
+    local = threading.local()
+
+    def enviar(envio):
+        alumno_id, bloque, puntaje, clave = envio
+        if not hasattr(local, "cliente"):
+            local.cliente = aplicacion.app.test_client()
+            local.cliente.post("/", data={"correo": escuela["correo"], "password": escuela["clave"]})
+        r = local.cliente.post("/docente", data={
+            "grado": escuela["grado"], "materia_id": escuela["materia_id"],
+            "alumno_id": alumno_id, "bloque": bloque, "puntaje": puntaje, "clave": clave
+        })
+        with local.cliente.session_transaction() as sesion:
+            mensajes = [m for _, m in sesion.pop("_flashes", [])]
+        return envio, r.status_code, mensajes[0] if mensajes else ""
+
+    # Las dos copias de cada envío van seguidas para que corran a la vez
+    tareas = [envio for envio in envios for _ in range(2)]
+    with ThreadPoolExecutor(hilos) as pool:
+        return list(pool.map(enviar, tareas))
+
+
+def bench_concurrencia(procesos, alumnos, hilos, modo):
+    os.environ["NOTAS_CONFLICTO"] = modo
+    aplicacion = _app_de_carga()
+    escuela = _escuela_de_prueba(aplicacion, alumnos)
+    casillas = [(alumno_id, bloque) for alumno_id, _ in escuela["alumnos"] for bloque in (1, 2, 3, 4)]
+
+    lotes = []
+    for p in range(procesos):
+        envios = [
+            (alumno_id, bloque, round(40 + (p * 13 + i * 7) % 60 + p / 100, 2), uuid.uuid4().hex)
+            for i, (alumno_id, bloque) in enumerate(casillas)
+        ]
+        random.Random(p).shuffle(envios)
+        lotes.append((escuela, envios, hilos))
+
+    inicio = time.perf_counter()
+    with multiprocessing.get_context("fork").Pool(procesos) as pool:
+        resultados = [r for lote in pool.map(_trabajador_concurrencia, lotes) for r in lote]
+    duracion = time.perf_counter() - inicio
+
+    # ================= VERIFICACIÓN =================
+    with aplicacion.app.app_context():
+        ids = [alumno_id for alumno_id, _ in escuela["alumnos"]]
+        guardadas = {
+            (n.alumno_id, n.bloque): n.puntaje
+            for n in aplicacion.Nota.query.filter(
+                aplicacion.Nota.alumno_id.in_(ids), aplicacion.Nota.materia_id == escuela["materia_id"]
+            )
+        }
+        resumen = {
+            r.alumno_id: r.suma
+            for r in aplicacion.db.session.query(ResumenAlumnoMateria)
+            .filter(ResumenAlumnoMateria.alumno_id.in_(ids), ResumenAlumnoMateria.materia_id == escuela["materia_id"])
+        }
+
+    fallos = []
+    errores_servidor = sum(1 for _, estado, _ in resultados if estado >= 500)
+    if errores_servidor:
+        fallos.append(f"{errores_servidor} respuestas 5xx")
+
+    aplicadas = {}
+    enviados = {}
+    for (alumno_id, bloque, puntaje, clave), _, mensaje in resultados:
+        enviados.setdefault((alumno_id, bloque), set()).add(puntaje)
+        if mensaje == "Nota registrada correctamente":
+            aplicadas.setdefault(clave, []).append((alumno_id, bloque, puntaje))
+
+    repetidas = sum(1 for v in aplicadas.values() if len(v) > 1)
+    if repetidas:
+        fallos.append(f"{repetidas} claves de idempotencia aplicadas dos veces")
+
+    aplicadas_por_casilla = {}
+    for (alumno_id, bloque, puntaje), *_ in aplicadas.values():
+        aplicadas_por_casilla.setdefault((alumno_id, bloque), []).append(puntaje)
+
+    for casilla in casillas:
+        if casilla not in guardadas:
+            fallos.append(f"Casilla sin nota: {casilla}")
+            continue
+        valor = guardadas[casilla]
+        escritos = aplicadas_por_casilla.get(casilla, [])
+        if modo == "rechazar" and escritos != [valor]:
+            fallos.append(f"{casilla}: guardado {valor}, aceptados {escritos}")
+        elif modo == "sobrescribir" and valor not in escritos:
+            fallos.append(f"{casilla}: guardado {valor} no es un envío aceptado")
+        elif modo == "maximo" and valor != max(enviados[casilla]):
+            fallos.append(f"{casilla}: guardado {valor}, máximo enviado {max(enviados[casilla])}")
+
+    for alumno_id in ids:
+        esperado = sum(v for (a, _), v in guardadas.items() if a == alumno_id)
+        if abs(resumen.get(alumno_id, 0) - esperado) > 1e-6:
+            fallos.append(f"Resumen desactualizado para alumno {alumno_id}")
+
+    estados = {}
+    for _, estado, _ in resultados:
+        estados[estado] = estados.get(estado, 0) + 1
+
+    print(f"Motor: {escuela['motor']} | modo: {modo} | procesos: {procesos} x {hilos} hilos")
+    print(f"Envíos: {len(resultados)} sobre {len(casillas)} casillas en {duracion:.2f} s")
+    print(f"Respuestas HTTP: {estados}")
+    if fallos:
+        print(f"❌ {len(fallos)} fallos")
+        for f in fallos[:20]:
+            print("  " + f)
+        sys.exit(1)
+    print("✅ Sin errores 5xx, sin escrituras perdidas ni duplicadas")
+
+
+# ================= SUITE: ESCUELA SINTÉTICA =================
+# Siembra una escuela del tamaño pedido en una BD temporal y mide las rutas
+# calientes con el cliente de pruebas de Flask. El JSON resultante se puede
+# comparar contra el de otra versión con --comparar.
+def sembrar_escuela(aplicacion, grados, alumnos, materias, docentes):
+    from sqlalchemy import insert
+    from credenciales import cifrar
+    from estadisticas import reconstruir
+
+    db = aplicacion.db
+    nombres_grado = [f"Grado {g + 1:02d}" for g in range(grados)]
+    clave = "benchmark"
+
+    with aplicacion.app.app_context():
+        inicializar_bd()
+
+        # Un solo hash para todos los docentes: sembrar no es lo que se mide
+        hash_clave = cifrar(clave)
+        db.session.execute(insert(aplicacion.Usuario), [
+            {"nombre": f"Docente {d + 1}", "correo": f"docente{d + 1}@suite.local",
+             "password": hash_clave, "rol": "docente"}
+            for d in range(docentes)
+        ])
+        grados_ids = ids_de_grados(db.session.connection(), nombres_grado)
+        db.session.execute(insert(aplicacion.Materia), [
+            {"nombre": f"Materia {m + 1}", "grado_id": grados_ids[g]}
+            for g in nombres_grado for m in range(materias)
+        ])
+        db.session.execute(insert(aplicacion.Alumno), [
+            {"nombre": f"Alumno {a + 1:04d} {g}", "grado_id": grados_ids[g]}
+            for g in nombres_grado for a in range(alumnos)
+        ])
+
+        ids_docentes = [i for (i,) in db.session.query(aplicacion.Usuario.id)
+                        .filter(aplicacion.Usuario.correo.like("%@suite.local")).order_by(aplicacion.Usuario.id)]
+        lista_materias = db.session.query(aplicacion.Materia.id, aplicacion.Materia.grado_id)\
+            .filter(aplicacion.Materia.grado_id.in_(grados_ids.values())).order_by(aplicacion.Materia.id).all()
+        db.session.execute(insert(aplicacion.Asignacion), [
+            {"docente_id": ids_docentes[i % len(ids_docentes)], "materia_id": materia_id, "grado_id": grado_id}
+            for i, (materia_id, grado_id) in enumerate(lista_materias)
+        ])
+
+        materias_por_grado = {}
+        for materia_id, grado_id in lista_materias:
+            materias_por_grado.setdefault(grado_id, []).append(materia_id)
+
+        notas = [
+            {"alumno_id": alumno_id, "materia_id": materia_id, "bloque": bloque,
+             "puntaje": 50 + (alumno_id * 7 + m * 3 + bloque * 11) % 51}
+            for alumno_id, grado_id in db.session.query(aplicacion.Alumno.id, aplicacion.Alumno.grado_id)
+            .filter(aplicacion.Alumno.grado_id.in_(grados_ids.values()))
+            for m, materia_id in enumerate(materias_por_grado[grado_id])
+            for bloque in (1, 2, 3, 4)
+        ]
+        for i in range(0, len(notas), 5000):
+            db.session.execute(insert(aplicacion.Nota), notas[i:i + 5000])
+
+        reconstruir(db.session.connection())
+        db.session.commit()
+        motor = db.engine.dialect.name
+
+    return {
+        "grados": [grados_ids[g] for g in nombres_grado],
+        "docente": ("docente1@suite.local", clave),
+        "notas": len(notas),
+        "motor": motor,
+    }
+
+
+def _cliente(aplicacion, correo, clave):
+    cliente = aplicacion.app.test_client()
+    r = cliente.post("/", data={"correo": correo, "password": clave})
+    assert r.status_code == 302, f"No se pudo iniciar sesión como {correo}"
+    return cliente
+
+
+def _memoria_pico_kb(funcion, veces=3):
+    # Pico de memoria Python asignada durante la operación (tracemalloc)
+    tracemalloc.start()
+    try:
+        for i in range(veces):
+            funcion(i)
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def _caso(funcion, repeticiones, consultas=None):
+    funcion(0)  # calentamiento: plantillas, pools, caches de proceso
+    resultado = medir(funcion, repeticiones)
+    if consultas:
+        resultado["consultas_por_peticion"] = sum(consultas) / len(consultas)
+    resultado["memoria_pico_kb"] = _memoria_pico_kb(funcion)
+    return resultado
+
+
+def _peticion(cliente, url, consultas):
+    def hacer(_):
+        r = cliente.get(url)
+        assert r.status_code == 200, f"{url} respondió {r.status_code}"
+        consultas.append(int(r.headers.get("X-Query-Count", 0)))
+    return hacer
+
+
+def _exportar_zip(aplicacion, cliente, grado):
+    from cache_boletines import cache_boletines
+
+    def hacer(_):
+        # Sin cache de boletines: se mide el renderizado completo
+        cache_boletines.limpiar()
+        r = cliente.get(f"/admin/descargar_grado/{grado}")
+        trabajo_id = r.location.rstrip("/").split("/")[-1]
+        while True:
+            estado = cliente.get(f"/admin/trabajos/{trabajo_id}/estado").get_json()
+            if estado["estado"] in ("terminado", "error"):
+                break
+            time.sleep(0.005)
+        assert estado["estado"] == "terminado", estado.get("error")
+        assert cliente.get(f"/admin/trabajos/{trabajo_id}/descargar").status_code == 200
+    return hacer
+
+
+def comparar_resultados(anterior, actual):
+    print(f"\nComparación con {anterior.get('version') or 'versión anterior'} ({anterior.get('fecha')}):")
+    for caso, datos in actual["resultados"].items():
+        previo = anterior.get("resultados", {}).get(caso)
+        if not previo:
+            print(f"  {caso:<16} sin datos previos")
+            continue
+        for metrica in ("p50_ms", "p95_ms", "consultas_por_peticion", "memoria_pico_kb"):
+            if metrica not in datos or not previo.get(metrica):
+                continue
+            cambio = (datos[metrica] - previo[metrica]) / previo[metrica] * 100
+            marca = " ⚠️" if cambio > 10 else ""
+            print(f"  {caso:<16} {metrica:<24} {previo[metrica]:>10.2f} → {datos[metrica]:>10.2f} ({cambio:+.1f}%){marca}")
+
+
+def _version_codigo():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_suite(repeticiones, grados, alumnos, materias, docentes, salida=None, comparar=None):
+    aplicacion = _app_de_carga()
+    from exportacion import copiar_alumno
+    from consultas import alumnos_con_notas
+
+    inicio = time.perf_counter()
+    escuela = sembrar_escuela(aplicacion, grados, alumnos, materias, docentes)
+    siembra = time.perf_counter() - inicio
+    grado = escuela["grados"][0]
+
+    admin = _cliente(aplicacion, os.environ["ADMIN_EMAIL"], os.environ["ADMIN_PASSWORD"])
+    docente = _cliente(aplicacion, *escuela["docente"])
+
+    with aplicacion.app.app_context():
+        alumno, notas = copiar_alumno(*alumnos_con_notas(grado)[0])
+
+    casos = {}
+    casos["boletin_pdf"] = _caso(lambda _: generar_boletin_pdf(alumno, notas), repeticiones)
+    for nombre, cliente, url in (
+        ("docente_get", docente, "/docente"),
+        ("admin_get", admin, "/admin"),
+        ("admin_get_grado", admin, f"/admin?grado={grado}"),
+    ):
+        consultas = []
+        casos[nombre] = _caso(_peticion(cliente, url, consultas), repeticiones, consultas)
+    casos["zip_grado"] = _caso(_exportar_zip(aplicacion, admin, grado), max(3, repeticiones // 10))
+    # Incluye la verificación del hash (PASSWORD_METODO) en el pool
+    casos["login"] = _caso(lambda _: _cliente(aplicacion, *escuela["docente"]), max(3, repeticiones // 10))
+
+    # Consulta pública de un código registrado por el ZIP (sin sesión)
+    with aplicacion.app.app_context():
+        codigo = aplicacion.db.session.query(BoletinEmitido.codigo).limit(1).scalar()
+    consultas = []
+    casos["verificar"] = _caso(
+        _peticion(aplicacion.app.test_client(), f"/verificar/{codigo}", consultas), repeticiones, consultas
+    )
+
+    resultado = {
+        "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+        "version": _version_codigo(),
+        "python": platform.python_version(),
+        "motor": escuela["motor"],
+        "parametros": {
+            "grados": grados, "alumnos_por_grado": alumnos, "materias_por_grado": materias,
+            "docentes": docentes, "notas": escuela["notas"], "repeticiones": repeticiones,
+        },
+        "siembra_s": round(siembra, 2),
+        "memoria_rss_max_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "resultados": casos,
+    }
+
+    print(f"Motor: {escuela['motor']} | {grados} grados x {alumnos} alumnos x {materias} materias "
+          f"| {escuela['notas']} notas (siembra {siembra:.1f} s)")
+    print(f"{'caso':<16} {'p50':>8} {'p95':>8} {'p99':>8} {'consultas':>10} {'pico KB':>10}")
+    for caso, datos in casos.items():
+        print(f"{caso:<16} {datos['p50_ms']:>8.2f} {datos['p95_ms']:>8.2f} {datos['p99_ms']:>8.2f} "
+              f"{datos.get('consultas_por_peticion', 0):>10.1f} {datos['memoria_pico_kb']:>10.1f}")
+
+    if salida:
+        with open(salida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {salida}")
+
+    if comparar:
+        with open(comparar, encoding="utf-8") as f:
+            comparar_resultados(json.load(f), resultado)
+
+
+BENCHMARKS = {
+    "boletin": bench_boletin,
+    "calculo": bench_calculo,
+    "carga": bench_carga,
+    "concurrencia": bench_concurrencia,
+    "suite": bench_suite,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks del sistema de calificaciones")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--repeticiones", type=int, default=50)
+    parser.add_argument("--alumnos", type=int, help="10000 en calculo, 25 en concurrencia, 30 por grado en suite")
+    parser.add_argument("--grados", type=int, default=6)
+    parser.add_argument("--materias", type=int, default=6, help="materias por grado (suite)")
+    parser.add_argument("--docentes", type=int, default=6)
+    parser.add_argument("--salida", help="archivo JSON de resultados (suite)")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior (suite)")
+    parser.add_argument("--procesos", type=int, default=4)
+    parser.add_argument("--notas", type=int, default=200, help="notas por proceso (carga)")
+    parser.add_argument("--hilos", type=int, default=4, help="hilos por proceso (concurrencia)")
+    parser.add_argument("--modo", choices=["rechazar", "sobrescribir", "maximo"], default="rechazar")
+    args = parser.parse_args()
+
+    if args.benchmark == "calculo":
+        bench_calculo(args.repeticiones, args.alumnos or 10000)
+    elif args.benchmark == "carga":
+        bench_carga(args.procesos, args.notas)
+    elif args.benchmark == "concurrencia":
+        bench_concurrencia(args.procesos, args.alumnos or 25, args.hilos, args.modo)
+    elif args.benchmark == "suite":
+        bench_suite(
+            args.repeticiones, args.grados, args.alumnos or 30, args.materias, args.docentes,
+            salida=args.salida, comparar=args.comparar
+        )
+    else:
+        BENCHMARKS[args.benchmark](args.repeticiones)
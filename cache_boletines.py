@@ -0,0 +1,90 @@
+from collections import OrderedDict
+import threading
+import hashlib
+import os
+
+# ================= CACHE DE BOLETINES RENDERIZADOS =================
+# La clave incluye el contenido de las notas: si una nota cambia, la clave
+# cambia y el PDF viejo nunca se vuelve a servir. La invalidación explícita
+# solo libera memoria antes de que el LRU lo haga; la hacen los caminos que
+# escriben notas (notas.guardar_notas, notas.aplicar_cambios, importación),
+# todos por Core, sin eventos del ORM.
+# Un PDF servido del cache conserva la fecha de "Documento generado" de su
+# primer renderizado: es la fecha en que se generó ese mismo contenido.
+BOLETINES_CACHE_MB = float(os.environ.get("BOLETINES_CACHE_MB", 64))
+
+
+def clave_boletin(alumno, notas):
+    filas = sorted((n.materia_id, n.materia, n.bloque, n.puntaje) for n in notas)
+    contenido = repr((alumno.id, alumno.nombre, alumno.grado, alumno.ciclo, filas))
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+
+class CacheBoletines:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = OrderedDict()  # clave -> (alumno_id, pdf)
+        self._por_alumno = {}
+        self._candado = threading.Lock()
+
+    def obtener(self, clave):
+        with self._candado:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[1]
+
+    def guardar(self, clave, alumno_id, pdf):
+        if len(pdf) > self.max_bytes:
+            return
+        with self._candado:
+            if clave in self._entradas:
+                self._entradas.move_to_end(clave)
+                return
+            self._entradas[clave] = (alumno_id, pdf)
+            self._por_alumno.setdefault(alumno_id, set()).add(clave)
+            self.bytes += len(pdf)
+
+            # ================= EVICCIÓN LRU =================
+            while self.bytes > self.max_bytes:
+                vieja, (viejo_alumno, viejo_pdf) = self._entradas.popitem(last=False)
+                self._quitar_indice(vieja, viejo_alumno, viejo_pdf)
+
+    def invalidar_alumno(self, alumno_id):
+        with self._candado:
+            for clave in self._por_alumno.pop(alumno_id, ()):
+                _, pdf = self._entradas.pop(clave)
+                self.bytes -= len(pdf)
+
+    def limpiar(self):
+        with self._candado:
+            self._entradas.clear()
+            self._por_alumno.clear()
+            self.bytes = 0
+
+    def estadisticas(self):
+        total = self.aciertos + self.fallos
+        return {
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": round(self.aciertos / total, 4) if total else 0.0,
+            "entradas": len(self._entradas),
+            "bytes": self.bytes,
+        }
+
+    def _quitar_indice(self, clave, alumno_id, pdf):
+        self.bytes -= len(pdf)
+        claves = self._por_alumno.get(alumno_id)
+        if claves is not None:
+            claves.discard(clave)
+            if not claves:
+                del self._por_alumno[alumno_id]
+
+
+cache_boletines = CacheBoletines(int(BOLETINES_CACHE_MB * 1024 * 1024))
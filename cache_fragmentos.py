@@ -0,0 +1,202 @@
+from flask import current_app, render_template, g
+from markupsafe import Markup
+from collections import OrderedDict
+from versiones import versiones, ambito_tabla
+import threading
+import sqlite3
+import hashlib
+import time
+import os
+
+# ================= CACHE DE FRAGMENTOS HTML =================
+# Tablas de alumnos, materias y asignaciones ya renderizadas. La clave lleva
+# la versión de cada tabla de la que depende el fragmento (versiones.py): una
+# escritura sube la versión y el HTML viejo deja de pedirse; el límite de
+# tamaño lo termina de sacar.
+#   FRAGMENTOS_CACHE=memoria  LRU por proceso (por defecto)
+#   FRAGMENTOS_CACHE=sqlite   instance/fragmentos.db, compartido entre workers
+#   FRAGMENTOS_CACHE=no       sin cache
+FRAGMENTOS_CACHE = os.environ.get("FRAGMENTOS_CACHE", "memoria")
+FRAGMENTOS_CACHE_MB = float(os.environ.get("FRAGMENTOS_CACHE_MB", 16))
+FRAGMENTOS_USO_SEGUNDOS = 60
+
+
+class CacheMemoria:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = OrderedDict()
+        self._candado = threading.Lock()
+
+    def obtener(self, clave):
+        with self._candado:
+            html = self._entradas.get(clave)
+            if html is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return html
+
+    def guardar(self, clave, html):
+        tamano = len(html.encode("utf-8"))
+        if tamano > self.max_bytes:
+            return
+        with self._candado:
+            if clave in self._entradas:
+                self._entradas.move_to_end(clave)
+                return
+            self._entradas[clave] = html
+            self.bytes += tamano
+            while self.bytes > self.max_bytes:
+                _, viejo = self._entradas.popitem(last=False)
+                self.bytes -= len(viejo.encode("utf-8"))
+
+    def limpiar(self):
+        with self._candado:
+            self._entradas.clear()
+            self.bytes = 0
+
+    def estadisticas(self):
+        total = self.aciertos + self.fallos
+        return {
+            "motor": "memoria",
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": round(self.aciertos / total, 4) if total else 0.0,
+            "entradas": len(self._entradas),
+            "bytes": self.bytes,
+        }
+
+
+class CacheSqlite:
+    # Un archivo por instancia, una conexión por hilo. Cualquier error de
+    # SQLite (bloqueo, disco) se trata como fallo: la página se renderiza igual.
+    def __init__(self, ruta, max_bytes):
+        self.ruta = ruta
+        self.max_bytes = max_bytes
+        self.aciertos = 0
+        self.fallos = 0
+        self._local = threading.local()
+
+    def _conexion(self):
+        # Las conexiones no cruzan un fork (gunicorn --preload). El archivo
+        # se crea con la primera conexión, no al importar la app
+        if getattr(self._local, "pid", None) != os.getpid():
+            conexion = sqlite3.connect(self.ruta, timeout=1)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.execute("PRAGMA synchronous=OFF")
+            with conexion:
+                conexion.execute(
+                    "CREATE TABLE IF NOT EXISTS fragmento ("
+                    "clave TEXT PRIMARY KEY, html TEXT NOT NULL, bytes INTEGER NOT NULL, usado REAL NOT NULL)"
+                )
+                conexion.execute("CREATE INDEX IF NOT EXISTS ix_fragmento_usado ON fragmento (usado)")
+            self._local.conexion = conexion
+            self._local.pid = os.getpid()
+        return self._local.conexion
+
+    def obtener(self, clave):
+        try:
+            with self._conexion() as conexion:
+                fila = conexion.execute("SELECT html, usado FROM fragmento WHERE clave = ?", (clave,)).fetchone()
+                if fila and fila[1] < time.time() - FRAGMENTOS_USO_SEGUNDOS:
+                    # Marca de uso para el LRU, como mucho una escritura por minuto
+                    conexion.execute("UPDATE fragmento SET usado = ? WHERE clave = ?", (time.time(), clave))
+        except sqlite3.Error:
+            fila = None
+        if fila is None:
+            self.fallos += 1
+            return None
+        self.aciertos += 1
+        return fila[0]
+
+    def guardar(self, clave, html):
+        tamano = len(html.encode("utf-8"))
+        if tamano > self.max_bytes:
+            return
+        try:
+            with self._conexion() as conexion:
+                conexion.execute(
+                    "INSERT OR REPLACE INTO fragmento (clave, html, bytes, usado) VALUES (?, ?, ?, ?)",
+                    (clave, html, tamano, time.time())
+                )
+                total, entradas = conexion.execute("SELECT COALESCE(SUM(bytes), 0), COUNT(*) FROM fragmento").fetchone()
+                if total > self.max_bytes:
+                    # Se va la cuarta parte menos usada
+                    conexion.execute(
+                        "DELETE FROM fragmento WHERE clave IN "
+                        "(SELECT clave FROM fragmento ORDER BY usado LIMIT ?)",
+                        (max(1, entradas // 4),)
+                    )
+        except sqlite3.Error:
+            pass
+
+    def limpiar(self):
+        try:
+            with self._conexion() as conexion:
+                conexion.execute("DELETE FROM fragmento")
+        except sqlite3.Error:
+            pass
+
+    def estadisticas(self):
+        total = self.aciertos + self.fallos
+        try:
+            entradas, tamano = self._conexion().execute(
+                "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM fragmento"
+            ).fetchone()
+        except sqlite3.Error:
+            entradas, tamano = None, None
+        return {
+            "motor": "sqlite",
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": round(self.aciertos / total, 4) if total else 0.0,
+            "entradas": entradas,
+            "bytes": tamano,
+        }
+
+
+def crear_cache(instance_path):
+    if FRAGMENTOS_CACHE == "no":
+        return None
+    max_bytes = int(FRAGMENTOS_CACHE_MB * 1024 * 1024)
+    if FRAGMENTOS_CACHE == "sqlite":
+        return CacheSqlite(os.path.join(instance_path, "fragmentos.db"), max_bytes)
+    return CacheMemoria(max_bytes)
+
+# ================= USO DESDE LAS VISTAS =================
+def _versiones_de(tablas):
+    # Una consulta por petición aunque la página tenga varios fragmentos
+    conocidas = g.setdefault("versiones_tablas", {})
+    faltan = [t for t in tablas if t not in conocidas]
+    if faltan:
+        actuales = versiones([ambito_tabla(t) for t in faltan])
+        for t in faltan:
+            conocidas[t] = actuales.get(ambito_tabla(t), (0, None))[0]
+    return [(t, conocidas[t]) for t in tablas]
+
+
+def fragmento(nombre, tablas, parametros, cargar):
+    # HTML de templates/fragmentos/<nombre>.html. cargar() devuelve el
+    # contexto de la plantilla y solo se llama en un fallo del cache.
+    # parametros: todo lo demás que cambia el HTML (página, filtros, ciclo)
+    cache = current_app.extensions.get("cache_fragmentos")
+    plantilla = f"fragmentos/{nombre}.html"
+    if cache is None:
+        return Markup(render_template(plantilla, **parametros, **cargar()))
+
+    firma = repr((nombre, sorted(parametros.items()), _versiones_de(tablas)))
+    clave = hashlib.sha256(firma.encode("utf-8")).hexdigest()
+    html = cache.obtener(clave)
+    if html is None:
+        html = render_template(plantilla, **parametros, **cargar())
+        cache.guardar(clave, html)
+    return Markup(html)
+
+
+def estadisticas_fragmentos():
+    cache = current_app.extensions.get("cache_fragmentos")
+    return cache.estadisticas() if cache else {"motor": "no"}
@@ -0,0 +1,147 @@
+from models import db, Alumno, Nota, Materia, ciclo_activo
+from estadisticas import APROBACION
+from operator import attrgetter, itemgetter
+import numpy as np
+import warnings
+import csv
+import io
+
+BLOQUES = 4
+
+
+def _posiciones(filas, ids):
+    # Posición de cada id en filas [(id, nombre)], -1 si no está. Solo los
+    # ids distintos pasan por Python; el resto es np.unique + indexado
+    unicos, inverso = np.unique(ids, return_inverse=True)
+    posicion = {fila_id: i for i, (fila_id, _) in enumerate(filas)}
+    return np.array([posicion.get(int(i), -1) for i in unicos], dtype=np.int64)[inverso]
+
+
+def _columna(valores, tipo, cantidad):
+    return np.fromiter(valores, dtype=tipo, count=cantidad)
+
+
+# ================= MATRIZ DE NOTAS DEL GRADO =================
+# puntajes[alumno, materia, bloque] con NaN donde no hay nota. Todos los
+# cálculos operan sobre el grado completo a la vez.
+class MatrizGrado:
+    def __init__(self, alumnos, materias, puntajes):
+        self.alumnos = alumnos    # [(id, nombre)]
+        self.materias = materias  # [(id, nombre)]
+        self.puntajes = puntajes
+
+    @classmethod
+    def desde_notas(cls, alumnos, materias, notas):
+        # notas: iterable de (alumno_id, materia_id, bloque, puntaje).
+        # Filas y columnas en el orden de alumnos y materias; el nombre solo
+        # se usa al presentar
+        notas = list(notas)
+        return cls.desde_columnas(alumnos, materias, *(
+            _columna(map(itemgetter(i), notas), tipo, len(notas))
+            for i, tipo in enumerate((np.int64, np.int64, np.int64, np.float64))
+        ))
+
+    @classmethod
+    def desde_columnas(cls, alumnos, materias, alumno_ids, materia_ids, bloques, puntajes):
+        # Una posición por nota en cada arreglo; las notas de alumnos o
+        # materias fuera de la lista, o de un bloque inválido, se ignoran
+        fila = _posiciones(alumnos, alumno_ids)
+        columna = _posiciones(materias, materia_ids)
+        bloque = bloques - 1
+        validas = (fila >= 0) & (columna >= 0) & (bloque >= 0) & (bloque < BLOQUES)
+
+        matriz = np.full((len(alumnos), len(materias), BLOQUES), np.nan)
+        matriz[fila[validas], columna[validas], bloque[validas]] = puntajes[validas]
+        return cls(alumnos, materias, matriz)
+
+    @classmethod
+    def desde_boletines(cls, boletines):
+        # boletines: [(AlumnoDatos, [NotaDatos])] como en exportacion.py
+        alumnos = [(a.id, a.nombre) for a, _ in boletines]
+        notas = [n for _, lista in boletines for n in lista]
+        alumno_ids = np.repeat(
+            _columna((a.id for a, _ in boletines), np.int64, len(boletines)),
+            _columna((len(lista) for _, lista in boletines), np.int64, len(boletines))
+        )
+        materia_ids = _columna(map(attrgetter("materia_id"), notas), np.int64, len(notas))
+
+        # Un nombre por materia, el de su primera nota; orden alfabético
+        # para presentación estable
+        ids, primeras = np.unique(materia_ids, return_index=True)
+        materias = sorted(((int(m), notas[i].materia) for m, i in zip(ids, primeras)), key=lambda m: (m[1], m[0]))
+        return cls.desde_columnas(
+            alumnos, materias, alumno_ids, materia_ids,
+            _columna(map(attrgetter("bloque"), notas), np.int64, len(notas)),
+            _columna(map(attrgetter("puntaje"), notas), np.float64, len(notas))
+        )
+
+    # ================= CÁLCULOS =================
+    @property
+    def cursadas(self):
+        # (alumno, materia) con al menos una nota
+        return ~np.isnan(self.puntajes).all(axis=2)
+
+    @property
+    def bloques_faltantes(self):
+        return np.where(self.cursadas, np.isnan(self.puntajes).sum(axis=2), 0)
+
+    def promedios(self, ignorar_faltantes=False):
+        # Por defecto igual que el boletín: bloque faltante = 0, se divide entre 4
+        if ignorar_faltantes:
+            cantidad = (~np.isnan(self.puntajes)).sum(axis=2)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                resultado = np.nansum(self.puntajes, axis=2) / cantidad
+        else:
+            resultado = np.nansum(self.puntajes, axis=2) / BLOQUES
+        return np.where(self.cursadas, np.round(resultado, 2), np.nan)
+
+    def promedio_general(self, ignorar_faltantes=False):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return np.round(np.nanmean(self.promedios(ignorar_faltantes), axis=1), 2)
+
+    def aprobados(self, umbral=APROBACION):
+        return self.cursadas & (np.nan_to_num(self.promedios(), nan=-1) >= umbral)
+
+    def percentiles(self, q=(25, 50, 75)):
+        # Una fila por percentil, una columna por materia
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            return np.round(np.nanpercentile(self.promedios(), q, axis=0), 2)
+
+    def ranking(self):
+        generales = self.promedio_general()
+        orden = np.argsort(-np.nan_to_num(generales, nan=-1), kind="stable")
+        return [(self.alumnos[i], generales[i]) for i in orden]
+
+# ================= RESUMEN EN CSV =================
+def resumen_csv(matriz):
+    promedios = matriz.promedios()
+    generales = matriz.promedio_general()
+    reprobadas = (matriz.cursadas & ~matriz.aprobados()).sum(axis=1)
+
+    salida = io.StringIO()
+    escritor = csv.writer(salida)
+    escritor.writerow(["Alumno", *(nombre for _, nombre in matriz.materias), "Promedio general", "Materias reprobadas"])
+    for i, (_, nombre) in enumerate(matriz.alumnos):
+        escritor.writerow([
+            nombre,
+            *("" if np.isnan(p) else p for p in promedios[i]),
+            "" if np.isnan(generales[i]) else generales[i],
+            int(reprobadas[i])
+        ])
+    return salida.getvalue().encode("utf-8-sig")
+
+# ================= CARGA DESDE LA BD =================
+def cargar_matriz(grado_id, ciclo=None):
+    ciclo = ciclo or ciclo_activo()
+    alumnos = db.session.query(Alumno.id, Alumno.nombre)\
+        .filter(Alumno.ciclo == ciclo, Alumno.grado_id == grado_id).order_by(Alumno.nombre).all()
+    notas = db.session.query(Nota.alumno_id, Nota.materia_id, Nota.bloque, Nota.puntaje)\
+        .join(Alumno, Nota.alumno_id == Alumno.id)\
+        .filter(Alumno.ciclo == ciclo, Alumno.grado_id == grado_id)
+    # Solo las materias con notas, en orden alfabético
+    materias = db.session.query(Materia.id, Materia.nombre)\
+        .filter(Materia.id.in_(notas.with_entities(Nota.materia_id)))\
+        .order_by(Materia.nombre, Materia.id).all()
+    return MatrizGrado.desde_notas([tuple(a) for a in alumnos], [tuple(m) for m in materias], notas)
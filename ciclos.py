@@ -0,0 +1,165 @@
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import create_engine, select, insert, delete, update, func
+from models import (
+    db, CicloEscolar, Usuario, Grado, Materia, Alumno, Nota, Asignacion,
+    ResumenAlumnoMateria, ResumenGradoMateria, olvidar_ciclo_activo
+)
+from versiones import incrementar, ambito_tabla, MODELOS_VERSIONADOS
+from exportacion import AlumnoDatos, NotaDatos
+import click
+import stat
+import os
+
+# ================= CICLOS ESCOLARES =================
+# Abrir un ciclo nuevo cierra el activo (queda de solo lectura). Un ciclo
+# cerrado se puede archivar: sus filas pasan a un SQLite propio en
+# instance/archivo y salen de las tablas de trabajo; sus boletines se
+# siguen leyendo de ese archivo.
+t_ciclo = CicloEscolar.__table__
+
+# Padres primero para copiar; al borrar se recorren al revés
+TABLAS_CICLO = [t.__table__ for t in (Alumno, Asignacion, Nota, ResumenAlumnoMateria, ResumenGradoMateria)]
+TABLAS_REFERENCIA = [t.__table__ for t in (Usuario, Grado, Materia)]
+LOTE_ARCHIVO = 1000
+
+
+def carpeta_archivo():
+    return os.path.join(current_app.instance_path, "archivo")
+
+
+def ruta_archivo(anio):
+    return os.path.join(carpeta_archivo(), f"ciclo_{anio}.db")
+
+
+def listar_ciclos():
+    alumnos = dict(db.session.query(Alumno.ciclo, func.count()).group_by(Alumno.ciclo).all())
+    return [
+        (ciclo, alumnos.get(ciclo.anio, 0))
+        for ciclo in CicloEscolar.query.order_by(CicloEscolar.anio.desc())
+    ]
+
+# ================= ABRIR CICLO =================
+def abrir_ciclo(anio):
+    # Devuelve un mensaje de error o None. Los demás workers ven el cambio
+    # al vencer su cache de ciclo_activo (CICLO_CACHE_TTL)
+    with db.engine.begin() as conexion:
+        if conexion.execute(select(t_ciclo.c.anio).where(t_ciclo.c.anio == anio)).first():
+            return f"El ciclo {anio} ya existe"
+        conexion.execute(update(t_ciclo).where(t_ciclo.c.estado == "activo").values(estado="cerrado"))
+        conexion.execute(insert(t_ciclo).values(anio=anio, estado="activo"))
+    olvidar_ciclo_activo()
+    return None
+
+# ================= ARCHIVAR CICLO =================
+def _copiar(origen, destino, anio):
+    for tabla in TABLAS_REFERENCIA + TABLAS_CICLO:
+        consulta = select(tabla)
+        if "ciclo" in tabla.c:
+            consulta = consulta.where(tabla.c.ciclo == anio)
+        resultado = origen.execution_options(yield_per=LOTE_ARCHIVO).execute(consulta)
+        for filas in resultado.partitions():
+            lote = [fila._asdict() for fila in filas]
+            if tabla.name == "usuario":
+                # El archivo no necesita credenciales
+                lote = [{**fila, "password": ""} for fila in lote]
+            destino.execute(insert(tabla), lote)
+
+
+def archivar_ciclo(anio):
+    # Devuelve un mensaje de error o None
+    ciclo = db.session.get(CicloEscolar, anio)
+    if ciclo is None:
+        return f"El ciclo {anio} no existe"
+    if ciclo.estado != "cerrado":
+        return "Solo se pueden archivar ciclos cerrados"
+
+    os.makedirs(carpeta_archivo(), exist_ok=True)
+    ruta = ruta_archivo(anio)
+    if os.path.exists(ruta):
+        # Resto de un intento interrumpido: la BD principal sigue intacta
+        os.chmod(ruta, stat.S_IRUSR | stat.S_IWUSR)
+        os.remove(ruta)
+
+    destino = create_engine("sqlite:///" + ruta)
+    try:
+        db.metadata.create_all(destino, tables=TABLAS_REFERENCIA + TABLAS_CICLO)
+        with db.engine.connect() as origen, destino.begin() as copia:
+            _copiar(origen, copia, anio)
+        with destino.connect() as copia:
+            # Sin WAL: un archivo de solo lectura no puede crear el -shm
+            copia.exec_driver_sql("PRAGMA journal_mode=DELETE")
+    finally:
+        destino.dispose()
+
+    # Solo se borra de la BD principal cuando la copia quedó completa
+    with db.engine.begin() as conexion:
+        for tabla in reversed(TABLAS_CICLO):
+            conexion.execute(delete(tabla).where(tabla.c.ciclo == anio))
+        conexion.execute(update(t_ciclo).where(t_ciclo.c.anio == anio).values(estado="archivado"))
+        incrementar(conexion, [ambito_tabla(m.__tablename__) for m in MODELOS_VERSIONADOS])
+    db.session.expire(ciclo)
+
+    os.chmod(ruta, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+    return None
+
+
+def abrir_archivo(anio):
+    # Motor de solo lectura sobre un ciclo archivado (mismo esquema)
+    return create_engine(f"sqlite:///file:{ruta_archivo(anio)}?mode=ro&uri=true")
+
+# ================= LECTURA DE CICLOS ARCHIVADOS =================
+def boletines_archivados(anio):
+    # [(AlumnoDatos, [NotaDatos])] del ciclo, en el mismo orden que
+    # consultas.alumnos_con_notas: solo alumnos con notas
+    t_alumno, t_nota = Alumno.__table__, Nota.__table__
+    t_grado, t_materia = Grado.__table__, Materia.__table__
+
+    motor = abrir_archivo(anio)
+    try:
+        with motor.connect() as conexion:
+            notas_por_alumno = {}
+            for alumno_id, *nota in conexion.execute(
+                select(t_nota.c.alumno_id, t_nota.c.materia_id, t_materia.c.nombre, t_nota.c.bloque, t_nota.c.puntaje)
+                .join_from(t_nota, t_materia, t_nota.c.materia_id == t_materia.c.id)
+                .order_by(t_nota.c.id)
+            ):
+                notas_por_alumno.setdefault(alumno_id, []).append(NotaDatos(*nota))
+
+            alumnos = conexion.execute(
+                select(t_alumno.c.id, t_alumno.c.nombre, t_grado.c.nombre, t_alumno.c.ciclo)
+                .join_from(t_alumno, t_grado, t_alumno.c.grado_id == t_grado.c.id)
+                .order_by(t_alumno.c.grado_id, t_alumno.c.nombre)
+            )
+            return [
+                (AlumnoDatos(*alumno), notas_por_alumno[alumno.id])
+                for alumno in alumnos
+                if alumno.id in notas_por_alumno
+            ]
+    finally:
+        motor.dispose()
+
+# ================= COMANDOS CLI =================
+@click.group("ciclo")
+def comando_ciclo():
+    pass
+
+
+@comando_ciclo.command("abrir")
+@click.argument("anio", type=int)
+@with_appcontext
+def comando_abrir(anio):
+    error = abrir_ciclo(anio)
+    if error:
+        raise click.ClickException(error)
+    click.echo(f"Ciclo {anio} activo ✅")
+
+
+@comando_ciclo.command("archivar")
+@click.argument("anio", type=int)
+@with_appcontext
+def comando_archivar(anio):
+    error = archivar_ciclo(anio)
+    if error:
+        raise click.ClickException(error)
+    click.echo(f"Ciclo {anio} archivado en {ruta_archivo(anio)} ✅")
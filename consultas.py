@@ -0,0 +1,192 @@
+from flask import g, has_request_context
+from flask_login import current_user
+from sqlalchemy import event, tuple_
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import joinedload, contains_eager
+from collections import defaultdict
+from datetime import datetime
+from models import db, Usuario, Alumno, Nota, Grado, Materia, Asignacion, Auditoria, ciclo_activo
+import base64
+import json
+import os
+
+PAGINA = 50
+# X-Query-Count y Server-Timing revelan cuánto trabajo hace cada ruta:
+# solo se envían a sesiones de admin, o a todos con CABECERAS_DIAGNOSTICO=1
+CABECERAS_DIAGNOSTICO = os.environ.get("CABECERAS_DIAGNOSTICO", "0") == "1"
+
+# ================= CONTADOR DE CONSULTAS =================
+@event.listens_for(Engine, "before_cursor_execute")
+def _contar_consulta(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.consultas = g.get("consultas", 0) + 1
+
+
+def consultas_en_peticion():
+    return g.get("consultas", 0) if has_request_context() else 0
+
+
+def cabeceras_diagnostico():
+    return CABECERAS_DIAGNOSTICO or (current_user.is_authenticated and current_user.rol == "admin")
+
+
+def registrar_contador_consultas(app):
+    @app.after_request
+    def _cabecera_consultas(response):
+        # Se cuenta antes de consultar la sesión, que puede cargar al usuario
+        consultas = consultas_en_peticion()
+        if cabeceras_diagnostico():
+            response.headers["X-Query-Count"] = str(consultas)
+        return response
+
+# ================= ALUMNOS =================
+# Todas las lecturas se limitan a un ciclo (por defecto el activo) y usan
+# los índices que empiezan por ciclo
+def alumnos_por_grado(grado_ids, ciclo=None):
+    # Una sola consulta con IN para todos los grados pedidos
+    agrupados = {grado_id: [] for grado_id in grado_ids}
+    if not grado_ids:
+        return agrupados
+
+    ciclo = ciclo or ciclo_activo()
+    alumnos = Alumno.query.filter(Alumno.ciclo == ciclo, Alumno.grado_id.in_(grado_ids))\
+        .order_by(Alumno.grado_id, Alumno.nombre).all()
+
+    for alumno in alumnos:
+        agrupados[alumno.grado_id].append(alumno)
+    return agrupados
+
+# ================= ASIGNACIONES =================
+def asignaciones_de_docente(docente_id, grado_id=None, ciclo=None):
+    consulta = Asignacion.query.options(joinedload(Asignacion.materia))\
+        .filter_by(ciclo=ciclo or ciclo_activo(), docente_id=docente_id)
+    if grado_id is not None:
+        consulta = consulta.filter_by(grado_id=grado_id)
+    return consulta.all()
+
+
+def grados_de(asignaciones):
+    # Grados distintos de las asignaciones, por nombre
+    return sorted({a.grado_id: a.grado for a in asignaciones}.values(), key=lambda g: g.nombre)
+
+# ================= NOTAS =================
+def alumnos_con_notas(grado_id=None, ciclo=None):
+    # Alumnos y notas en dos consultas; solo se devuelven alumnos con notas
+    ciclo = ciclo or ciclo_activo()
+    alumnos = Alumno.query.filter(Alumno.ciclo == ciclo)
+    notas = Nota.query.join(Alumno, Nota.alumno_id == Alumno.id).filter(Nota.ciclo == ciclo)
+    if grado_id is not None:
+        alumnos = alumnos.filter(Alumno.grado_id == grado_id)
+        notas = notas.filter(Alumno.grado_id == grado_id)
+
+    notas_por_alumno = defaultdict(list)
+    for nota in notas.order_by(Nota.id):
+        notas_por_alumno[nota.alumno_id].append(nota)
+
+    return [
+        (alumno, notas_por_alumno[alumno.id])
+        for alumno in alumnos.order_by(Alumno.grado_id, Alumno.nombre)
+        if alumno.id in notas_por_alumno
+    ]
+
+# ================= PAGINACIÓN POR CURSOR (KEYSET) =================
+# El cursor guarda los valores de orden de la última fila mostrada; la
+# siguiente página empieza justo después usando el índice, sin OFFSET.
+def _codificar_cursor(valores):
+    texto = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in valores])
+    return base64.urlsafe_b64encode(texto.encode("utf-8")).decode("ascii")
+
+
+def _decodificar_cursor(cursor, columnas):
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError):
+        return None
+    if not isinstance(valores, list) or len(valores) != len(columnas):
+        return None
+    # Cursor alterado (fecha inválida, tipo equivocado): se vuelve a la primera página
+    try:
+        return [_valor_cursor(c, v) for c, v in zip(columnas, valores)]
+    except (ValueError, TypeError):
+        return None
+
+
+def _valor_cursor(columna, valor):
+    tipo = columna.type.python_type
+    if tipo is datetime:
+        return datetime.fromisoformat(valor)
+    if isinstance(valor, bool) or not isinstance(valor, (int, float) if tipo is float else tipo):
+        raise TypeError(f"{columna.key}: se esperaba {tipo.__name__}")
+    return valor
+
+
+def paginar(consulta, columnas, cursor=None, limite=None, descendente=False):
+    limite = limite or PAGINA
+    valores = _decodificar_cursor(cursor, columnas) if cursor else None
+    if valores:
+        clave = tuple_(*columnas)
+        consulta = consulta.filter(clave < tuple(valores) if descendente else clave > tuple(valores))
+
+    orden = [c.desc() if descendente else c for c in columnas]
+    filas = consulta.order_by(*orden).limit(limite + 1).all()
+
+    siguiente = None
+    if len(filas) > limite:
+        filas = filas[:limite]
+        siguiente = _codificar_cursor([getattr(filas[-1], c.key) for c in columnas])
+    return filas, siguiente
+
+# ================= LISTADOS =================
+def _contiene(busqueda):
+    # Patrón ILIKE con % y _ del usuario como texto literal (escape="\\")
+    escapado = busqueda.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escapado}%"
+
+
+def grados_registrados(ciclo=None):
+    grados = db.session.query(Alumno.grado_id).filter(Alumno.ciclo == (ciclo or ciclo_activo()))
+    return Grado.query.filter(Grado.id.in_(grados)).order_by(Grado.nombre).all()
+
+
+def materias_ordenadas():
+    return Materia.query.join(Materia.grado).options(contains_eager(Materia.grado))\
+        .order_by(Grado.nombre, Materia.nombre).all()
+
+
+def pagina_alumnos(grado_id=None, busqueda=None, cursor=None, ciclo=None):
+    consulta = Alumno.query.filter(Alumno.ciclo == (ciclo or ciclo_activo()))
+    if grado_id:
+        consulta = consulta.filter(Alumno.grado_id == grado_id)
+    if busqueda:
+        consulta = consulta.filter(Alumno.nombre.ilike(_contiene(busqueda), escape="\\"))
+    return paginar(consulta, [Alumno.grado_id, Alumno.nombre], cursor)
+
+
+def grados_con_asignaciones(ciclo=None):
+    grados = db.session.query(Asignacion.grado_id).filter(Asignacion.ciclo == (ciclo or ciclo_activo()))
+    return Grado.query.filter(Grado.id.in_(grados)).order_by(Grado.nombre).all()
+
+
+def pagina_asignaciones(grado_id=None, busqueda=None, cursor=None, ciclo=None):
+    # busqueda: por nombre del docente o de la materia
+    consulta = Asignacion.query.join(Asignacion.docente).join(Asignacion.materia).options(
+        contains_eager(Asignacion.docente),
+        contains_eager(Asignacion.materia)
+    ).filter(Asignacion.ciclo == (ciclo or ciclo_activo()))
+    if grado_id:
+        consulta = consulta.filter(Asignacion.grado_id == grado_id)
+    if busqueda:
+        patron = _contiene(busqueda)
+        consulta = consulta.filter(
+            Usuario.nombre.ilike(patron, escape="\\") | Materia.nombre.ilike(patron, escape="\\")
+        )
+    return paginar(consulta, [Asignacion.grado_id, Asignacion.id], cursor)
+
+
+def pagina_auditoria(usuario_id=None, accion=None, cursor=None):
+    consulta = Auditoria.query.options(joinedload(Auditoria.usuario))
+    if usuario_id:
+        consulta = consulta.filter(Auditoria.usuario_id == usuario_id)
+    if accion:
+        consulta = consulta.filter(Auditoria.accion == accion)
+    return paginar(consulta, [Auditoria.fecha, Auditoria.id], cursor, descendente=True)
@@ -0,0 +1,144 @@
+from werkzeug.security import generate_password_hash, check_password_hash
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as EsperaAgotada
+from functools import cache
+import threading
+import time
+import os
+
+# ================= CONFIGURACIÓN =================
+# PASSWORD_METODO acepta los métodos de Werkzeug con su costo, por ejemplo
+# "scrypt:32768:8:1" o "pbkdf2:sha256:600000". Los hashes guardados con
+# otros parámetros se rehacen en el siguiente ingreso correcto.
+PASSWORD_METODO = os.environ.get("PASSWORD_METODO", "scrypt")
+PASSWORD_HILOS = int(os.environ.get("PASSWORD_HILOS", 2))
+PASSWORD_COLA = int(os.environ.get("PASSWORD_COLA", 8))
+PASSWORD_ESPERA = float(os.environ.get("PASSWORD_ESPERA", 10))
+
+LOGIN_FALLOS_CUENTA = int(os.environ.get("LOGIN_FALLOS_CUENTA", 5))
+LOGIN_FALLOS_IP = int(os.environ.get("LOGIN_FALLOS_IP", 30))
+LOGIN_VENTANA = int(os.environ.get("LOGIN_VENTANA", 900))
+LIMITADOR_MAX_CLAVES = 10000
+
+# ================= HASH DE CONTRASEÑAS =================
+def cifrar(password):
+    return generate_password_hash(password, method=PASSWORD_METODO)
+
+
+# "scrypt" y "pbkdf2" se guardan con sus parámetros explícitos: se toma el
+# prefijo real que produce Werkzeug. Se calcula en el primer ingreso y no al
+# importar, para no pagar un hash en cada arranque de worker o script.
+@cache
+def _prefijo():
+    return cifrar("").split("$", 1)[0]
+
+
+def necesita_rehash(hash_guardado):
+    return hash_guardado.split("$", 1)[0] != _prefijo()
+
+# ================= POOL DE VERIFICACIÓN =================
+# hashlib suelta el GIL durante scrypt/pbkdf2: unos pocos hilos bastan para
+# no frenar al resto de las peticiones. Con la cola llena se responde
+# "ocupado" enseguida en vez de acumular trabajo de CPU.
+_pool = ThreadPoolExecutor(max_workers=PASSWORD_HILOS, thread_name_prefix="credenciales")
+_cupos = threading.BoundedSemaphore(PASSWORD_HILOS + PASSWORD_COLA)
+
+
+def _en_pool(funcion, *args):
+    # Resultado de la función, o None si el pool está saturado
+    if not _cupos.acquire(blocking=False):
+        return None
+    try:
+        futuro = _pool.submit(funcion, *args)
+    except RuntimeError:
+        _cupos.release()
+        raise
+    futuro.add_done_callback(lambda f: _cupos.release())
+    try:
+        return futuro.result(timeout=PASSWORD_ESPERA)
+    except EsperaAgotada:
+        return None
+
+
+def verificar(hash_guardado, password):
+    # True/False, o None si no hubo capacidad para verificar
+    return _en_pool(check_password_hash, hash_guardado, password)
+
+
+def cifrar_en_pool(password):
+    return _en_pool(cifrar, password)
+
+# ================= LÍMITE DE INTENTOS FALLIDOS =================
+# Por proceso, como los demás caches. Se consulta antes de calcular el hash:
+# un atacante bloqueado no consume CPU de verificación.
+class Limitador:
+    def __init__(self, maximo, ventana):
+        self.maximo = maximo
+        self.ventana = ventana
+        self._fallos = {}
+        self._candado = threading.Lock()
+
+    def espera(self, clave):
+        # Segundos que faltan para volver a intentar (0 si puede)
+        ahora = time.monotonic()
+        with self._candado:
+            entrada = self._fallos.get(clave)
+            if not entrada:
+                return 0
+            inicio, cuenta = entrada
+            if inicio + self.ventana <= ahora:
+                del self._fallos[clave]
+                return 0
+            return inicio + self.ventana - ahora if cuenta >= self.maximo else 0
+
+    def fallo(self, clave):
+        ahora = time.monotonic()
+        with self._candado:
+            inicio, cuenta = self._fallos.get(clave, (ahora, 0))
+            if inicio + self.ventana <= ahora:
+                inicio, cuenta = ahora, 0
+            self._fallos[clave] = (inicio, cuenta + 1)
+            if len(self._fallos) > LIMITADOR_MAX_CLAVES:
+                self._purgar(ahora)
+
+    def reiniciar(self, clave):
+        with self._candado:
+            self._fallos.pop(clave, None)
+
+    def _purgar(self, ahora):
+        vigentes = {c: e for c, e in self._fallos.items() if e[0] + self.ventana > ahora}
+        if len(vigentes) > LIMITADOR_MAX_CLAVES:
+            # Se conservan las ventanas más recientes
+            recientes = sorted(vigentes.items(), key=lambda par: par[1][0])[-LIMITADOR_MAX_CLAVES // 2:]
+            vigentes = dict(recientes)
+        self._fallos = vigentes
+
+
+limitador_cuentas = Limitador(LOGIN_FALLOS_CUENTA, LOGIN_VENTANA)
+limitador_ips = Limitador(LOGIN_FALLOS_IP, LOGIN_VENTANA)
+
+# ================= AUTENTICACIÓN =================
+def autenticar(usuario, correo, password, ip):
+    # (resultado, error): resultado es "ok", "fallo", "bloqueado" u "ocupado".
+    # Si el hash usa parámetros viejos se reemplaza en el usuario; quien
+    # llama hace el commit.
+    cuenta = (correo or "").strip().lower()
+    espera = max(limitador_cuentas.espera(cuenta), limitador_ips.espera(ip))
+    if espera:
+        minutos = int(espera // 60) + 1
+        return "bloqueado", f"Demasiados intentos fallidos. Intente de nuevo en {minutos} min"
+
+    # Correo inexistente: no se calcula ningún hash
+    correcta = verificar(usuario.password, password) if usuario else False
+    if correcta is None:
+        return "ocupado", "El servidor está ocupado, intente de nuevo en unos segundos"
+    if not correcta:
+        limitador_cuentas.fallo(cuenta)
+        limitador_ips.fallo(ip)
+        return "fallo", "Credenciales incorrectas"
+
+    limitador_cuentas.reiniciar(cuenta)
+    if necesita_rehash(usuario.password):
+        nuevo = cifrar_en_pool(password)
+        if nuevo:
+            usuario.password = nuevo
+    return "ok", None
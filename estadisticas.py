@@ -0,0 +1,202 @@
+from sqlalchemy import event, select, func, delete, tuple_, inspect
+from sqlalchemy.orm import Session
+from collections import defaultdict
+from generar_boletin import promedio_final
+from basedatos import insert_upsert
+from models import db, Alumno, Nota, Grado, Materia, ResumenAlumnoMateria, ResumenGradoMateria, ciclo_activo
+import math
+
+# ================= RESÚMENES INCREMENTALES =================
+# Cada cambio de Nota recalcula solo los pares (alumno_id, materia_id)
+# afectados y aplica la diferencia a los totales de (ciclo, grado, materia).
+# Todas las claves son enteras.
+t_nota = Nota.__table__
+t_alumno = Alumno.__table__
+t_resumen = ResumenAlumnoMateria.__table__
+t_grado = ResumenGradoMateria.__table__
+
+RANGOS = (
+    (60, "rango_0_59"),
+    (70, "rango_60_69"),
+    (80, "rango_70_79"),
+    (90, "rango_80_89"),
+    (None, "rango_90_100"),
+)
+APROBACION = 60
+TAMANO_LOTE = 500
+
+
+def rango(promedio):
+    for limite, columna in RANGOS:
+        if limite is None or promedio < limite:
+            return columna
+
+
+def _aplicar(deltas, clave, ciclo, grado_id, promedio, signo):
+    d = deltas[(ciclo, grado_id, clave[1])]
+    d["alumnos"] += signo
+    d["suma_promedios"] += signo * promedio
+    d["suma_cuadrados"] += signo * promedio * promedio
+    d[rango(promedio)] += signo
+
+
+def _recalcular_lote(conexion, pares):
+    alumno_ids = {a for a, _ in pares}
+    materias = {m for _, m in pares}
+
+    # Bloquea a los alumnos antes de leer: dos transacciones sobre el mismo
+    # (alumno, materia) se turnan y la segunda ve las notas de la primera.
+    # NO KEY UPDATE no choca con el KEY SHARE que toma la FK al insertar la nota.
+    # SQLite ya serializa las escrituras y lo ignora.
+    conexion.execute(
+        select(t_alumno.c.id).where(t_alumno.c.id.in_(alumno_ids))
+        .order_by(t_alumno.c.id).with_for_update(key_share=True)
+    )
+
+    filas = conexion.execute(
+        select(
+            t_nota.c.alumno_id, t_nota.c.materia_id, t_alumno.c.ciclo, t_alumno.c.grado_id,
+            func.sum(t_nota.c.puntaje), func.count()
+        )
+        .select_from(t_nota.join(t_alumno, t_nota.c.alumno_id == t_alumno.c.id))
+        .where(t_nota.c.alumno_id.in_(alumno_ids), t_nota.c.materia_id.in_(materias))
+        .group_by(t_nota.c.alumno_id, t_nota.c.materia_id, t_alumno.c.ciclo, t_alumno.c.grado_id)
+    )
+    nuevos = {(a, m): (c, g, s, n) for a, m, c, g, s, n in filas if (a, m) in pares}
+
+    anteriores = {
+        (r.alumno_id, r.materia_id): (r.ciclo, r.grado_id, r.promedio)
+        for r in conexion.execute(
+            select(
+                t_resumen.c.alumno_id, t_resumen.c.materia_id, t_resumen.c.ciclo,
+                t_resumen.c.grado_id, t_resumen.c.promedio
+            )
+            .where(tuple_(t_resumen.c.alumno_id, t_resumen.c.materia_id).in_(list(pares)))
+        )
+    }
+
+    # ================= ALUMNO / MATERIA =================
+    sobrantes = [clave for clave in anteriores if clave not in nuevos]
+    if sobrantes:
+        conexion.execute(
+            delete(t_resumen).where(tuple_(t_resumen.c.alumno_id, t_resumen.c.materia_id).in_(sobrantes))
+        )
+    if nuevos:
+        sentencia = insert_upsert(conexion, t_resumen)
+        conexion.execute(
+            sentencia.on_conflict_do_update(
+                index_elements=["alumno_id", "materia_id"],
+                set_={col: sentencia.excluded[col] for col in ("ciclo", "grado_id", "suma", "bloques", "promedio")}
+            ),
+            [
+                {
+                    "alumno_id": a, "materia_id": m, "ciclo": c, "grado_id": g, "suma": s,
+                    "bloques": n, "promedio": promedio_final(s)
+                }
+                for (a, m), (c, g, s, n) in sorted(nuevos.items())
+            ]
+        )
+
+    # ================= GRADO / MATERIA =================
+    deltas = defaultdict(lambda: defaultdict(int))
+    for clave in pares:
+        if clave in anteriores:
+            _aplicar(deltas, clave, *anteriores[clave], -1)
+        if clave in nuevos:
+            ciclo, grado_id, suma, _ = nuevos[clave]
+            _aplicar(deltas, clave, ciclo, grado_id, promedio_final(suma), 1)
+
+    # Suma atómica sobre la fila existente; la crea si es la primera
+    columnas = ["alumnos", "suma_promedios", "suma_cuadrados"] + [col for _, col in RANGOS]
+    for (ciclo, grado_id, materia_id), d in sorted(deltas.items()):
+        if not any(d.values()):
+            continue
+        sentencia = insert_upsert(conexion, t_grado).values(
+            ciclo=ciclo, grado_id=grado_id, materia_id=materia_id, **{col: d[col] for col in columnas}
+        )
+        conexion.execute(sentencia.on_conflict_do_update(
+            index_elements=["ciclo", "grado_id", "materia_id"],
+            set_={col: t_grado.c[col] + sentencia.excluded[col] for col in columnas if d[col]}
+        ))
+
+
+def recalcular(conexion, pares):
+    pares = sorted(set(pares))
+    for i in range(0, len(pares), TAMANO_LOTE):
+        _recalcular_lote(conexion, set(pares[i:i + TAMANO_LOTE]))
+
+
+def reconstruir(conexion):
+    # Recalcula todo desde cero (backfill o reparación)
+    conexion.execute(delete(t_grado))
+    conexion.execute(delete(t_resumen))
+    pares = [tuple(r) for r in conexion.execute(
+        select(t_nota.c.alumno_id, t_nota.c.materia_id).distinct()
+    )]
+    recalcular(conexion, pares)
+
+# ================= ACTUALIZACIÓN AUTOMÁTICA =================
+def _pares_de(nota):
+    pares = {(nota.alumno_id, nota.materia_id)}
+    estado = inspect(nota)
+    anteriores_alumno = estado.attrs.alumno_id.history.deleted or [nota.alumno_id]
+    anteriores_materia = estado.attrs.materia_id.history.deleted or [nota.materia_id]
+    for alumno_id in anteriores_alumno:
+        for materia in anteriores_materia:
+            pares.add((alumno_id, materia))
+    return pares
+
+
+@event.listens_for(Session, "after_flush")
+def _actualizar_resumenes(sesion, contexto):
+    pares = set()
+    for obj in list(sesion.new) + list(sesion.dirty) + list(sesion.deleted):
+        if isinstance(obj, Nota):
+            pares |= _pares_de(obj)
+    if pares:
+        recalcular(sesion.connection(), pares)
+
+# ================= LECTURA =================
+def estadisticas_grado(grado_id, ciclo=None):
+    # Dos consultas sobre los resúmenes, sin importar cuántas notas haya
+    ciclo = ciclo or ciclo_activo()
+    materias = []
+    resumenes = db.session.query(ResumenGradoMateria, Materia.nombre)\
+        .join(Materia, Materia.id == ResumenGradoMateria.materia_id)\
+        .filter(ResumenGradoMateria.ciclo == ciclo, ResumenGradoMateria.grado_id == grado_id)\
+        .order_by(Materia.nombre)
+    for r, nombre in resumenes:
+        if not r.alumnos:
+            continue
+        media = r.suma_promedios / r.alumnos
+        varianza = max(0.0, r.suma_cuadrados / r.alumnos - media * media)
+        materias.append({
+            "materia": nombre,
+            "materia_id": r.materia_id,
+            "alumnos": r.alumnos,
+            "promedio": round(media, 2),
+            "desviacion": round(math.sqrt(varianza), 2),
+            "reprobados": r.rango_0_59,
+            "distribucion": [(columna, getattr(r, columna)) for _, columna in RANGOS],
+        })
+
+    filas = db.session.query(
+        Alumno.id, Alumno.nombre,
+        func.avg(ResumenAlumnoMateria.promedio),
+        func.count()
+    ).join(ResumenAlumnoMateria, ResumenAlumnoMateria.alumno_id == Alumno.id)\
+        .filter(ResumenAlumnoMateria.ciclo == ciclo, ResumenAlumnoMateria.grado_id == grado_id)\
+        .group_by(Alumno.id, Alumno.nombre)\
+        .order_by(func.avg(ResumenAlumnoMateria.promedio).desc(), Alumno.nombre)
+
+    ranking = [
+        {"posicion": i, "alumno_id": a, "nombre": n, "promedio": round(p, 2), "materias": c}
+        for i, (a, n, p, c) in enumerate(filas, start=1)
+    ]
+    return materias, ranking
+
+
+def grados_con_resumen(ciclo=None):
+    ciclo = ciclo or ciclo_activo()
+    grados = db.session.query(ResumenGradoMateria.grado_id).filter(ResumenGradoMateria.ciclo == ciclo)
+    return Grado.query.filter(Grado.id.in_(grados)).order_by(Grado.nombre).all()
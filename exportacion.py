@@ -0,0 +1,173 @@
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from collections import namedtuple
+from generar_boletin import generar_boletin_pdf, nombre_boletin
+from cache_boletines import cache_boletines, clave_boletin
+from calculo import MatrizGrado, resumen_csv
+from metricas import metricas, fase, recolectar_fases
+import multiprocessing
+import zipfile
+import time
+import os
+
+# ================= DATOS PARA LOS PROCESOS =================
+# Los procesos del pool no tienen sesión de BD: se les envían copias planas
+AlumnoDatos = namedtuple("AlumnoDatos", ["id", "nombre", "grado", "ciclo"])
+NotaDatos = namedtuple("NotaDatos", ["materia_id", "materia", "bloque", "puntaje"])
+
+
+def copiar_alumno(alumno, notas):
+    return (
+        AlumnoDatos(alumno.id, alumno.nombre, alumno.grado.nombre, alumno.ciclo),
+        [NotaDatos(n.materia_id, n.materia.nombre, n.bloque, n.puntaje) for n in notas]
+    )
+
+# ================= POOL DE PROCESOS =================
+# Por worker de gunicorn: con 4 workers hay hasta 4 x EXPORT_WORKERS procesos
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", 2))
+
+_pool = None
+
+
+def _contexto():
+    # El worker tiene hilos (auditoría, trabajos): un fork copiaría candados
+    # tomados por ellos. forkserver crea los procesos desde uno sin hilos;
+    # donde no existe (Windows) se usa spawn.
+    metodos = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in metodos else "spawn")
+
+
+def obtener_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=EXPORT_WORKERS, mp_context=_contexto())
+    return _pool
+
+
+def _renderizar(alumno, notas):
+    # Devuelve (pdf, fases): las fases medidas en el hijo se suman en el padre
+    with recolectar_fases() as fases:
+        pdf = generar_boletin_pdf(alumno, notas).getvalue()
+    return pdf, fases
+
+
+def _nombre_en_zip(alumno, carpeta):
+    nombre = nombre_boletin(alumno)
+    if carpeta:
+        nombre = f"{alumno.grado}/{nombre}"
+    return nombre
+
+def _resumenes(boletines, carpeta):
+    # Promedios de todo el grado calculados en forma vectorizada
+    por_grado = {}
+    for alumno, notas in boletines:
+        por_grado.setdefault(alumno.grado, []).append((alumno, notas))
+
+    for grado, lista in por_grado.items():
+        nombre = f"resumen_{grado.replace(' ', '_')}.csv"
+        if carpeta:
+            nombre = f"{grado}/{nombre}"
+        yield nombre, resumen_csv(MatrizGrado.desde_boletines(lista))
+
+# ================= ZIP EN STREAMING =================
+class _SalidaZip:
+    # Destino no posicionable: zipfile escribe con descriptores de datos
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, datos):
+        self.buffer += datos
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = bytes(self.buffer)
+        self.buffer.clear()
+        return datos
+
+
+def generar_zip(boletines, carpeta_por_grado=False, al_avanzar=None):
+    # boletines: lista de (AlumnoDatos, [NotaDatos]) ya copiados de la BD
+    total = len(boletines)
+    hechos = 0
+    # Los boletines sin cambios salen del cache; solo el resto va al pool
+    cacheados = []
+    por_renderizar = []
+    for alumno, notas in boletines:
+        clave = clave_boletin(alumno, notas)
+        pdf = cache_boletines.obtener(clave)
+        if pdf is not None:
+            cacheados.append((alumno, pdf))
+        else:
+            por_renderizar.append((alumno, notas, clave))
+
+    pendientes = iter(por_renderizar)
+    en_curso = {}
+    limite = EXPORT_WORKERS * 2
+
+    def encolar():
+        if not por_renderizar:
+            return
+        pool = obtener_pool()
+        for alumno, notas, clave in pendientes:
+            en_curso[pool.submit(_renderizar, alumno, notas)] = (alumno, clave)
+            if len(en_curso) >= limite:
+                break
+
+    # Tiempo esperando al pool vs. escribiendo el ZIP, para métricas
+    tiempos = {"espera_render": 0.0, "escritura": 0.0}
+
+    def escribir(nombre, contenido):
+        inicio = time.perf_counter()
+        zipf.writestr(nombre, contenido)
+        tiempos["escritura"] += time.perf_counter() - inicio
+
+    salida = _SalidaZip()
+    try:
+        with zipfile.ZipFile(salida, "w") as zipf:
+            encolar()
+            for alumno, pdf in cacheados:
+                escribir(_nombre_en_zip(alumno, carpeta_por_grado), pdf)
+                hechos += 1
+                if al_avanzar:
+                    al_avanzar(hechos, total)
+                yield salida.vaciar()
+
+            while en_curso:
+                inicio = time.perf_counter()
+                listos, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+                tiempos["espera_render"] += time.perf_counter() - inicio
+                for futuro in listos:
+                    alumno, clave = en_curso.pop(futuro)
+                    pdf, fases = futuro.result()
+                    for componente, nombre, duracion in fases:
+                        metricas.observar("fase_segundos", duracion, componente=componente, fase=nombre)
+                    cache_boletines.guardar(clave, alumno.id, pdf)
+                    escribir(_nombre_en_zip(alumno, carpeta_por_grado), pdf)
+                    hechos += 1
+                    if al_avanzar:
+                        al_avanzar(hechos, total)
+                    yield salida.vaciar()
+                encolar()
+
+            # ================= RESUMEN POR GRADO =================
+            for nombre, contenido in _resumenes(boletines, carpeta_por_grado):
+                escribir(nombre, contenido)
+                yield salida.vaciar()
+        yield salida.vaciar()
+    finally:
+        # Cliente desconectado o error: no seguir renderizando
+        for futuro in en_curso:
+            futuro.cancel()
+        for nombre, duracion in tiempos.items():
+            metricas.observar("fase_segundos", duracion, componente="zip", fase=nombre)
+
+# ================= ZIP PARA TRABAJOS EN SEGUNDO PLANO =================
+# Se escribe a disco por trozos: la memoria no crece con el tamaño del colegio
+def construir_zip(avance, destino, boletines, nombre_zip, carpeta_por_grado=False):
+    avance(0, len(boletines))
+    with fase("zip", "total"), open(destino, "wb") as archivo:
+        for trozo in generar_zip(boletines, carpeta_por_grado, avance):
+            archivo.write(trozo)
+    return nombre_zip
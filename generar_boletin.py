@@ -3,41 +3,41 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.pagesizes import letter
 from reportlab.lib import colors
 from reportlab.lib.units import cm
+from metricas import fase
+from cache_boletines import clave_boletin
 from datetime import datetime
-import uuid
+import threading
+import base64
+import io
 import os
 
+# ================= RUTA ABSOLUTA BASE =================
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-def generar_boletin_pdf(alumno, notas):
-    # ================= RUTA ABSOLUTA BASE =================
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# ================= RUTA LOGO (STATIC) =================
+logo_path = os.path.join(BASE_DIR, "static", "logo.jpg")
 
-    # ================= RUTA LOGO (STATIC) =================
-    logo_path = os.path.join(BASE_DIR, "static", "logo.jpg")
+# ================= VERIFICACIÓN =================
+# Con VERIFICACION_URL (p. ej. https://colegio.edu.gt) el PDF imprime el
+# enlace público de verificación junto al código
+VERIFICACION_URL = os.environ.get("VERIFICACION_URL", "").rstrip("/")
 
-    # ================= CARPETAS PDF =================
-    carpeta_base = os.path.join(BASE_DIR, "pdfs")
-    carpeta_grado = os.path.join(carpeta_base, alumno.grado)
+# ================= MÁRGENES Y ANCHO ÚTIL =================
+MARGEN = 2 * cm
+ANCHO_UTIL = letter[0] - 2 * MARGEN
 
-    os.makedirs(carpeta_grado, exist_ok=True)
+# ================= PLANTILLA PRECOMPILADA =================
+# Estilos, logo y encabezado se construyen una vez por proceso.
+# Las tablas de ReportLab guardan estado al maquetarse, por eso el
+# encabezado se cachea por hilo.
+_plantilla = None
+_local = threading.local()
+_candado = threading.Lock()
 
-    nombre_archivo = f"{alumno.nombre.replace(' ', '_')}_2026.pdf"
-    ruta_pdf = os.path.join(carpeta_grado, nombre_archivo)
-
-    # ================= DOCUMENTO =================
-    doc = SimpleDocTemplate(
-        ruta_pdf,
-        pagesize=letter,
-        rightMargin=2 * cm,
-        leftMargin=2 * cm,
-        topMargin=2 * cm,
-        bottomMargin=2 * cm
-    )
 
+def _construir_plantilla():
     styles = getSampleStyleSheet()
-    elementos = []
 
-    # ================= ESTILO ENCABEZADO =================
     estilo_encabezado = ParagraphStyle(
         "Encabezado",
         parent=styles["Normal"],
@@ -47,94 +47,187 @@ def generar_boletin_pdf(alumno, notas):
         alignment=0  # LEFT
     )
 
-    # ================= LOGO + TITULO EN UNA FILA =================
+    logo = None
     if os.path.exists(logo_path):
-        logo = Image(logo_path, width=2.2 * cm, height=2.2 * cm)
+        with open(logo_path, "rb") as f:
+            logo = f.read()
+
+    return {
+        "normal": styles["Normal"],
+        "encabezado": estilo_encabezado,
+        "logo": logo,
+        "estilo_encabezado": TableStyle([
+            ("VALIGN", (0, 0), (-1, -1), "TOP"),
+            ("LEFTPADDING", (0, 0), (-1, -1), 0),
+            ("RIGHTPADDING", (0, 0), (-1, -1), 0),
+            ("TOPPADDING", (0, 0), (-1, -1), 0),
+            ("BOTTOMPADDING", (0, 0), (-1, -1), 12),
+        ]),
+        "estilo_notas": TableStyle([
+            ("GRID", (0, 0), (-1, -1), 1, colors.black),
+            ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+            ("FONT", (0, 0), (-1, 0), "Helvetica-Bold"),
+            ("ALIGN", (1, 1), (-1, -1), "CENTER"),
+        ]),
+    }
+
+
+def obtener_plantilla():
+    global _plantilla
+    if _plantilla is None:
+        with _candado:
+            if _plantilla is None:
+                _plantilla = _construir_plantilla()
+    return _plantilla
+
+
+def _encabezado(plantilla):
+    # ================= LOGO + TITULO EN UNA FILA =================
+    if plantilla["logo"] is None:
+        return None
+
+    encabezado = getattr(_local, "encabezado", None)
+    if encabezado is None:
+        # El logo se decodifica una sola vez desde memoria
+        logo = Image(io.BytesIO(plantilla["logo"]), width=2.2 * cm, height=2.2 * cm)
 
         texto_encabezado = Paragraph(
             "<b>LICEO PREUNIVERSITARIO SANTINY</b><br/>"
             "BOLETA OFICIAL DE CALIFICACIONES",
-            estilo_encabezado
+            plantilla["encabezado"]
         )
 
-        tabla_encabezado = Table(
+        encabezado = Table(
             [[logo, texto_encabezado]],
-            colWidths=[3 * cm, doc.width - 3 * cm]
+            colWidths=[3 * cm, ANCHO_UTIL - 3 * cm]
         )
+        encabezado.setStyle(plantilla["estilo_encabezado"])
+        _local.encabezado = encabezado
+    return encabezado
+
+
+def limpiar_plantilla():
+    # Para benchmarks y para recargar el logo sin reiniciar
+    global _plantilla
+    with _candado:
+        _plantilla = None
+    _local.__dict__.pop("encabezado", None)
 
-        tabla_encabezado.setStyle(TableStyle([
-            ("VALIGN", (0, 0), (-1, -1), "TOP"),
-            ("LEFTPADDING", (0, 0), (-1, -1), 0),
-            ("RIGHTPADDING", (0, 0), (-1, -1), 0),
-            ("TOPPADDING", (0, 0), (-1, -1), 0),
-            ("BOTTOMPADDING", (0, 0), (-1, -1), 12),
-        ]))
 
-        elementos.append(tabla_encabezado)
+def promedio_final(suma_bloques):
+    # Promedio oficial: los bloques sin nota cuentan como 0
+    return round(suma_bloques / 4, 2)
+
+
+def promedios_boletin(notas):
+    # [(materia, promedio final)] en el orden de la tabla del boletín
+    sumas = {}
+    nombres = {}
+    for nota in notas:
+        sumas[nota.materia_id] = sumas.get(nota.materia_id, 0) + nota.puntaje
+        nombres.setdefault(nota.materia_id, nota.materia)
+    return [(nombres[m], promedio_final(suma)) for m, suma in sumas.items()]
+
+
+def codigo_verificacion(alumno, notas):
+    # Mismo contenido, mismo código: 12 caracteres base32 del hash del boletín
+    return base64.b32encode(bytes.fromhex(clave_boletin(alumno, notas))).decode()[:12]
+
+
+def codigo_legible(codigo):
+    return "-".join(codigo[i:i + 4] for i in range(0, len(codigo), 4))
+
+
+def nombre_boletin(alumno):
+    return f"{alumno.nombre.replace(' ', '_')}_{alumno.ciclo}.pdf"
+
+
+def generar_boletin_pdf(alumno, notas, destino=None):
+    # Sin destino se renderiza en memoria y se devuelve un BytesIO al inicio
+    with fase("boletin", "plantilla"):
+        plantilla = obtener_plantilla()
+        encabezado = _encabezado(plantilla)
+    if destino is None:
+        destino = io.BytesIO()
+
+    # ================= DOCUMENTO =================
+    doc = SimpleDocTemplate(
+        destino,
+        pagesize=letter,
+        rightMargin=MARGEN,
+        leftMargin=MARGEN,
+        topMargin=MARGEN,
+        bottomMargin=MARGEN
+    )
+
+    elementos = []
+
+    if encabezado is not None:
+        elementos.append(encabezado)
 
     # ================= DATOS DEL ALUMNO =================
     elementos.append(Paragraph(
         f"<b>Alumno:</b> {alumno.nombre}<br/>"
         f"<b>Grado:</b> {alumno.grado}<br/>"
-        f"<b>Ciclo Escolar:</b> 2026<br/><br/>",
-        styles["Normal"]
+        f"<b>Ciclo Escolar:</b> {alumno.ciclo}<br/><br/>",
+        plantilla["normal"]
     ))
 
-    # ================= ORGANIZAR NOTAS =================
-    materias = {}
-
-    for nota in notas:
-        if nota.materia not in materias:
-            materias[nota.materia] = {1: 0, 2: 0, 3: 0, 4: 0}
-        materias[nota.materia][nota.bloque] = nota.puntaje
-
-    # ================= TABLA =================
-    data = [["Materia", "Bloque 1", "Bloque 2", "Bloque 3", "Bloque 4", "Promedio Final"]]
-
-    for materia, bloques in materias.items():
-        b1 = bloques[1]
-        b2 = bloques[2]
-        b3 = bloques[3]
-        b4 = bloques[4]
-
-        promedio = round((b1 + b2 + b3 + b4) / 4, 2)
-
-        data.append([
-            materia,
-            b1 if b1 else "",
-            b2 if b2 else "",
-            b3 if b3 else "",
-            b4 if b4 else "",
-            promedio
-        ])
-
-    tabla = Table(data, colWidths=[5*cm, 2*cm, 2*cm, 2*cm, 2*cm, 3*cm])
-    tabla.setStyle(TableStyle([
-        ("GRID", (0, 0), (-1, -1), 1, colors.black),
-        ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
-        ("FONT", (0, 0), (-1, 0), "Helvetica-Bold"),
-        ("ALIGN", (1, 1), (-1, -1), "CENTER"),
-    ]))
+    with fase("boletin", "tabla"):
+        # ================= ORGANIZAR NOTAS =================
+        # Agrupadas por materia_id; el nombre solo se usa para mostrar
+        materias = {}
+        nombres = {}
+
+        for nota in notas:
+            if nota.materia_id not in materias:
+                materias[nota.materia_id] = {1: 0, 2: 0, 3: 0, 4: 0}
+                nombres[nota.materia_id] = nota.materia
+            materias[nota.materia_id][nota.bloque] = nota.puntaje
+
+        # ================= TABLA =================
+        data = [["Materia", "Bloque 1", "Bloque 2", "Bloque 3", "Bloque 4", "Promedio Final"]]
+
+        for materia_id, bloques in materias.items():
+            b1 = bloques[1]
+            b2 = bloques[2]
+            b3 = bloques[3]
+            b4 = bloques[4]
+
+            promedio = promedio_final(b1 + b2 + b3 + b4)
+
+            data.append([
+                nombres[materia_id],
+                b1 if b1 else "",
+                b2 if b2 else "",
+                b3 if b3 else "",
+                b4 if b4 else "",
+                promedio
+            ])
+
+        tabla = Table(data, colWidths=[5*cm, 2*cm, 2*cm, 2*cm, 2*cm, 3*cm])
+        tabla.setStyle(plantilla["estilo_notas"])
 
     elementos.append(tabla)
 
     # ================= FIRMA DIGITAL =================
-    codigo = str(uuid.uuid4())[:10].upper()
+    codigo = codigo_verificacion(alumno, notas)
+    # Con cache_boletines, la fecha es la del primer renderizado de este contenido
     fecha = datetime.now().strftime("%d/%m/%Y %H:%M")
+    enlace = f"Verifíquelo en {VERIFICACION_URL}/verificar/{codigo}<br/>" if VERIFICACION_URL else ""
 
     elementos.append(Paragraph(
         "<br/><br/><b>VALIDACIÓN DIGITAL</b><br/>"
         f"Documento generado automáticamente el {fecha}.<br/>"
-        f"Código único de verificación: <b>{codigo}</b><br/>"
+        f"Código único de verificación: <b>{codigo_legible(codigo)}</b><br/>"
+        f"{enlace}"
         "Este documento es oficial y válido sin firma manuscrita.",
-        styles["Normal"]
+        plantilla["normal"]
     ))
 
-    doc.build(elementos)
-
-    return ruta_pdf
-
-
-
-
+    with fase("boletin", "build"):
+        doc.build(elementos)
 
+    if hasattr(destino, "seek"):
+        destino.seek(0)
+    return destino
@@ -0,0 +1,68 @@
+from sqlalchemy import delete, update, select
+from models import db, SolicitudProcesada
+from basedatos import insert_upsert
+from datetime import datetime, timedelta
+import threading
+import time
+import os
+
+IDEMPOTENCIA_RETENCION_HORAS = int(os.environ.get("IDEMPOTENCIA_RETENCION_HORAS", 24))
+IDEMPOTENCIA_PURGA_MINUTOS = float(os.environ.get("IDEMPOTENCIA_PURGA_MINUTOS", 60))
+
+t_solicitud = SolicitudProcesada.__table__
+
+# ================= CLAVES DE IDEMPOTENCIA =================
+# La clave se reserva en la misma transacción que la escritura: un envío
+# repetido (doble clic, reintento) espera a que termine el primero y
+# luego encuentra la clave ya usada.
+def reservar(clave, usuario_id):
+    # None si la clave es nueva; si ya se usó, el resultado guardado
+    _purgar_si_toca()
+    conexion = db.session.connection()
+    ahora = datetime.utcnow()
+    nueva = conexion.execute(
+        insert_upsert(conexion, t_solicitud)
+        .values(clave=clave[:64], usuario_id=usuario_id, resultado="", creado=ahora)
+        .on_conflict_do_nothing(index_elements=["clave"])
+    ).rowcount
+    if nueva:
+        return None
+
+    return conexion.execute(
+        select(t_solicitud.c.resultado)
+        .where(t_solicitud.c.clave == clave[:64], t_solicitud.c.usuario_id == usuario_id)
+    ).scalar() or ""
+
+
+def completar(clave, resultado):
+    db.session.connection().execute(
+        update(t_solicitud).where(t_solicitud.c.clave == clave[:64]).values(resultado=resultado)
+    )
+
+# ================= PURGA DE CLAVES VENCIDAS =================
+# Fuera de la transacción del envío: a lo sumo una vez cada
+# IDEMPOTENCIA_PURGA_MINUTOS por proceso, en un hilo aparte. init-bd
+# también purga en cada despliegue.
+_proxima_purga = 0.0
+_candado_purga = threading.Lock()
+
+
+def purgar(conexion):
+    limite = datetime.utcnow() - timedelta(hours=IDEMPOTENCIA_RETENCION_HORAS)
+    conexion.execute(delete(t_solicitud).where(t_solicitud.c.creado < limite))
+
+
+def _purgar_en_segundo_plano(engine):
+    with engine.begin() as conexion:
+        purgar(conexion)
+
+
+def _purgar_si_toca():
+    global _proxima_purga
+    with _candado_purga:
+        if time.monotonic() < _proxima_purga:
+            return
+        _proxima_purga = time.monotonic() + IDEMPOTENCIA_PURGA_MINUTOS * 60
+    threading.Thread(
+        target=_purgar_en_segundo_plano, args=(db.engine,), daemon=True, name="purga-idempotencia"
+    ).start()
@@ -0,0 +1,252 @@
+from sqlalchemy import insert
+from models import db, Usuario, Alumno, Nota, Grado, Materia, Asignacion, ciclo_activo, ids_de_grados
+from notas import BLOQUES
+from estadisticas import recalcular
+from cache_boletines import cache_boletines
+from versiones import incrementar, ambito_alumnos, ambito_asignaciones, ambito_tabla
+import csv
+import io
+import os
+
+# ================= CONFIGURACIÓN =================
+LOTE_IMPORTACION = 1000   # filas por executemany
+MAX_ERRORES_REPORTE = 500  # errores detallados; el resto solo se cuenta
+
+# ================= LECTURA EN STREAMING =================
+def _limpiar(valor):
+    if valor is None:
+        return ""
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return str(valor).strip()
+
+
+def _leer_csv(stream):
+    texto = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    muestra = texto.read(4096)
+    texto.seek(0)
+    try:
+        dialecto = csv.Sniffer().sniff(muestra, delimiters=",;\t")
+    except csv.Error:
+        dialecto = csv.excel
+
+    lector = csv.reader(texto, dialecto)
+    encabezado = [_limpiar(c).lower() for c in next(lector, [])]
+    for fila in lector:
+        if any(fila):
+            yield dict(zip(encabezado, (_limpiar(v) for v in fila)))
+
+
+def _leer_xlsx(stream):
+    from openpyxl import load_workbook
+
+    try:
+        libro = load_workbook(stream, read_only=True, data_only=True)
+    except Exception:
+        raise ValueError("El archivo no es un XLSX válido")
+    try:
+        filas = libro.active.iter_rows(values_only=True)
+        encabezado = [_limpiar(c).lower() for c in next(filas, ())]
+        for fila in filas:
+            if any(v is not None for v in fila):
+                yield dict(zip(encabezado, (_limpiar(v) for v in fila)))
+    finally:
+        libro.close()
+
+
+def leer_filas(archivo):
+    extension = os.path.splitext(archivo.filename or "")[1].lower()
+    if extension == ".xlsx":
+        return _leer_xlsx(archivo.stream)
+    if extension == ".csv":
+        return _leer_csv(archivo.stream)
+    raise ValueError("Formato no soportado: use .csv o .xlsx")
+
+# ================= VALIDADORES POR TIPO =================
+# Cada uno precarga las claves únicas existentes una sola vez y devuelve
+# (modelo, procesar) donde procesar(fila) -> (datos, error). Alumnos,
+# asignaciones y notas se importan siempre al ciclo activo. Los archivos
+# traen nombres; a la BD van ids.
+
+def _grados():
+    # Resuelve nombres de grado a id y crea los que falten
+    grados = dict(db.session.query(Grado.nombre, Grado.id))
+
+    def grado_id(nombre):
+        if nombre not in grados:
+            grados.update(ids_de_grados(db.session.connection(), [nombre]))
+        return grados[nombre]
+
+    return grado_id
+
+
+def _alumnos():
+    existentes = {nombre for (nombre,) in db.session.query(Alumno.nombre).filter(Alumno.ciclo == ciclo_activo())}
+    grado_id = _grados()
+
+    def procesar(fila):
+        nombre, grado = fila.get("nombre"), fila.get("grado")
+        if not nombre or not grado:
+            return None, "Faltan nombre o grado"
+        if nombre in existentes:
+            return None, "El alumno ya existe"
+        existentes.add(nombre)
+        return {"nombre": nombre, "grado_id": grado_id(grado)}, None
+
+    return Alumno, procesar
+
+
+def _materias():
+    existentes = {tuple(r) for r in db.session.query(Materia.nombre, Materia.grado_id)}
+    grado_id = _grados()
+
+    def procesar(fila):
+        nombre, grado = fila.get("nombre"), fila.get("grado")
+        if not nombre or not grado:
+            return None, "Faltan nombre o grado"
+        clave = (nombre, grado_id(grado))
+        if clave in existentes:
+            return None, "La materia ya existe para ese grado"
+        existentes.add(clave)
+        return {"nombre": nombre, "grado_id": clave[1]}, None
+
+    return Materia, procesar
+
+
+def _asignaciones():
+    docentes = dict(db.session.query(Usuario.correo, Usuario.id).filter_by(rol="docente"))
+    materias = {
+        (nombre, grado): (materia_id, grado_id)
+        for materia_id, nombre, grado_id, grado in db.session.query(
+            Materia.id, Materia.nombre, Materia.grado_id, Grado.nombre
+        ).join(Grado, Grado.id == Materia.grado_id)
+    }
+    existentes = {
+        tuple(r) for r in db.session.query(Asignacion.docente_id, Asignacion.materia_id, Asignacion.grado_id)
+        .filter(Asignacion.ciclo == ciclo_activo())
+    }
+
+    def procesar(fila):
+        correo, materia, grado = fila.get("docente"), fila.get("materia"), fila.get("grado")
+        if not correo or not materia or not grado:
+            return None, "Faltan docente, materia o grado"
+        if correo not in docentes:
+            return None, f"Docente no encontrado: {correo}"
+        if (materia, grado) not in materias:
+            return None, f"Materia no encontrada: {materia} ({grado})"
+
+        clave = (docentes[correo], *materias[(materia, grado)])
+        if clave in existentes:
+            return None, "Asignación duplicada"
+        existentes.add(clave)
+        return {"docente_id": clave[0], "materia_id": clave[1], "grado_id": clave[2]}, None
+
+    return Asignacion, procesar
+
+
+def _notas():
+    alumnos = {
+        nombre: (alumno_id, grado_id, grado)
+        for alumno_id, nombre, grado_id, grado in db.session.query(
+            Alumno.id, Alumno.nombre, Alumno.grado_id, Grado.nombre
+        ).join(Grado, Grado.id == Alumno.grado_id).filter(Alumno.ciclo == ciclo_activo())
+    }
+    materias = {
+        (nombre, grado_id): materia_id
+        for materia_id, nombre, grado_id in db.session.query(Materia.id, Materia.nombre, Materia.grado_id)
+    }
+    existentes = {
+        tuple(r) for r in db.session.query(Nota.alumno_id, Nota.materia_id, Nota.bloque)
+        .filter(Nota.ciclo == ciclo_activo())
+    }
+
+    def procesar(fila):
+        nombre, materia = fila.get("alumno"), fila.get("materia")
+        if not nombre or not materia:
+            return None, "Faltan alumno o materia"
+        if nombre not in alumnos:
+            return None, f"Alumno no encontrado: {nombre}"
+
+        alumno_id, grado_id, grado = alumnos[nombre]
+        if (materia, grado_id) not in materias:
+            return None, f"Materia no encontrada: {materia} ({grado})"
+
+        try:
+            bloque = int(fila.get("bloque", ""))
+            puntaje = float(fila.get("puntaje", ""))
+        except ValueError:
+            return None, "Bloque o puntaje inválido"
+        if bloque not in BLOQUES:
+            return None, "Bloque inválido"
+        if not 0 <= puntaje <= 100:
+            return None, "El puntaje debe estar entre 0 y 100"
+
+        clave = (alumno_id, materias[(materia, grado_id)], bloque)
+        if clave in existentes:
+            return None, "Nota duplicada"
+        existentes.add(clave)
+        return {"alumno_id": alumno_id, "materia_id": clave[1], "bloque": bloque, "puntaje": puntaje}, None
+
+    return Nota, procesar
+
+
+IMPORTADORES = {
+    "alumnos": _alumnos,
+    "materias": _materias,
+    "asignaciones": _asignaciones,
+    "notas": _notas,
+}
+
+COLUMNAS = {
+    "alumnos": "nombre, grado",
+    "materias": "nombre, grado",
+    "asignaciones": "docente (correo), materia, grado",
+    "notas": "alumno, materia, bloque, puntaje",
+}
+
+# ================= IMPORTACIÓN =================
+def _insertar(modelo, pendientes):
+    db.session.execute(insert(modelo), pendientes)
+    if modelo is Nota:
+        # Los insert masivos no pasan por los eventos del ORM
+        recalcular(db.session.connection(), [(d["alumno_id"], d["materia_id"]) for d in pendientes])
+        for alumno_id in {d["alumno_id"] for d in pendientes}:
+            cache_boletines.invalidar_alumno(alumno_id)
+        return
+
+    ambitos = [ambito_tabla(modelo.__tablename__)]
+    if modelo is Alumno:
+        ambitos += [ambito_alumnos(d["grado_id"]) for d in pendientes]
+    elif modelo is Asignacion:
+        ambitos += [ambito_asignaciones(d["docente_id"]) for d in pendientes]
+    incrementar(db.session.connection(), ambitos)
+
+
+def importar(tipo, filas, lote=LOTE_IMPORTACION):
+    # No hace commit: el llamador confirma junto con la auditoría
+    modelo, procesar = IMPORTADORES[tipo]()
+
+    creadas = 0
+    total_errores = 0
+    errores = []
+    pendientes = []
+
+    for numero, fila in enumerate(filas, start=2):  # la fila 1 es el encabezado
+        datos, error = procesar(fila)
+        if error:
+            total_errores += 1
+            if len(errores) < MAX_ERRORES_REPORTE:
+                errores.append({"fila": numero, "error": error})
+            continue
+
+        pendientes.append(datos)
+        if len(pendientes) >= lote:
+            _insertar(modelo, pendientes)
+            creadas += len(pendientes)
+            pendientes = []
+
+    if pendientes:
+        _insertar(modelo, pendientes)
+        creadas += len(pendientes)
+
+    return creadas, errores, total_errores
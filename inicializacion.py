@@ -0,0 +1,237 @@
+from flask.cli import with_appcontext
+from sqlalchemy import inspect, text, select, insert, UniqueConstraint, ForeignKeyConstraint
+from sqlalchemy.schema import CreateTable, AddConstraint
+from credenciales import cifrar
+from models import (
+    db, Usuario, Materia, Alumno, Nota, Asignacion, CicloEscolar,
+    ResumenAlumnoMateria, ResumenGradoMateria, CICLO_INICIAL, crear_indices, ids_de_grados
+)
+from basedatos import insert_upsert
+from versiones import incrementar, ambito_tabla, MODELOS_VERSIONADOS
+from estadisticas import reconstruir
+from idempotencia import purgar as purgar_solicitudes
+import click
+import os
+
+# ================= INICIALIZACIÓN Y MIGRACIÓN DE LA BD =================
+# Se ejecuta una vez por despliegue (flask --app app init-bd), no en cada
+# worker. Todos los pasos son idempotentes.
+MATERIAS_INICIALES = [
+    ("Matemática", "Primero Primaria"),
+    ("Lenguaje", "Primero Primaria"),
+    ("Ciencias", "Primero Primaria"),
+    ("Matemática", "Segundo Primaria"),
+    ("Lenguaje", "Segundo Primaria"),
+    ("Sociales", "Segundo Primaria"),
+]
+
+
+def crear_tablas(conexion):
+    db.metadata.create_all(conexion)
+
+
+def tiene_columna(conexion, tabla, nombre):
+    return nombre in {c["name"] for c in inspect(conexion).get_columns(tabla.name)}
+
+
+def agregar_columna(conexion, tabla, columna, valor=None):
+    # create_all no agrega columnas nuevas a tablas que ya existen.
+    # valor: default solo para rellenar las filas existentes
+    if tiene_columna(conexion, tabla, columna.name):
+        return
+    tipo = columna.type.compile(dialect=conexion.dialect)
+    nulo = "" if columna.nullable else " NOT NULL"
+    if valor is None and columna.server_default is not None:
+        valor = columna.server_default.arg
+    defecto = f" DEFAULT {valor}" if valor is not None else ""
+    conexion.execute(text(f"ALTER TABLE {tabla.name} ADD COLUMN {columna.name} {tipo}{nulo}{defecto}"))
+
+
+def agregar_version_nota(conexion):
+    agregar_columna(conexion, Nota.__table__, Nota.__table__.c.version)
+
+# ================= CICLO ESCOLAR =================
+# Los datos anteriores a los ciclos quedan en CICLO_INICIAL
+def agregar_ciclos(conexion):
+    for modelo in (Alumno, Nota, Asignacion):
+        agregar_columna(conexion, modelo.__table__, modelo.__table__.c.ciclo, int(CICLO_INICIAL))
+
+
+def _reconstruir_tabla_sqlite(conexion, tabla, expresiones=None):
+    # SQLite no modifica restricciones: tabla nueva, copia, borrar la vieja
+    # y renombrar (las FK de otras tablas apuntan por nombre).
+    # expresiones: {columna: SQL} para columnas nuevas calculadas al copiar
+    expresiones = expresiones or {}
+    nueva = tabla.to_metadata(db.metadata, name=f"{tabla.name}__nueva")
+    try:
+        conexion.execute(CreateTable(nueva))
+        columnas = ", ".join(c.name for c in tabla.columns)
+        valores = ", ".join(expresiones.get(c.name, c.name) for c in tabla.columns)
+        conexion.execute(text(f"INSERT INTO {nueva.name} ({columnas}) SELECT {valores} FROM {tabla.name}"))
+        conexion.execute(text(f"DROP TABLE {tabla.name}"))
+        conexion.execute(text(f"ALTER TABLE {nueva.name} RENAME TO {tabla.name}"))
+    finally:
+        db.metadata.remove(nueva)
+
+
+# ================= CLAVES ENTERAS (materia_id, grado_id) =================
+# Nota.materia y los grado de texto pasan a ids. Nota va primero: su
+# materia se resuelve con el grado en texto del alumno.
+GRADO_ID = "(SELECT g.id FROM grado g WHERE g.nombre = {tabla}.grado)"
+CONVERSIONES = [
+    (Nota, "materia", {"materia_id": (
+        "(SELECT m.id FROM materia m, alumno a WHERE a.id = nota.alumno_id"
+        " AND m.nombre = nota.materia AND m.grado = a.grado)"
+    )}),
+    (Asignacion, "grado", {"grado_id": GRADO_ID.format(tabla="asignacion")}),
+    (Alumno, "grado", {"grado_id": GRADO_ID.format(tabla="alumno")}),
+    (Materia, "grado", {"grado_id": GRADO_ID.format(tabla="materia")}),
+]
+
+
+def _convertir(conexion, tabla, vieja, expresiones):
+    if conexion.dialect.name == "sqlite":
+        _reconstruir_tabla_sqlite(conexion, tabla, expresiones)
+        return
+
+    for columna, expresion in expresiones.items():
+        conexion.execute(text(f"ALTER TABLE {tabla.name} ADD COLUMN {columna} INTEGER"))
+        conexion.execute(text(f"UPDATE {tabla.name} SET {columna} = {expresion}"))
+        conexion.execute(text(f"ALTER TABLE {tabla.name} ALTER COLUMN {columna} SET NOT NULL"))
+    # CASCADE quita también las restricciones e índices de la columna vieja
+    conexion.execute(text(f"ALTER TABLE {tabla.name} DROP COLUMN {vieja} CASCADE"))
+    for restriccion in tabla.constraints:
+        if isinstance(restriccion, (UniqueConstraint, ForeignKeyConstraint)) \
+                and any(c.name in expresiones for c in restriccion.columns):
+            conexion.execute(AddConstraint(restriccion))
+
+
+def normalizar_claves(conexion):
+    pendientes = [
+        (modelo.__table__, vieja, expresiones)
+        for modelo, vieja, expresiones in CONVERSIONES
+        if tiene_columna(conexion, modelo.__table__, vieja)
+    ]
+    if not pendientes:
+        return
+
+    # Catálogo de grados y materias que solo existían como texto en las notas
+    for tabla, vieja, _ in pendientes:
+        if vieja == "grado":
+            nombres = conexion.execute(text(f"SELECT DISTINCT grado FROM {tabla.name}")).scalars().all()
+            ids_de_grados(conexion, nombres)
+    if tiene_columna(conexion, Nota.__table__, "materia"):
+        conexion.execute(text(
+            "INSERT INTO materia (nombre, grado) SELECT DISTINCT n.materia, a.grado"
+            " FROM nota n JOIN alumno a ON a.id = n.alumno_id WHERE NOT EXISTS"
+            " (SELECT 1 FROM materia m WHERE m.nombre = n.materia AND m.grado = a.grado)"
+        ))
+
+    for tabla, vieja, expresiones in pendientes:
+        _convertir(conexion, tabla, vieja, expresiones)
+
+
+def recrear_resumenes(conexion):
+    # Los resúmenes son derivados: si su esquema cambió se recrean vacíos
+    # y rellenar_resumenes los reconstruye
+    for modelo in (ResumenAlumnoMateria, ResumenGradoMateria):
+        tabla = modelo.__table__
+        existentes = {c["name"] for c in inspect(conexion).get_columns(tabla.name)}
+        if existentes != {c.name for c in tabla.columns}:
+            tabla.drop(conexion)
+            tabla.create(conexion)
+
+
+def actualizar_unicas(conexion):
+    # Nombre único por ciclo y asignación única por ciclo
+    for modelo in (Alumno, Asignacion):
+        tabla = modelo.__table__
+        esperadas = {
+            tuple(c.name for c in r.columns): r
+            for r in tabla.constraints if isinstance(r, UniqueConstraint)
+        }
+        actuales = {tuple(u["column_names"]): u["name"] for u in inspect(conexion).get_unique_constraints(tabla.name)}
+        if set(actuales) == set(esperadas):
+            continue
+
+        if conexion.dialect.name == "sqlite":
+            _reconstruir_tabla_sqlite(conexion, tabla)
+            continue
+        for columnas, nombre in actuales.items():
+            if columnas not in esperadas:
+                conexion.execute(text(f'ALTER TABLE {tabla.name} DROP CONSTRAINT "{nombre}"'))
+        for columnas, restriccion in esperadas.items():
+            if columnas not in actuales:
+                conexion.execute(AddConstraint(restriccion))
+
+
+def quitar_indices_viejos(conexion):
+    # Reemplazados por índices que empiezan por ciclo
+    for nombre in ("ix_alumno_grado_nombre", "ix_resumen_alumno_grado_materia"):
+        conexion.execute(text(f"DROP INDEX IF EXISTS {nombre}"))
+
+
+def rellenar_resumenes(conexion):
+    # Backfill de resúmenes en bases con notas previas
+    vacio = conexion.execute(db.select(ResumenAlumnoMateria.alumno_id).limit(1)).first() is None
+    if vacio and conexion.execute(db.select(Nota.id).limit(1)).first() is not None:
+        reconstruir(conexion)
+
+
+MIGRACIONES = [
+    crear_tablas,
+    agregar_version_nota,
+    agregar_ciclos,
+    normalizar_claves,
+    actualizar_unicas,
+    recrear_resumenes,
+    quitar_indices_viejos,
+    crear_indices,
+    rellenar_resumenes,
+]
+
+# ================= DATOS INICIALES (UPSERT) =================
+def sembrar(conexion, admin_email, admin_password):
+    conexion.execute(
+        insert_upsert(conexion, Usuario.__table__)
+        .values(
+            nombre="Administrador",
+            correo=admin_email,
+            password=cifrar(admin_password),
+            rol="admin"
+        )
+        .on_conflict_do_nothing(index_elements=["correo"])
+    )
+    grados = ids_de_grados(conexion, [grado for _, grado in MATERIAS_INICIALES])
+    conexion.execute(
+        insert_upsert(conexion, Materia.__table__)
+        .values([{"nombre": nombre, "grado_id": grados[grado]} for nombre, grado in MATERIAS_INICIALES])
+        .on_conflict_do_nothing(index_elements=["nombre", "grado_id"])
+    )
+    # Primer ciclo activo solo si todavía no hay ninguno
+    if conexion.execute(select(CicloEscolar.anio).limit(1)).first() is None:
+        conexion.execute(insert(CicloEscolar.__table__).values(anio=CICLO_INICIAL, estado="activo"))
+
+
+def inicializar_bd():
+    admin_email = os.environ.get("ADMIN_EMAIL")
+    admin_password = os.environ.get("ADMIN_PASSWORD")
+
+    if not admin_email or not admin_password:
+        raise RuntimeError("ADMIN_EMAIL o ADMIN_PASSWORD no definidos")
+
+    # Una sola transacción: o queda todo aplicado o nada
+    with db.engine.begin() as conexion:
+        for migracion in MIGRACIONES:
+            migracion(conexion)
+        sembrar(conexion, admin_email, admin_password)
+        purgar_solicitudes(conexion)
+        # Las migraciones escriben por Core: ningún fragmento cacheado sigue valiendo
+        incrementar(conexion, [ambito_tabla(m.__tablename__) for m in MODELOS_VERSIONADOS])
+
+# ================= COMANDO CLI =================
+@click.command("init-bd")
+@with_appcontext
+def comando_init_bd():
+    inicializar_bd()
+    click.echo("Base de datos lista ✅")
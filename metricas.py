@@ -0,0 +1,210 @@
+from flask import g, request, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from contextlib import contextmanager
+from consultas import consultas_en_peticion, cabeceras_diagnostico
+import threading
+import logging
+import time
+import os
+
+# ================= CONFIGURACIÓN =================
+CONSULTA_LENTA_MS = float(os.environ.get("CONSULTA_LENTA_MS", 200))
+CUBETAS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+log_sql = logging.getLogger("calificaciones.sql")
+
+# ================= REGISTRO EN MEMORIA =================
+# Por proceso: con varios workers de gunicorn cada uno expone los suyos.
+# Solo sumas bajo un candado, sin E/S, para poder dejarlo activo siempre.
+DESCRIPCIONES = {
+    "peticion_segundos": ("histogram", "Duración total de la petición"),
+    "peticion_bd_segundos": ("histogram", "Tiempo en la base de datos por petición"),
+    "peticion_plantilla_segundos": ("histogram", "Tiempo renderizando plantillas por petición"),
+    "peticion_consultas_total": ("counter", "Consultas SQL ejecutadas"),
+    "peticiones_total": ("counter", "Peticiones atendidas"),
+    "consultas_lentas_total": ("counter", f"Consultas de más de {CONSULTA_LENTA_MS:g} ms"),
+    "fase_segundos": ("histogram", "Duración de fases internas (boletín PDF, ZIP, login)"),
+    "login_total": ("counter", "Intentos de login por resultado (ok, fallo, bloqueado, ocupado)"),
+    "verificaciones_total": ("counter", "Consultas públicas de boletines por resultado"),
+}
+
+
+class Histograma:
+    def __init__(self):
+        self.cubetas = [0] * len(CUBETAS_SEGUNDOS)
+        self.suma = 0.0
+        self.cuenta = 0
+
+    def observar(self, valor):
+        self.suma += valor
+        self.cuenta += 1
+        for i, limite in enumerate(CUBETAS_SEGUNDOS):
+            if valor <= limite:
+                self.cubetas[i] += 1
+                break
+
+
+class Metricas:
+    def __init__(self):
+        self._candado = threading.Lock()
+        self._contadores = {}
+        self._histogramas = {}
+
+    def incrementar(self, nombre, valor=1, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._candado:
+            self._contadores[clave] = self._contadores.get(clave, 0) + valor
+
+    def observar(self, nombre, valor, **etiquetas):
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._candado:
+            histograma = self._histogramas.get(clave)
+            if histograma is None:
+                histograma = self._histogramas[clave] = Histograma()
+            histograma.observar(valor)
+
+    # ================= FORMATO DE TEXTO DE PROMETHEUS =================
+    def texto(self):
+        with self._candado:
+            contadores = dict(self._contadores)
+            histogramas = {
+                clave: (list(h.cubetas), h.suma, h.cuenta)
+                for clave, h in self._histogramas.items()
+            }
+
+        lineas = []
+        for nombre, (tipo, ayuda) in DESCRIPCIONES.items():
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} {tipo}")
+            for (n, etiquetas), valor in sorted(contadores.items()):
+                if n == nombre:
+                    lineas.append(f"{nombre}{_etiquetas(etiquetas)} {valor:g}")
+            for (n, etiquetas), (cubetas, suma, cuenta) in sorted(histogramas.items()):
+                if n != nombre:
+                    continue
+                acumulado = 0
+                for limite, cantidad in zip(CUBETAS_SEGUNDOS, cubetas):
+                    acumulado += cantidad
+                    lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas + (('le', f'{limite:g}'),))} {acumulado}")
+                lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas + (('le', '+Inf'),))} {cuenta}")
+                lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {suma:.6f}")
+                lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {cuenta}")
+        return "\n".join(lineas) + "\n"
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(pares):
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{clave}="{_escapar(valor)}"' for clave, valor in pares) + "}"
+
+
+metricas = Metricas()
+
+# ================= FASES (SPANS) =================
+# En un proceso del pool de exportación el registro es el del hijo: las
+# fases se recolectan y vuelven al padre junto con el resultado
+_recolector = threading.local()
+
+
+@contextmanager
+def recolectar_fases():
+    fases = _recolector.fases = []
+    try:
+        yield fases
+    finally:
+        del _recolector.fases
+
+
+@contextmanager
+def fase(componente, nombre):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracion = time.perf_counter() - inicio
+        metricas.observar("fase_segundos", duracion, componente=componente, fase=nombre)
+        recolectadas = getattr(_recolector, "fases", None)
+        if recolectadas is not None:
+            recolectadas.append((componente, nombre, duracion))
+        if has_request_context():
+            fases = g.setdefault("fases", {})
+            fases[f"{componente}.{nombre}"] = fases.get(f"{componente}.{nombre}", 0) + duracion
+
+# ================= TIEMPO EN BD Y CONSULTAS LENTAS =================
+@event.listens_for(Engine, "before_cursor_execute")
+def _inicio_consulta(conn, cursor, statement, parameters, context, executemany):
+    conn.info["inicio_consulta"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _fin_consulta(conn, cursor, statement, parameters, context, executemany):
+    inicio = conn.info.pop("inicio_consulta", None)
+    if inicio is None:
+        return
+    duracion = time.perf_counter() - inicio
+
+    if has_request_context():
+        g.tiempo_bd = g.get("tiempo_bd", 0.0) + duracion
+
+    if duracion * 1000 >= CONSULTA_LENTA_MS:
+        # Solo la cantidad de parámetros: los valores pueden ser hashes de
+        # contraseñas, tokens o claves de idempotencia
+        metricas.incrementar("consultas_lentas_total")
+        log_sql.warning(
+            "Consulta lenta (%.1f ms)%s: %s | %s: %d",
+            duracion * 1000,
+            f" en {request.endpoint}" if has_request_context() else "",
+            " ".join(statement.split())[:1000],
+            "filas" if executemany else "parámetros",
+            len(parameters or ())
+        )
+
+# ================= TIEMPO DE PLANTILLAS =================
+def _inicio_plantilla(app, template, context, **extra):
+    if has_request_context():
+        g.inicio_plantilla = time.perf_counter()
+
+
+def _fin_plantilla(app, template, context, **extra):
+    if has_request_context() and "inicio_plantilla" in g:
+        g.tiempo_plantilla = g.get("tiempo_plantilla", 0.0) + time.perf_counter() - g.pop("inicio_plantilla")
+
+# ================= POR PETICIÓN =================
+def registrar_metricas(app):
+    before_render_template.connect(_inicio_plantilla, app)
+    template_rendered.connect(_fin_plantilla, app)
+
+    @app.before_request
+    def _inicio_peticion():
+        g.inicio_peticion = time.perf_counter()
+
+    @app.after_request
+    def _fin_peticion(response):
+        if "inicio_peticion" not in g:
+            return response
+
+        total = time.perf_counter() - g.inicio_peticion
+        bd = g.get("tiempo_bd", 0.0)
+        plantilla = g.get("tiempo_plantilla", 0.0)
+        endpoint = request.endpoint or "desconocido"
+
+        metricas.incrementar("peticiones_total", endpoint=endpoint, estado=response.status_code)
+        metricas.incrementar("peticion_consultas_total", consultas_en_peticion(), endpoint=endpoint)
+        metricas.observar("peticion_segundos", total, endpoint=endpoint)
+        metricas.observar("peticion_bd_segundos", bd, endpoint=endpoint)
+        if plantilla:
+            metricas.observar("peticion_plantilla_segundos", plantilla, endpoint=endpoint)
+
+        # Desglose visible en las herramientas de desarrollo del navegador
+        if not cabeceras_diagnostico():
+            return response
+        partes = [f"db;dur={bd * 1000:.1f}", f"tpl;dur={plantilla * 1000:.1f}"]
+        partes += [f"{nombre};dur={d * 1000:.1f}" for nombre, d in g.get("fases", {}).items()]
+        partes.append(f"total;dur={total * 1000:.1f}")
+        response.headers["Server-Timing"] = ", ".join(partes)
+        return response
@@ -1,27 +1,214 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from credenciales import cifrar
+from basedatos import insert_upsert
+from datetime import datetime
+import time
+import os
 
 db = SQLAlchemy()
 
+# ================= MODELOS =================
 class Usuario(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(100), nullable=False)
     correo = db.Column(db.String(100), unique=True, nullable=False)
     password = db.Column(db.String(200), nullable=False)
-    rol = db.Column(db.String(20), nullable=False)  # admin / docente
+    rol = db.Column(db.String(20), nullable=False)
 
     def set_password(self, password):
-        self.password = generate_password_hash(password)
+        self.password = cifrar(password)
 
-    def check_password(self, password):
-        return check_password_hash(self.password, password)
+# ================= CICLO ESCOLAR =================
+# Un solo ciclo "activo"; los "cerrado" son de solo lectura y los
+# "archivado" ya se movieron a su propio archivo (ciclos.py)
+CICLO_INICIAL = int(os.environ.get("CICLO_INICIAL", 2026))
+CICLO_CACHE_TTL = 60
+
+class CicloEscolar(db.Model):
+    anio = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    estado = db.Column(db.String(20), nullable=False, default="activo")
+    creado = db.Column(db.DateTime, default=datetime.utcnow)
+
+_ciclo = {"anio": None, "expira": 0.0}
+
+def ciclo_activo():
+    # Cache por proceso: el ciclo cambia una vez al año. Conexión aparte
+    # porque también se usa como default de columna durante un flush.
+    ahora = time.monotonic()
+    if _ciclo["anio"] is None or ahora >= _ciclo["expira"]:
+        with db.engine.connect() as conexion:
+            anio = conexion.execute(
+                db.select(CicloEscolar.anio).where(CicloEscolar.estado == "activo")
+            ).scalar()
+        _ciclo.update(anio=anio or CICLO_INICIAL, expira=ahora + CICLO_CACHE_TTL)
+    return _ciclo["anio"]
+
+def olvidar_ciclo_activo():
+    _ciclo["anio"] = None
+
+# ================= GRADOS =================
+# Catálogo de grados: las demás tablas guardan grado_id. Pocas filas, por
+# eso las relaciones hacia Grado se cargan con JOIN.
+class Grado(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    nombre = db.Column(db.String(50), unique=True, nullable=False)
+
+
+def ids_de_grados(conexion, nombres):
+    # {nombre: id}, creando los grados que falten
+    nombres = sorted(set(nombres))
+    if not nombres:
+        return {}
+    conexion.execute(
+        insert_upsert(conexion, Grado.__table__).on_conflict_do_nothing(index_elements=["nombre"]),
+        [{"nombre": nombre} for nombre in nombres]
+    )
+    return dict(conexion.execute(db.select(Grado.nombre, Grado.id).where(Grado.nombre.in_(nombres))).all())
+
+# ================= ALUMNOS Y NOTAS =================
+# Cada fila de Alumno es la matrícula de un ciclo: el mismo nombre puede
+# repetirse en años distintos
 class Alumno(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    nombre = db.Column(db.String(100), unique=True, nullable=False)
-    grado = db.Column(db.String(20), nullable=False)
+    nombre = db.Column(db.String(100), nullable=False)
+    grado_id = db.Column(db.Integer, db.ForeignKey('grado.id'), nullable=False)
+    ciclo = db.Column(db.Integer, nullable=False, default=ciclo_activo)
+
+    grado = db.relationship('Grado', lazy='joined')
+
+    __table_args__ = (
+        db.UniqueConstraint('ciclo', 'nombre', name='uq_alumno_ciclo_nombre'),
+        db.Index('ix_alumno_ciclo_grado_nombre', 'ciclo', 'grado_id', 'nombre'),
+    )
+
 class Nota(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     alumno_id = db.Column(db.Integer, db.ForeignKey('alumno.id'), nullable=False)
-    materia = db.Column(db.String(50), nullable=False)
+    materia_id = db.Column(db.Integer, db.ForeignKey('materia.id'), nullable=False)
+    bloque = db.Column(db.Integer, nullable=False)
     puntaje = db.Column(db.Float, nullable=False)
+    # Control de concurrencia optimista: sube en cada modificación
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+    ciclo = db.Column(db.Integer, nullable=False, default=ciclo_activo)
+
+    alumno = db.relationship('Alumno')
+    materia = db.relationship('Materia', lazy='joined')
+
+    __table_args__ = (
+        db.UniqueConstraint('alumno_id', 'materia_id', 'bloque', name='uq_nota_unica'),
+        db.Index('ix_nota_ciclo_alumno', 'ciclo', 'alumno_id'),
+    )
+
+class Materia(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    nombre = db.Column(db.String(50), nullable=False)
+    grado_id = db.Column(db.Integer, db.ForeignKey('grado.id'), nullable=False)
+
+    grado = db.relationship('Grado', lazy='joined')
+
+    __table_args__ = (
+        db.UniqueConstraint('nombre', 'grado_id', name='uq_materia_grado'),
+    )
+
+class Asignacion(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    docente_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
+    materia_id = db.Column(db.Integer, db.ForeignKey('materia.id'), nullable=False)
+    grado_id = db.Column(db.Integer, db.ForeignKey('grado.id'), nullable=False)
+    ciclo = db.Column(db.Integer, nullable=False, default=ciclo_activo)
+
+    docente = db.relationship('Usuario')
+    materia = db.relationship('Materia')
+    grado = db.relationship('Grado', lazy='joined')
+
+    __table_args__ = (
+        db.UniqueConstraint('ciclo', 'docente_id', 'materia_id', 'grado_id', name='uq_asignacion_ciclo_docente'),
+        db.Index('ix_asignacion_ciclo_grado', 'ciclo', 'grado_id'),
+    )
+
+
+class Auditoria(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
+    accion = db.Column(db.String(50), nullable=False)
+    descripcion = db.Column(db.String(200), nullable=False)
+    fecha = db.Column(db.DateTime, default=datetime.utcnow)
+
+    usuario = db.relationship('Usuario')
+
+    __table_args__ = (
+        db.Index('ix_auditoria_fecha', 'fecha'),
+        db.Index('ix_auditoria_usuario_fecha', 'usuario_id', 'fecha'),
+    )
+
+# ================= RESÚMENES DE CALIFICACIONES =================
+# Mantenidos por estadisticas.py en cada cambio de Nota
+class ResumenAlumnoMateria(db.Model):
+    alumno_id = db.Column(db.Integer, db.ForeignKey('alumno.id'), primary_key=True)
+    materia_id = db.Column(db.Integer, db.ForeignKey('materia.id'), primary_key=True)
+    ciclo = db.Column(db.Integer, nullable=False)
+    grado_id = db.Column(db.Integer, nullable=False)
+    suma = db.Column(db.Float, nullable=False)
+    bloques = db.Column(db.Integer, nullable=False)
+    promedio = db.Column(db.Float, nullable=False)
+
+    alumno = db.relationship('Alumno')
+
+    __table_args__ = (
+        db.Index('ix_resumen_alumno_ciclo_grado_materia', 'ciclo', 'grado_id', 'materia_id'),
+    )
+
+class ResumenGradoMateria(db.Model):
+    ciclo = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    grado_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    materia_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    alumnos = db.Column(db.Integer, nullable=False, default=0)
+    suma_promedios = db.Column(db.Float, nullable=False, default=0)
+    suma_cuadrados = db.Column(db.Float, nullable=False, default=0)
+    rango_0_59 = db.Column(db.Integer, nullable=False, default=0)
+    rango_60_69 = db.Column(db.Integer, nullable=False, default=0)
+    rango_70_79 = db.Column(db.Integer, nullable=False, default=0)
+    rango_80_89 = db.Column(db.Integer, nullable=False, default=0)
+    rango_90_100 = db.Column(db.Integer, nullable=False, default=0)
+
+# ================= IDEMPOTENCIA DE ENVÍOS =================
+# Una fila por envío de formulario o petición con Idempotency-Key
+class SolicitudProcesada(db.Model):
+    clave = db.Column(db.String(64), primary_key=True)
+    usuario_id = db.Column(db.Integer, nullable=False)
+    resultado = db.Column(db.Text, nullable=False, default="")
+    creado = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_solicitud_creado', 'creado'),
+    )
+
+# ================= VERSIONES DE DATOS =================
+# Contador por ámbito (p. ej. "alumnos:<grado_id>"), mantenido por versiones.py
+class VersionDatos(db.Model):
+    ambito = db.Column(db.String(120), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    actualizado = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+# ================= BOLETINES EMITIDOS =================
+# Una fila por versión de contenido: el código sale del hash de las notas y
+# volver a descargar el mismo boletín no agrega filas. Guarda una copia de
+# lo impreso y no tiene FK a alumno: la verificación sigue respondiendo
+# aunque el ciclo se archive.
+class BoletinEmitido(db.Model):
+    codigo = db.Column(db.String(16), primary_key=True)
+    alumno_id = db.Column(db.Integer, nullable=False, index=True)
+    ciclo = db.Column(db.Integer, nullable=False)
+    nombre = db.Column(db.String(100), nullable=False)
+    grado = db.Column(db.String(100), nullable=False)
+    promedios = db.Column(db.Text, nullable=False)  # JSON [[materia, promedio], ...]
+    emitido = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    reemplazado = db.Column(db.DateTime)
+
+# ================= ÍNDICES =================
+def crear_indices(conexion):
+    # create_all no agrega índices a tablas que ya existen
+    for tabla in db.metadata.sorted_tables:
+        for indice in tabla.indexes:
+            indice.create(conexion, checkfirst=True)
@@ -0,0 +1,233 @@
+from sqlalchemy import update, case, tuple_
+from sqlalchemy.orm import joinedload
+from models import db, Alumno, Nota, Asignacion, ciclo_activo
+from auditoria import registrar_auditoria
+from basedatos import insert_upsert
+from estadisticas import recalcular
+from cache_boletines import cache_boletines
+from idempotencia import completar
+import json
+import os
+
+BLOQUES = (1, 2, 3, 4)
+
+# ================= CONFLICTOS AL GUARDAR =================
+# Qué hacer si ya existe nota para (alumno, materia, bloque):
+#   rechazar     → se conserva la existente y se informa duplicado
+#   sobrescribir → gana el último envío
+#   maximo       → se conserva el puntaje más alto
+MODOS_CONFLICTO = ("rechazar", "sobrescribir", "maximo")
+NOTAS_CONFLICTO = os.environ.get("NOTAS_CONFLICTO", "rechazar")
+if NOTAS_CONFLICTO not in MODOS_CONFLICTO:
+    raise RuntimeError(f"NOTAS_CONFLICTO debe ser uno de {', '.join(MODOS_CONFLICTO)}")
+
+t_nota = Nota.__table__
+
+# ================= ASIGNACIÓN =================
+def asignacion_permitida(docente_id, materia_id):
+    return Asignacion.query.options(joinedload(Asignacion.materia)).filter_by(
+        ciclo=ciclo_activo(),
+        docente_id=docente_id,
+        materia_id=materia_id
+    ).first()
+
+
+def notas_de_materia(grado_id, materia_id):
+    # {(alumno_id, bloque): puntaje} de todo el grado en una consulta
+    notas = db.session.query(Nota.alumno_id, Nota.bloque, Nota.puntaje)\
+        .join(Alumno, Nota.alumno_id == Alumno.id)\
+        .filter(Alumno.ciclo == ciclo_activo(), Alumno.grado_id == grado_id, Nota.materia_id == materia_id)
+    return {(alumno_id, bloque): puntaje for alumno_id, bloque, puntaje in notas}
+
+# ================= ESCRITURA ATÓMICA (INSERT ... ON CONFLICT) =================
+def guardar_notas(filas, modo=None):
+    # filas: [{"alumno_id", "materia_id", "bloque", "puntaje"}] sin claves repetidas
+    # Devuelve {(alumno_id, materia_id, bloque)} de las filas escritas
+    modo = modo or NOTAS_CONFLICTO
+    conexion = db.session.connection()
+    sentencia = insert_upsert(conexion, t_nota)
+    unica = ["alumno_id", "materia_id", "bloque"]
+
+    if modo == "rechazar":
+        sentencia = sentencia.on_conflict_do_nothing(index_elements=unica)
+    elif modo == "sobrescribir":
+        sentencia = sentencia.on_conflict_do_update(
+            index_elements=unica,
+            set_={"puntaje": sentencia.excluded.puntaje, "version": t_nota.c.version + 1}
+        )
+    else:
+        sentencia = sentencia.on_conflict_do_update(
+            index_elements=unica,
+            set_={"puntaje": sentencia.excluded.puntaje, "version": t_nota.c.version + 1},
+            where=sentencia.excluded.puntaje > t_nota.c.puntaje
+        )
+
+    escritas = {
+        tuple(r) for r in conexion.execute(
+            sentencia.returning(t_nota.c.alumno_id, t_nota.c.materia_id, t_nota.c.bloque),
+            filas
+        )
+    }
+
+    # Core no pasa por los eventos after_flush del ORM
+    if escritas:
+        recalcular(conexion, {(alumno_id, materia_id) for alumno_id, materia_id, _ in escritas})
+        for alumno_id in {alumno_id for alumno_id, _, _ in escritas}:
+            cache_boletines.invalidar_alumno(alumno_id)
+    return escritas
+
+# ================= REGISTRO EN LOTE =================
+def validar_entrada(entrada):
+    try:
+        alumno_id = int(entrada["alumno_id"])
+        bloque = int(entrada["bloque"])
+        puntaje = float(entrada["puntaje"])
+    except (KeyError, TypeError, ValueError):
+        return None, "Datos incompletos o inválidos"
+
+    if bloque not in BLOQUES:
+        return None, "Bloque inválido"
+    if not 0 <= puntaje <= 100:
+        return None, "El puntaje debe estar entre 0 y 100"
+    return (alumno_id, bloque, puntaje), None
+
+
+def registrar_notas_lote(asignacion, entradas, usuario_id, modo=None, clave=None):
+    # entradas: [{"alumno_id", "bloque", "puntaje"}]
+    # Devuelve (guardadas, errores) con errores = [{"fila", "alumno_id", "error"}]
+    # clave: de idempotencia ya reservada; guarda el resultado con el commit
+    modo = modo or NOTAS_CONFLICTO
+    grado_id = asignacion.grado_id
+    materia_id = asignacion.materia_id
+
+    errores = []
+    validas = []
+    for fila, entrada in enumerate(entradas):
+        datos, error = validar_entrada(entrada)
+        if error:
+            errores.append({"fila": fila, "alumno_id": entrada.get("alumno_id"), "error": error})
+        else:
+            validas.append((fila, datos))
+
+    if not validas:
+        return 0, errores
+
+    # ================= ALUMNOS DEL GRADO (UNA CONSULTA) =================
+    ids = {alumno_id for _, (alumno_id, _, _) in validas}
+    alumnos = {
+        a.id: a for a in Alumno.query.filter(
+            Alumno.ciclo == asignacion.ciclo, Alumno.grado_id == grado_id, Alumno.id.in_(ids)
+        )
+    }
+
+    # ================= DUPLICADOS CONTRA uq_nota_unica (UNA CONSULTA) =================
+    # Solo informativo: la garantía la da ON CONFLICT al insertar
+    ocupadas = {
+        (n.alumno_id, n.bloque)
+        for n in Nota.query.filter(
+            Nota.alumno_id.in_(alumnos.keys()),
+            Nota.materia_id == materia_id
+        ).with_entities(Nota.alumno_id, Nota.bloque)
+    } if alumnos and modo == "rechazar" else set()
+
+    enviadas = set()
+    nuevas = []
+    for fila, (alumno_id, bloque, puntaje) in validas:
+        if alumno_id not in alumnos:
+            errores.append({"fila": fila, "alumno_id": alumno_id, "error": "Alumno no encontrado en ese grado"})
+            continue
+        if (alumno_id, bloque) in ocupadas or (alumno_id, bloque) in enviadas:
+            errores.append({"fila": fila, "alumno_id": alumno_id, "error": "Nota duplicada"})
+            continue
+
+        enviadas.add((alumno_id, bloque))
+        nuevas.append((fila, {"alumno_id": alumno_id, "materia_id": materia_id, "bloque": bloque, "puntaje": puntaje}))
+
+    if not nuevas:
+        return 0, errores
+
+    # ================= GUARDAR (UNA TRANSACCIÓN) =================
+    escritas = guardar_notas([datos for _, datos in nuevas], modo)
+
+    if modo == "rechazar":
+        # Perdió la carrera contra otro envío entre la consulta y el insert
+        for fila, datos in nuevas:
+            if (datos["alumno_id"], materia_id, datos["bloque"]) not in escritas:
+                errores.append({"fila": fila, "alumno_id": datos["alumno_id"], "error": "Nota duplicada"})
+
+    if escritas:
+        registrar_auditoria(
+            "CREAR_NOTAS_LOTE",
+            f"{len(escritas)} notas ({modo}) - {asignacion.materia.nombre} - {asignacion.grado.nombre}",
+            en_transaccion=True,
+            usuario_id=usuario_id
+        )
+    if clave:
+        completar(clave, json.dumps({"creadas": len(escritas), "errores": errores}))
+    db.session.commit()
+
+    return len(escritas), errores
+
+# ================= EDICIÓN (DIFERENCIAL, CONCURRENCIA OPTIMISTA) =================
+def diferencias(notas, formulario):
+    # Devuelve ([(nota, nuevo_puntaje, version_del_formulario)], error)
+    # solo con las notas que el docente modificó: se compara contra el
+    # puntaje que mostró el formulario (original_<id>), no contra el actual
+    # en la base, para no reenviar como cambio una nota que otro editó
+    cambios = []
+    for nota in notas:
+        valor = formulario.get(f"puntaje_{nota.id}")
+        if not valor:
+            continue
+        try:
+            nuevo = float(valor)
+            version = int(formulario.get(f"version_{nota.id}", nota.version))
+            original = float(formulario.get(f"original_{nota.id}", nota.puntaje))
+        except ValueError:
+            return None, "Datos incompletos o inválidos"
+        if not 0 <= nuevo <= 100:
+            return None, "El puntaje debe estar entre 0 y 100"
+        if nuevo != original:
+            cambios.append((nota, nuevo, version))
+    return cambios, None
+
+
+def aplicar_cambios(cambios):
+    # Un solo UPDATE; cada fila se modifica solo si conserva la versión que
+    # vio el formulario. False si otra edición se adelantó: el llamador
+    # hace rollback y no queda nada aplicado.
+    conexion = db.session.connection()
+    resultado = conexion.execute(
+        update(t_nota)
+        .where(tuple_(t_nota.c.id, t_nota.c.version).in_([(n.id, v) for n, _, v in cambios]))
+        .values(
+            puntaje=case({n.id: nuevo for n, nuevo, _ in cambios}, value=t_nota.c.id),
+            version=t_nota.c.version + 1
+        )
+    )
+    if resultado.rowcount != len(cambios):
+        return False
+
+    # Core no pasa por los eventos after_flush del ORM
+    recalcular(conexion, {(n.alumno_id, n.materia_id) for n, _, _ in cambios})
+    for alumno_id in {n.alumno_id for n, _, _ in cambios}:
+        cache_boletines.invalidar_alumno(alumno_id)
+    return True
+
+
+def describir_cambios(prefijo, cambios, limite=200):
+    # Descripciones de auditoría de hasta `limite` caracteres
+    partes = [
+        f"{n.materia.nombre} B{n.bloque}: {n.puntaje:g}→{nuevo:g}"
+        for n, nuevo, _ in cambios
+    ]
+    descripciones = []
+    actual = prefijo
+    for parte in partes:
+        if actual != prefijo and len(actual) + len(parte) + 2 > limite:
+            descripciones.append(actual)
+            actual = prefijo
+        actual += (" " if actual == prefijo else "; ") + parte
+    if actual != prefijo:
+        descripciones.append(actual)
+    return descripciones
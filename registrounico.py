@@ -1,16 +1,8 @@
-from app import app, db, Usuario
+# Equivale a `flask --app app init-bd`: crea el esquema, el administrador
+# (ADMIN_EMAIL / ADMIN_PASSWORD) y las materias iniciales.
+from app import app
+from inicializacion import inicializar_bd
 
-with app.app_context():  # Esto es crucial
-    db.create_all()
-    if not Usuario.query.filter_by(correo="admin@colegio.com").first():
-        admin = Usuario(
-            nombre="Administrador",
-            correo="admin@colegio.com",
-            rol="admin"
-        )
-        admin.set_password("admin123")
-        db.session.add(admin)
-        db.session.commit()
-        print("Administrador creado ✅")
-    else:
-        print("El administrador ya existe")
+with app.app_context():
+    inicializar_bd()
+    print("Base de datos lista ✅")
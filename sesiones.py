@@ -0,0 +1,76 @@
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from models import Usuario
+import threading
+import time
+import os
+
+# ================= CACHE DE USUARIOS DE SESIÓN =================
+# load_user corre en cada petición autenticada (incluido el AJAX). Se guarda
+# una copia de solo lectura del usuario, sin el hash de la contraseña, por
+# SESION_CACHE_TTL segundos.
+SESION_CACHE_TTL = float(os.environ.get("SESION_CACHE_TTL", 60))
+
+
+class UsuarioSesion(UserMixin):
+    def __init__(self, id, nombre, correo, rol):
+        self.id = id
+        self.nombre = nombre
+        self.correo = correo
+        self.rol = rol
+
+    @classmethod
+    def desde(cls, usuario):
+        return cls(usuario.id, usuario.nombre, usuario.correo, usuario.rol)
+
+
+class CacheUsuarios:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = {}
+        self._candado = threading.Lock()
+
+    def obtener(self, usuario_id, cargar):
+        ahora = time.monotonic()
+        with self._candado:
+            entrada = self._entradas.get(usuario_id)
+            if entrada and entrada[0] > ahora:
+                self.aciertos += 1
+                return entrada[1]
+            self.fallos += 1
+
+        usuario = cargar(usuario_id)
+        if usuario is not None:
+            with self._candado:
+                self._entradas[usuario_id] = (ahora + self.ttl, usuario)
+        return usuario
+
+    def invalidar(self, usuario_id):
+        with self._candado:
+            self._entradas.pop(usuario_id, None)
+
+    def limpiar(self):
+        with self._candado:
+            self._entradas.clear()
+
+    def estadisticas(self):
+        total = self.aciertos + self.fallos
+        return {
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": round(self.aciertos / total, 4) if total else 0.0,
+            "entradas": len(self._entradas),
+        }
+
+
+cache_usuarios = CacheUsuarios(SESION_CACHE_TTL)
+
+# ================= INVALIDACIÓN AUTOMÁTICA =================
+@event.listens_for(Session, "after_flush")
+def _invalidar_usuarios(sesion, contexto):
+    for obj in list(sesion.new) + list(sesion.dirty) + list(sesion.deleted):
+        if isinstance(obj, Usuario) and obj.id is not None:
+            cache_usuarios.invalidar(obj.id)
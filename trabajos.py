@@ -0,0 +1,170 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import threading
+import sqlite3
+import uuid
+import os
+
+# ================= COLA DE TRABAJOS DE REPORTES =================
+# Tabla de trabajos en su propio archivo SQLite para no competir por el
+# bloqueo de escritura con la base de datos de calificaciones. Los archivos
+# generados van a disco (carpeta junto a la BD); la tabla guarda solo la ruta.
+TRABAJOS_WORKERS = int(os.environ.get("TRABAJOS_WORKERS", 2))
+TRABAJOS_RETENCION_HORAS = int(os.environ.get("TRABAJOS_RETENCION_HORAS", 24))
+TRABAJOS_ABANDONO_MINUTOS = 30
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS trabajo (
+    id TEXT PRIMARY KEY,
+    tipo TEXT NOT NULL,
+    descripcion TEXT NOT NULL,
+    usuario_id INTEGER,
+    estado TEXT NOT NULL,
+    hechos INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    nombre_archivo TEXT,
+    ruta_archivo TEXT,
+    error TEXT,
+    creado TEXT NOT NULL,
+    actualizado TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_trabajo_creado ON trabajo (creado);
+"""
+
+PENDIENTE = "pendiente"
+EN_PROCESO = "en_proceso"
+TERMINADO = "terminado"
+ERROR = "error"
+
+
+class ColaTrabajos:
+    def __init__(self, ruta_bd, carpeta_archivos, max_workers=TRABAJOS_WORKERS):
+        self.ruta_bd = ruta_bd
+        self.carpeta_archivos = carpeta_archivos
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="trabajo")
+        self._preparada = False
+        self._candado = threading.Lock()
+
+    def _preparar(self):
+        # Esquema y limpieza en el primer uso: importar la app no escribe en disco
+        if self._preparada:
+            return
+        with self._candado:
+            if self._preparada:
+                return
+            self._crear_esquema()
+            self._preparada = True
+
+    def _crear_esquema(self):
+        os.makedirs(self.carpeta_archivos, exist_ok=True)
+        with self._conectar() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(ESQUEMA)
+            # Tablas creadas cuando el ZIP se guardaba como BLOB
+            columnas = {fila["name"] for fila in conn.execute("PRAGMA table_info(trabajo)")}
+            if "ruta_archivo" not in columnas:
+                conn.execute("ALTER TABLE trabajo ADD COLUMN ruta_archivo TEXT")
+            # Trabajos que quedaron a medias por un reinicio (sin avance reciente;
+            # los de otros workers vivos siguen actualizándose)
+            limite = (datetime.utcnow() - timedelta(minutes=TRABAJOS_ABANDONO_MINUTOS)).isoformat()
+            conn.execute(
+                "UPDATE trabajo SET estado = ?, error = ? "
+                "WHERE estado IN (?, ?) AND actualizado < ?",
+                (ERROR, "Interrumpido por reinicio del servidor", PENDIENTE, EN_PROCESO, limite)
+            )
+
+    @contextmanager
+    def _conectar(self):
+        conn = sqlite3.connect(self.ruta_bd, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _actualizar(self, trabajo_id, **campos):
+        campos["actualizado"] = datetime.utcnow().isoformat()
+        columnas = ", ".join(f"{c} = ?" for c in campos)
+        with self._conectar() as conn:
+            conn.execute(
+                f"UPDATE trabajo SET {columnas} WHERE id = ?",
+                (*campos.values(), trabajo_id)
+            )
+
+    # ================= ENCOLAR =================
+    def encolar(self, tipo, descripcion, usuario_id, funcion, *args):
+        # funcion(avance, destino, *args) -> nombre_archivo; escribe en destino
+        self.purgar()
+
+        trabajo_id = uuid.uuid4().hex
+        destino = os.path.join(self.carpeta_archivos, trabajo_id)
+        ahora = datetime.utcnow().isoformat()
+        with self._conectar() as conn:
+            conn.execute(
+                "INSERT INTO trabajo (id, tipo, descripcion, usuario_id, estado, ruta_archivo, creado, actualizado) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (trabajo_id, tipo, descripcion, usuario_id, PENDIENTE, destino, ahora, ahora)
+            )
+
+        self._pool.submit(self._ejecutar, trabajo_id, destino, funcion, args)
+        return trabajo_id
+
+    def _ejecutar(self, trabajo_id, destino, funcion, args):
+        self._actualizar(trabajo_id, estado=EN_PROCESO)
+
+        def avance(hechos, total):
+            self._actualizar(trabajo_id, hechos=hechos, total=total)
+
+        try:
+            nombre_archivo = funcion(avance, destino, *args)
+        except Exception as e:
+            _borrar(destino)
+            self._actualizar(trabajo_id, estado=ERROR, error=str(e)[:500])
+            return
+
+        self._actualizar(trabajo_id, estado=TERMINADO, nombre_archivo=nombre_archivo)
+
+    # ================= CONSULTAS =================
+    def estado(self, trabajo_id):
+        self._preparar()
+        with self._conectar() as conn:
+            fila = conn.execute(
+                "SELECT id, tipo, descripcion, usuario_id, estado, hechos, total, "
+                "nombre_archivo, error, creado, actualizado FROM trabajo WHERE id = ?",
+                (trabajo_id,)
+            ).fetchone()
+        return dict(fila) if fila else None
+
+    def artefacto(self, trabajo_id):
+        # (nombre_archivo, ruta) del archivo terminado, o None
+        self._preparar()
+        with self._conectar() as conn:
+            fila = conn.execute(
+                "SELECT nombre_archivo, ruta_archivo FROM trabajo WHERE id = ? AND estado = ?",
+                (trabajo_id, TERMINADO)
+            ).fetchone()
+        if not fila or not fila["ruta_archivo"] or not os.path.exists(fila["ruta_archivo"]):
+            return None
+        return fila["nombre_archivo"], fila["ruta_archivo"]
+
+    def purgar(self):
+        self._preparar()
+        limite = (datetime.utcnow() - timedelta(hours=TRABAJOS_RETENCION_HORAS)).isoformat()
+        with self._conectar() as conn:
+            filas = conn.execute(
+                "SELECT id, ruta_archivo FROM trabajo WHERE creado < ? AND estado IN (?, ?)",
+                (limite, TERMINADO, ERROR)
+            ).fetchall()
+            for fila in filas:
+                if fila["ruta_archivo"]:
+                    _borrar(fila["ruta_archivo"])
+            conn.executemany("DELETE FROM trabajo WHERE id = ?", [(fila["id"],) for fila in filas])
+
+
+def _borrar(ruta):
+    try:
+        os.remove(ruta)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,146 @@
+from sqlalchemy import select, update, tuple_
+from collections import OrderedDict
+from models import db, BoletinEmitido
+from basedatos import insert_upsert
+from generar_boletin import codigo_verificacion, promedios_boletin
+from credenciales import Limitador
+from datetime import datetime
+import threading
+import json
+import time
+import os
+
+# ================= CONFIGURACIÓN =================
+VERIFICACION_MAX_AGE = int(os.environ.get("VERIFICACION_MAX_AGE", 300))
+VERIFICACION_CACHE_TTL = float(os.environ.get("VERIFICACION_CACHE_TTL", 60))
+VERIFICACION_CACHE_MAX = int(os.environ.get("VERIFICACION_CACHE_MAX", 10000))
+VERIFICACION_FALLOS_IP = int(os.environ.get("VERIFICACION_FALLOS_IP", 30))
+VERIFICACION_VENTANA = int(os.environ.get("VERIFICACION_VENTANA", 900))
+LOTE_REGISTRO = 500
+
+t_boletin = BoletinEmitido.__table__
+
+# ================= REGISTRO AL EMITIR =================
+# boletines: [(AlumnoDatos, [NotaDatos])] como los usa exportacion.py.
+# Volver a descargar un boletín sin cambios es solo una lectura por PK.
+# No hace commit.
+def registrar(boletines):
+    conexion = db.session.connection()
+    ahora = datetime.utcnow()
+    for inicio in range(0, len(boletines), LOTE_REGISTRO):
+        lote = {codigo_verificacion(a, n): (a, n) for a, n in boletines[inicio:inicio + LOTE_REGISTRO]}
+        existentes = dict(conexion.execute(
+            select(t_boletin.c.codigo, t_boletin.c.reemplazado).where(t_boletin.c.codigo.in_(list(lote)))
+        ).all())
+
+        nuevos = [c for c in lote if c not in existentes]
+        # Una versión anterior que vuelve a estar vigente (nota corregida y revertida)
+        revividos = [c for c, reemplazado in existentes.items() if reemplazado is not None]
+        if not nuevos and not revividos:
+            continue
+
+        if nuevos:
+            conexion.execute(
+                insert_upsert(conexion, t_boletin).on_conflict_do_nothing(index_elements=["codigo"]),
+                [_fila(codigo, *lote[codigo], ahora) for codigo in nuevos]
+            )
+        if revividos:
+            conexion.execute(update(t_boletin).where(t_boletin.c.codigo.in_(revividos)).values(reemplazado=None))
+
+        # Las demás versiones de esos alumnos dejan de ser las vigentes.
+        # Por (ciclo, alumno_id): al archivar un ciclo se borran sus alumnos
+        # y SQLite puede reutilizar el id para un alumno de otro ciclo.
+        vigentes = nuevos + revividos
+        conexion.execute(
+            update(t_boletin)
+            .where(
+                tuple_(t_boletin.c.ciclo, t_boletin.c.alumno_id).in_(
+                    [(lote[c][0].ciclo, lote[c][0].id) for c in vigentes]
+                ),
+                t_boletin.c.codigo.notin_(vigentes),
+                t_boletin.c.reemplazado.is_(None)
+            )
+            .values(reemplazado=ahora)
+        )
+
+
+def _fila(codigo, alumno, notas, ahora):
+    return {
+        "codigo": codigo,
+        "alumno_id": alumno.id,
+        "ciclo": alumno.ciclo,
+        "nombre": alumno.nombre,
+        "grado": alumno.grado,
+        "promedios": json.dumps(promedios_boletin(notas), ensure_ascii=False),
+        "emitido": ahora,
+    }
+
+# ================= CONSULTA PÚBLICA =================
+def normalizar(codigo):
+    # Acepta el código como se imprime (ABCD-EFGH-IJKL), con espacios o en minúsculas
+    return "".join(c for c in (codigo or "").upper() if c.isalnum())[:16]
+
+
+class CacheVerificaciones:
+    # Por proceso y con TTL: el día de entrega de boletines los mismos
+    # códigos se consultan muchas veces. Solo se guardan códigos existentes.
+    def __init__(self, ttl, maximo):
+        self.ttl = ttl
+        self.maximo = maximo
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = OrderedDict()
+        self._candado = threading.Lock()
+
+    def obtener(self, codigo, cargar):
+        ahora = time.monotonic()
+        with self._candado:
+            entrada = self._entradas.get(codigo)
+            if entrada and entrada[0] > ahora:
+                self._entradas.move_to_end(codigo)
+                self.aciertos += 1
+                return entrada[1]
+            self.fallos += 1
+
+        datos = cargar(codigo)
+        if datos is not None:
+            with self._candado:
+                self._entradas[codigo] = (ahora + self.ttl, datos)
+                self._entradas.move_to_end(codigo)
+                while len(self._entradas) > self.maximo:
+                    self._entradas.popitem(last=False)
+        return datos
+
+    def estadisticas(self):
+        total = self.aciertos + self.fallos
+        return {
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": round(self.aciertos / total, 4) if total else 0.0,
+            "entradas": len(self._entradas),
+        }
+
+
+cache_verificaciones = CacheVerificaciones(VERIFICACION_CACHE_TTL, VERIFICACION_CACHE_MAX)
+# Solo cuentan los códigos inexistentes: frena a quien prueba códigos al azar
+limitador_verificaciones = Limitador(VERIFICACION_FALLOS_IP, VERIFICACION_VENTANA)
+
+
+def _cargar(codigo):
+    fila = db.session.execute(select(t_boletin).where(t_boletin.c.codigo == codigo)).first()
+    if fila is None:
+        return None
+    datos = fila._asdict()
+    datos["promedios"] = json.loads(datos["promedios"])
+    return datos
+
+
+def verificar(codigo, ip):
+    # (datos, error): error es "bloqueado" o "no_encontrado"
+    if limitador_verificaciones.espera(ip):
+        return None, "bloqueado"
+    datos = cache_verificaciones.obtener(codigo, _cargar) if codigo else None
+    if datos is None:
+        limitador_verificaciones.fallo(ip)
+        return None, "no_encontrado"
+    return datos, None
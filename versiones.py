@@ -0,0 +1,67 @@
+from sqlalchemy import event, select, inspect
+from sqlalchemy.orm import Session
+from models import db, Usuario, Alumno, Materia, Asignacion, VersionDatos
+from basedatos import insert_upsert
+from datetime import datetime
+
+t_version = VersionDatos.__table__
+
+# ================= ÁMBITOS =================
+# La versión sube en la misma transacción que el cambio, así sirve como
+# validador HTTP (ETag / Last-Modified) sin recorrer los datos.
+def ambito_alumnos(grado_id):
+    return f"alumnos:{grado_id}"
+
+
+def ambito_asignaciones(docente_id):
+    return f"asignaciones:{docente_id}"
+
+
+# Una versión por tabla para los fragmentos HTML cacheados (cache_fragmentos.py)
+MODELOS_VERSIONADOS = (Usuario, Alumno, Materia, Asignacion)
+
+
+def ambito_tabla(tabla):
+    return f"tabla:{tabla}"
+
+# ================= ESCRITURA =================
+def incrementar(conexion, ambitos):
+    ahora = datetime.utcnow()
+    sentencia = insert_upsert(conexion, t_version)
+    sentencia = sentencia.on_conflict_do_update(
+        index_elements=["ambito"],
+        set_={"version": t_version.c.version + 1, "actualizado": sentencia.excluded.actualizado}
+    )
+    # Orden fijo para que dos transacciones no se bloqueen en cruz
+    conexion.execute(sentencia, [
+        {"ambito": ambito, "version": 1, "actualizado": ahora}
+        for ambito in sorted(set(ambitos))
+    ])
+
+
+def _valores_de(obj, atributo):
+    historial = getattr(inspect(obj).attrs, atributo).history
+    return {getattr(obj, atributo), *historial.deleted}
+
+
+@event.listens_for(Session, "after_flush")
+def _incrementar_versiones(sesion, contexto):
+    ambitos = set()
+    for obj in list(sesion.new) + list(sesion.dirty) + list(sesion.deleted):
+        if isinstance(obj, Alumno):
+            ambitos |= {ambito_alumnos(g) for g in _valores_de(obj, "grado_id")}
+        elif isinstance(obj, Asignacion):
+            ambitos |= {ambito_asignaciones(d) for d in _valores_de(obj, "docente_id")}
+        if isinstance(obj, MODELOS_VERSIONADOS):
+            ambitos.add(ambito_tabla(obj.__tablename__))
+    if ambitos:
+        incrementar(sesion.connection(), ambitos)
+
+# ================= LECTURA =================
+def versiones(ambitos):
+    # {ambito: (version, actualizado)}; los ámbitos sin cambios no aparecen
+    filas = db.session.execute(
+        select(t_version.c.ambito, t_version.c.version, t_version.c.actualizado)
+        .where(t_version.c.ambito.in_(list(ambitos)))
+    )
+    return {ambito: (version, actualizado) for ambito, version, actualizado in filas}